@@ -0,0 +1,128 @@
+"""
+Test utility that runs script entry points against an in-process fake
+engine and fails when they make more API calls than their budget allows.
+
+A budget is a function of the inventory size N, so a workflow that makes a
+constant number of calls, or one call per object, passes at every size
+while a call-per-pair pattern is caught as N grows. The session is logged
+in before counting starts, so budgets cover the workflow's own calls.
+    E.g.:
+    class ListTests(ApiBudgetTestCase):
+        def test_list_databases(self):
+            self.assertWithinBudget(
+                lambda dlpx_obj, _: dx_operations.list_databases(dlpx_obj),
+                lambda num_vdbs: 5)
+"""
+
+import unittest
+
+from delphixpy.v1_8_0.web.service import time as time_service
+
+from fake_engine import FakeEngineServer
+from lib.DxCache import invalidate_cache
+from lib.GetSession import GetSession
+
+VERSION = 'v.0.0.001'
+
+#Inventory sizes every budget is checked at
+DEFAULT_SIZES = [10, 40]
+
+
+class ApiCallCounter(object):
+    """
+    Context manager counting the API calls a fake engine serves inside the
+    with block
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.start_counts = {}
+        self.counts = {}
+
+
+    def __enter__(self):
+        self.start_counts = dict(self.server.state.request_counts)
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_counts = dict(self.server.state.request_counts)
+        self.counts = dict((endpoint, count -
+                            self.start_counts.get(endpoint, 0))
+                           for endpoint, count in end_counts.items()
+                           if count != self.start_counts.get(endpoint, 0))
+
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+
+class ApiBudgetTestCase(unittest.TestCase):
+    """
+    TestCase that runs workflows against fake engines of several sizes
+    """
+
+    sizes = DEFAULT_SIZES
+
+    #Passed to FakeEngineServer for every size
+    server_options = {'job_duration': 0.1, 'groups': 2, 'snapshots': 2}
+
+
+    def start_engine(self, num_vdbs):
+        """
+        Start a fake engine with num_vdbs VDBs, one dSource per ten VDBs and
+        num_vdbs bookmarks, and return a GetSession logged in to it.
+        """
+
+        server = FakeEngineServer(port=0, dsources=max(num_vdbs / 10, 1),
+                                  vdbs=num_vdbs, bookmarks=num_vdbs,
+                                  **self.server_options)
+        server.start()
+        self.addCleanup(server.stop)
+
+        dlpx_obj = GetSession()
+        dlpx_obj.dlpx_engines['fake_engine'] = {
+            'hostname': 'fake_engine', 'ip_address': server.address,
+            'username': 'delphix_admin', 'password': 'delphix'}
+        dlpx_obj.engine_session('fake_engine')
+
+        #delphixpy logs in on the first request, so make one here instead of
+        # counting the login against the workflow.
+        time_service.get(dlpx_obj.server_session)
+
+        #Ports are reused between runs, so drop anything cached for an
+        # earlier engine on the same address.
+        invalidate_cache(dlpx_obj.server_session)
+        return server, dlpx_obj
+
+
+    def assertWithinBudget(self, workflow, budget, setup=None):
+        """
+        Run workflow at every inventory size and fail if it makes more API
+        calls than budget(N).
+
+        workflow: Callable taking the GetSession and the setup result
+        budget: Callable returning the maximum number of calls for N VDBs
+        setup: Optional callable run with the GetSession before counting
+               starts. Its result is passed to workflow.
+        :return: Dictionary of N to the ApiCallCounter of that run
+        """
+
+        counters = {}
+        for num_vdbs in self.sizes:
+            server, dlpx_obj = self.start_engine(num_vdbs)
+            setup_result = setup(dlpx_obj) if setup else None
+
+            with ApiCallCounter(server) as counter:
+                workflow(dlpx_obj, setup_result)
+
+            counters[num_vdbs] = counter
+            self.assertLessEqual(
+                counter.total, budget(num_vdbs),
+                '{} made {} API calls with N={}, budget is {}:\n{}'.format(
+                    getattr(workflow, '__name__', 'workflow'), counter.total,
+                    num_vdbs, budget(num_vdbs), '\n'.join(
+                        '  {}: {}'.format(endpoint, count) for
+                        endpoint, count in sorted(counter.counts.items()))))
+        return counters
@@ -12,12 +12,14 @@ Usage:
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   dx_authorization.py -h | --help | -v | --version
 List, delete and create authentication objects
 
 Examples:
   dx_authorization.py --engine landsharkengine --create --role Data --user dev_user --target_type database --target test_vdb
   dx_authorization.py --engine landsharkengine --create --role Data --user dev_user --target_type group --target Sources
+  dx_authorization.py --engine landsharkengine --create --role Data --user dev_user --target_type database --target test_vdb,test_vdb2
   dx_authorization.py --list
   dx_authorization.py --delete --role Data --user dev_user --target_type database --target test_vdb
 
@@ -25,7 +27,9 @@ Options:
   --create                  Create an authorization
   --role <name>             Role for authorization. Valid Roles are Data,
                              Read, Jet Stream User, OWNER, PROVISIONER
-  --target <name>           Target object for authorization
+  --target <name>           Target object for authorization. Multiple
+                             targets of one type can be given as a comma
+                             separated list
   --target_type <name>      Target type. Valid target types are snapshot,
                              group, database
   --user <name>             User for the authorization
@@ -37,6 +41,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -45,35 +54,47 @@ Options:
   -v --version              Show version.
 """
 
-VERSION = 'v.0.0.015'
+VERSION = 'v.0.0.016'
 
 from docopt import docopt
 from os.path import basename
 import sys
-from time import sleep, time
+from time import time
 import traceback
 
 from delphixpy.v1_8_0.exceptions import JobError
 from delphixpy.v1_8_0.exceptions import RequestError
 from delphixpy.v1_8_0.exceptions import HttpError
 from delphixpy.v1_8_0.web import database
-from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web import role
 from delphixpy.v1_8_0.web import authorization
 from delphixpy.v1_8_0.web import user
 from delphixpy.v1_8_0.web import snapshot
 from delphixpy.v1_8_0.web import group
-from delphixpy.v1_8_0.web.vo import User
 from delphixpy.v1_8_0.web.vo import Authorization
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import get_index
+from lib.DxCache import invalidate_cache
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.GetReferences import find_obj_by_name
+from lib.GetReferences import resolve_names
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_info
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_exception
 
+#Classes of the objects an authorization can refer to, by the ending of
+# the type in their reference. Other references are databases.
+AUTH_REF_CLASSES = [('USER', user), ('GROUP', group), ('ROLE', role),
+                    ('SNAPSHOT', snapshot)]
+
 
 def create_authorization(dlpx_obj, role_name, target_type, target_name,
                          user_name):
@@ -84,22 +105,27 @@ def create_authorization(dlpx_obj, role_name, target_type, target_name,
     :type dlpx_obj: lib.GetSession.GetSession
     :param role_name: Name of the role
     :param target_type: Supports snapshot, group and database target types
-    :param target_name: Name of the target
+    :param target_name: Name of the target, or a comma separated list of
+    targets
     :param user_name: User for the authorization
     """
 
-    authorization_obj = Authorization()
     print_debug('Searching for {}, {} and {} references.\n'.format(
                 role_name, target_name, user_name))
     try:
-        authorization_obj.role = find_obj_by_name(dlpx_obj.server_session, role,
+        role_ref = find_obj_by_name(dlpx_obj.server_session, role,
                                     role_name).reference
-        authorization_obj.target = find_target_type(dlpx_obj, target_type,
-                                      target_name).reference
-        authorization_obj.user = find_obj_by_name(dlpx_obj.server_session, user,
+        user_ref = find_obj_by_name(dlpx_obj.server_session, user,
                                     user_name).reference
-        authorization.create(dlpx_obj.server_session, authorization_obj)
-    except (RequestError, HttpError, JobError) as e:
+        target_refs = find_target_refs(dlpx_obj, target_type, target_name)
+        for target in target_name.split(','):
+            authorization_obj = Authorization()
+            authorization_obj.role = role_ref
+            authorization_obj.target = target_refs[target]
+            authorization_obj.user = user_ref
+            authorization.create(dlpx_obj.server_session, authorization_obj)
+        invalidate_cache(dlpx_obj.server_session, authorization)
+    except (DlpxException, RequestError, HttpError, JobError) as e:
         print_exception('An error occurred while creating authorization:\n'
                         '{}'.format(e))
     print 'Authorization successfully created for {}.'.format(user_name)
@@ -116,121 +142,129 @@ def delete_authorization(dlpx_obj, role_name, target_type, target_name,
     :type role_name: basestring
     :param target_type: Supports snapshot, group and database target types
     :type target_type basestring
-    :param target_name: Name of the target
+    :param target_name: Name of the target, or a comma separated list of
+    targets
     :type target_name: basestring
     :param user_name: User for the authorization
     :type user_name: basestring
     """
-    target_obj = find_target_type(dlpx_obj, target_type, target_name)
-    user_obj = find_obj_by_name(dlpx_obj.server_session, user,
-                                user_name)
-    role_obj = find_obj_by_name(dlpx_obj.server_session, role,
-                                role_name)
-    auth_objs = authorization.get_all(dlpx_obj.server_session)
 
     try:
+        target_refs = find_target_refs(dlpx_obj, target_type, target_name)
+        user_obj = find_obj_by_name(dlpx_obj.server_session, user,
+                                    user_name)
+        role_obj = find_obj_by_name(dlpx_obj.server_session, role,
+                                    role_name)
+        auth_objs = authorization.get_all(dlpx_obj.server_session)
 
-        del_auth_str = '({}, {}, {})'.format(user_obj.reference,
-                                             role_obj.reference,
-                                             target_obj.reference)
+        del_auth_strs = ['({}, {}, {})'.format(user_obj.reference,
+                                               role_obj.reference,
+                                               target_ref)
+                         for target_ref in target_refs.values()]
         for auth_obj in auth_objs:
-            if auth_obj.name == del_auth_str:
+            if auth_obj.name in del_auth_strs:
                 authorization.delete(dlpx_obj.server_session,
                                      auth_obj.reference)
-    except DlpxException as e:
+        invalidate_cache(dlpx_obj.server_session, authorization)
+    except (DlpxException, RequestError, HttpError) as e:
         print_exception('ERROR: Could not delete authorization:\n{}'.format(e))
     print '{} for user {} was deleted successfully'.format(target_name,
                                                            user_name)
 
 
-def find_target_type(dlpx_obj, target_type, target_name):
+def find_target_refs(dlpx_obj, target_type, target_name):
     """
-    Function to find the target authorization
+    Function to find the references of the authorization targets. All
+    targets are resolved with a single fetch of the target type.
 
     :param dlpx_obj: Virtualization Engine session object
     :type dlpx_obj: lib.GetSession.GetSession
     :param target_type: Type of target for authorization
-    :param target_name: Name of the target
+    :param target_name: Name of the target, or a comma separated list of
+    targets
+    :return: Dictionary of target name to reference
     """
 
-    target_obj = None
+    target_classes = {'group': group, 'database': database,
+                      'snapshot': snapshot}
     try:
-        if target_type.lower() == 'group':
-            target_obj = find_obj_by_name(dlpx_obj.server_session, group,
-                                          target_name)
-        elif target_type.lower() == 'database':
-            target_obj = find_obj_by_name(dlpx_obj.server_session, database,
-                                          target_name)
-        elif target_type.lower() == 'snapshot':
-            target_obj = find_obj_by_name(dlpx_obj.server_session, snapshot,
-                                          target_name)
-    except (DlpxException, RequestError, HttpError) as e:
-        print_exception('Could not find authorization target type '
-                        '{}:\n{}'.format(target_type, e))
-    return target_obj
+        target_class = target_classes[target_type.lower()]
+    except KeyError:
+        raise DlpxException('{} is not a valid target type. Valid target '
+                            'types are snapshot, group, database.\n'.format(
+                                target_type))
+    try:
+        return resolve_names(dlpx_obj.server_session, target_class,
+                             target_name.split(','))
+    except (RequestError, HttpError) as e:
+        raise DlpxException('Could not find authorization target type '
+                            '{}:\n{}'.format(target_type, e))
+
+
+def auth_object_name(engine, obj_ref, obj_names):
+    """
+    Return the name of the user, role, group or database an authorization
+    refers to. A reference missing from obj_names is fetched and added.
+
+    :param engine: A Delphix engine session object
+    :param obj_ref: Reference of the object
+    :type obj_ref: str
+    :param obj_names: Dictionary of reference to name
+    :type obj_names: dict
+    """
+
+    if obj_ref.startswith('DOMAIN'):
+        return 'DOMAIN'
+
+    try:
+        return obj_names[obj_ref]
+    except KeyError:
+        pass
+
+    f_class = database
+    for ref_type, ref_class in AUTH_REF_CLASSES:
+        if obj_ref.split('-')[0].endswith(ref_type):
+            f_class = ref_class
+            break
+
+    try:
+        obj_names[obj_ref] = f_class.get(engine, obj_ref).name
+    except (RequestError, HttpError) as e:
+        print_debug('Could not find {}: {}'.format(obj_ref, e))
+        obj_names[obj_ref] = obj_ref
+    return obj_names[obj_ref]
 
 
 def list_authorization(dlpx_obj):
     """
     Function to list authorizations for a given engine
 
+    Roles, users, groups and databases are downloaded once and the
+    authorizations are resolved from them.
+
     :param dlpx_obj: Virtualization Engine session object
     """
-    target_obj = None
+
+    engine = dlpx_obj.server_session
 
     try:
-        auth_objs = authorization.get_all(dlpx_obj.server_session)
+        obj_names = {}
+        for f_class in [role, user, group, database]:
+            for obj in get_index(engine, f_class).objects:
+                obj_names[obj.reference] = obj.name
+
         print_info('User, Role, Target, Reference')
-        for auth_obj in auth_objs:
-            role_obj = role.get(dlpx_obj.server_session, auth_obj.role)
-            user_obj = user.get(dlpx_obj.server_session, auth_obj.user)
-            if auth_obj.target.startswith('USER'):
-                target_obj = user.get(dlpx_obj.server_session, auth_obj.target)
-            elif auth_obj.target.startswith('GROUP'):
-                target_obj = group.get(dlpx_obj.server_session, auth_obj.target)
-            elif auth_obj.target.startswith('DOMAIN'):
-                target_obj = User()
-                target_obj.name = 'DOMAIN'
-            print '{}, {}, {}, {}'.format(user_obj.name, role_obj.name,
-                                               target_obj.name,
-                                               auth_obj.reference)
+        for auth_obj in authorization.get_all(engine):
+            print '{}, {}, {}, {}'.format(
+                auth_object_name(engine, auth_obj.user, obj_names),
+                auth_object_name(engine, auth_obj.role, obj_names),
+                auth_object_name(engine, auth_obj.target, obj_names),
+                auth_obj.reference)
     except (RequestError, HttpError, JobError, AttributeError) as e:
         print_exception('An error occurred while listing authorizations.:\n'
                         '{}\n'.format((e)))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine, dlpx_obj):
     """
@@ -256,6 +290,7 @@ def main_workflow(engine, dlpx_obj):
     thingstodo = ["thingtodo"]
     try:
         with dlpx_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dlpx_obj.server_session)
             while (len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0):
                 if len(thingstodo) > 0:
                     if arguments['--create']:
@@ -274,8 +309,7 @@ def main_workflow(engine, dlpx_obj):
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dlpx_obj.jobs.keys():
-                    job_obj = job.get(dlpx_obj.server_session,
-                                      dlpx_obj.jobs[j])
+                    job_obj = job_watcher.get(dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: : {}'.format(
                         engine['hostname'], job_obj.job_state))
@@ -292,7 +326,7 @@ def main_workflow(engine, dlpx_obj):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
     except (DlpxException, RequestError, JobError, HttpError) as e:
         print_exception('\nError in dx_authorization: {}\n{}'.format(
             engine['hostname'], e))
@@ -356,11 +390,9 @@ def run_job(dlpx_obj, config_file_path):
         # run the job against the engine
         threads.append(main_workflow(engine, dlpx_obj))
 
-    # For each thread in the list...
-    for each in threads:
-        # join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    # Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed(time_start):
@@ -386,6 +418,9 @@ def main():
         logging_est(arguments['--logdir'])
         print_debug(arguments)
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         # Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -11,12 +11,12 @@
 Usage:
   dx_delete_db.py (--group <name> [--name <name>] | --all_dbs )
                   [-d <identifier> | --engine <identifier> | --all]
-                  [--usebackup] [--debug] [--parallel <n>] [--poll <n>]
+                  [--usebackup] [--debug] [--parallel <n>] [--poll <n>] [--plan]
                   [--config <path_to_file>] [--logdir <path_to_file>]
   dx_delete_db.py (--host <name> [--group <name>] [--object_type <type>] 
                   | --object_type <name> [--group <name>] [--host <type>] )
                   [-d <identifier> | --engine <identifier> | --all]
-                  [--usebackup] [--debug] [--parallel <n>] [--poll <n>]
+                  [--usebackup] [--debug] [--parallel <n>] [--poll <n>] [--plan]
                   [--config <path_to_file>] [--logdir <path_to_file>]
   dx_delete_db.py -h | --help | -v | --version
 
@@ -27,6 +27,7 @@ Examples:
   dx_delete_db.py --name "Employee Oracle 11G DB"
   dx_delete_db.py --host LINUXSOURCE --parallel 2 --usebackup
   dx_delete_db.py --host LINUXSOURCE --parallel 4 --usebackup --debug -d landsharkengine
+  dx_delete_db.py --group "Test" --parallel 10 --plan
 
 
 
@@ -45,6 +46,10 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --plan                    Print the order the databases would be deleted
+                            in and exit without deleting anything. VDBs are
+                            always deleted before the database they were
+                            provisioned from.
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -66,8 +71,9 @@ import time
 import traceback
 import json
 
+from collections import deque
 from multiprocessing import Process
-from time import sleep, time
+from time import time
 
 from delphixpy.v1_6_0.delphix_engine import DelphixEngine
 from delphixpy.v1_6_0.exceptions import HttpError, JobError
@@ -75,6 +81,11 @@ from delphixpy.v1_6_0 import job_context
 from delphixpy.v1_6_0.web import database, environment, group, job, source, user
 from delphixpy.v1_6_0.web.vo import ASESpecificBackupSyncParameters, ASENewBackupSyncParameters, ASELatestBackupSyncParameters, MSSqlSyncParameters
 
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
+from lib.JobWatcher import JobWatcher
+
 
 def find_obj_by_name(engine, server, f_class, obj_name):
     """
@@ -124,6 +135,63 @@ def find_source_by_database(engine, server, database_obj):
         sys.exit(1)
     return source_obj
 
+def plan_deletion(databases, all_dbs):
+    """
+    Order databases for deletion so every VDB is deleted before the database
+    it was provisioned from.
+    databases: Database objects to delete
+    all_dbs: Every database object on the engine
+    Returns a tuple of the levels and the databases that cannot be deleted.
+    Each level is a list of databases whose children are all in earlier
+    levels. The databases that cannot be deleted are a dictionary of the
+    reason keyed by database object: a child of theirs is not being deleted.
+    """
+    selected = dict((db_obj.reference, db_obj) for db_obj in databases)
+    children = {}
+    for db_obj in all_dbs:
+        if db_obj.provision_container:
+            children.setdefault(db_obj.provision_container, []).append(db_obj)
+
+    #A database with a child that stays cannot be deleted, and neither can
+    # the databases it was provisioned from.
+    blocked = {}
+    for ref, db_obj in selected.items():
+        kept = [child.name for child in children.get(ref, []) if
+                child.reference not in selected]
+        if kept:
+            blocked[ref] = "VDBs provisioned from it are not being deleted: " + ", ".join(sorted(kept))
+    for ref in blocked.keys():
+        child_obj = selected[ref]
+        parent_ref = child_obj.provision_container
+        while parent_ref in selected and parent_ref not in blocked:
+            blocked[parent_ref] = child_obj.name + " cannot be deleted"
+            child_obj = selected[parent_ref]
+            parent_ref = child_obj.provision_container
+
+    levels = []
+    remaining = dict((ref, db_obj) for ref, db_obj in selected.items() if
+                     ref not in blocked)
+    while remaining:
+        level = [db_obj for ref, db_obj in remaining.items() if not
+                 [child for child in children.get(ref, []) if
+                  child.reference in remaining]]
+        levels.append(sorted(level, key=lambda db_obj: db_obj.name))
+        for db_obj in level:
+            del remaining[db_obj.reference]
+
+    return levels, dict((selected[ref], reason) for ref, reason in
+                        blocked.items())
+
+def print_plan(engine, levels, blocked):
+    """
+    Print the order plan_deletion returned
+    """
+    print_info(engine["hostname"] + ": Deletion plan, " + str(sum(len(level) for level in levels)) + " databases in " + str(len(levels)) + " levels")
+    for level_num, level in enumerate(levels, 1):
+        print_info(engine["hostname"] + ": Level " + str(level_num) + ": " + ", ".join(db_obj.name for db_obj in level))
+    for db_obj in sorted(blocked, key=lambda db_obj: db_obj.name):
+        print_warning(engine["hostname"] + ": " + db_obj.name + " will not be deleted. " + blocked[db_obj])
+
 def get_config(config_file_path):
     """
     This function reads in the dxtools.conf file
@@ -241,40 +309,6 @@ def set_exit_handler(func):
     """
     signal.signal(signal.SIGTERM, func)
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
 @run_async
 def main_workflow(engine):
     """
@@ -342,44 +376,72 @@ def main_workflow(engine):
     if not databases or len(databases) == 0:
         print_error("No databases found with the criterion specified")
         return
-    #reset the running job count before we begin
-    i = 0
+    #List every database and source once. Every database is needed to find
+    # the VDBs provisioned from the ones being deleted.
+    all_dbs = database.get_all(server, no_js_container_data_source=False)
+    source_map = {}
+    for source_obj in source.get_all(server):
+        source_map.setdefault(source_obj.container, []).append(source_obj)
+    deletable = []
+    for database_obj in databases:
+        db_source_objs = source_map.get(database_obj.reference, [])
+        #We'll just do a little sanity check here to ensure we only have a 1:1 result.
+        if len(db_source_objs) != 1:
+            print_error(engine["hostname"] + ": Did not find exactly one source for " + database_obj.name + ". Skipping")
+            continue
+        #If we applied the environment/server filter AND group filter, find the intersecting matches
+        if environment_obj != None and (arguments['--group']):
+            if db_source_objs[0].reference not in [env_source_obj.reference for env_source_obj in env_source_objs]:
+                print_error(engine["hostname"] + ": " + database_obj.name + " does not exist on " + host_name + ". Exiting")
+                return
+        if can_delete(engine, db_source_objs[0], database_obj, arguments['--object_type']):
+            deletable.append(database_obj)
+    levels, blocked = plan_deletion(deletable, all_dbs)
+    print_plan(engine, levels, blocked)
+    if arguments['--plan'] or not levels:
+        return
+    #Each database waits for the databases provisioned from it to be deleted.
+    to_delete = dict((db_obj.reference, db_obj) for level in levels for db_obj in level)
+    waiting_on = dict((ref, 0) for ref in to_delete)
+    for db_obj in to_delete.values():
+        if db_obj.provision_container in waiting_on:
+            waiting_on[db_obj.provision_container] += 1
+    ready = deque(levels[0])
+    finished = {}
+    deleted = []
     with job_mode(server):
+        job_watcher = JobWatcher(server)
         #While there are still running jobs or databases still to process....
-        while (len(jobs) > 0 or len(databases) > 0):
-            #While there are databases still to process and we are still under 
+        while (len(jobs) > 0 or len(ready) > 0):
+            #While there are databases ready to delete and we are still under 
             #the max simultaneous jobs threshold (if specified)
-            while len(databases) > 0 and (arguments['--parallel'] == None or i < int(arguments['--parallel'])):
-                #Give us the next database in the list, and remove it from the list
-                database_obj = databases.pop()
-                #Get the source of the database.
-                #The source tells us if the database is enabled/disables, virtual, vdb/dSource, or is a staging database.
-                source_obj = find_source_by_database(engine, server, database_obj)
-                #If we applied the environment/server filter AND group filter, find the intersecting matches
-                if environment_obj != None and (arguments['--group']):
-                    match = False
-                    for env_source_obj in env_source_objs:
-                        if source_obj[0].reference in env_source_obj.reference:
-                            match = True
-                            break
-                    if match == False:
-                        print_error(engine["hostname"] + ": " + database_obj.name + " does not exist on " + host_name + ". Exiting")
-                        return
-                #Snapshot the database
-                delete_job = delete_database(engine, server, jobs, source_obj[0], database_obj, arguments['--object_type'])
-                #If delete_job has any value, then we know that a job was initiated.
-                if delete_job:
-                    #increment the running job count
-                    i += 1
+            while len(ready) > 0 and (arguments['--parallel'] == None or len(jobs) < int(arguments['--parallel'])):
+                database_obj = ready.popleft()
+                delete_database(engine, server, jobs, source_map[database_obj.reference][0], database_obj)
             #Check to see if we are running at max parallel processes, and report if so.
-            if ( arguments['--parallel'] != None and i >= int(arguments['--parallel'])):
-                print_info(engine["hostname"] + ": Max jobs reached (" + str(i) + ")")
-            #reset the running jobs counter, as we are about to update the count from the jobs report.
-            i = update_jobs_dictionary(engine, server, jobs)
-            print_info(engine["hostname"] + ": " + str(i) + " jobs running. " + str(len(databases)) + " jobs waiting to run")
-            #If we have running jobs, pause before repeating the checks.
+            if ( arguments['--parallel'] != None and len(jobs) >= int(arguments['--parallel'])):
+                print_info(engine["hostname"] + ": Max jobs reached (" + str(len(jobs)) + ")")
+            i = update_jobs_dictionary(engine, job_watcher, jobs, finished)
+            #A database is ready once everything provisioned from it is gone.
+            for container_obj, job_state in finished.items():
+                if job_state == "COMPLETED":
+                    deleted.append(container_obj)
+                    parent_ref = container_obj.provision_container
+                    if parent_ref in waiting_on:
+                        waiting_on[parent_ref] -= 1
+                        if waiting_on[parent_ref] == 0:
+                            ready.append(to_delete[parent_ref])
+            finished.clear()
+            print_info(engine["hostname"] + ": " + str(i) + " jobs running. " + str(len(ready)) + " jobs waiting to run")
+            #If we have running jobs, wait for one of them to change before
+            #repeating the checks, so the next databases are released as soon
+            #as the ones provisioned from them are deleted.
             if len(jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
+    print_info(engine["hostname"] + ": Deleted " + str(len(deleted)) + " of " + str(len(to_delete)) + " databases")
+    not_deleted = [db_obj.name for db_obj in to_delete.values() if db_obj not in deleted]
+    if not_deleted:
+        print_error(engine["hostname"] + ": Not deleted: " + ", ".join(sorted(not_deleted)))
 
 def run_job(engine):
     """
@@ -427,35 +489,41 @@ def run_job(engine):
         #run the job against the engine
         threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
-def delete_database(engine, server, jobs, source_obj, container_obj, obj_type=None):
+def can_delete(engine, source_obj, container_obj, obj_type=None):
     """
-    This function 
-    FYI - Snapshot is also called sync
+    Return True if container_obj may be deleted, warning if it may not
     """
     #Sanity check to make sure our source object has a reference
-    if source_obj.reference != None :
-        #If we specified the --object_type flag, ensure this source is a match. Skip, if not.
-        if obj_type != None and ((obj_type.lower() == "vdb" and source_obj.virtual != True ) or (obj_type.lower() == "dsource" and source_obj.virtual != False )):
-            print_warning(engine["hostname"] + ": " + container_obj.name + " is not a " + obj_type.lower() + ". Skipping sync")
-        #Ensure this source is not a staging database. We can't act upon those.
-        elif source_obj.staging == True:
-            print_warning(engine["hostname"] + ": " + container_obj.name + " is a staging database. Skipping.")
-        #Ensure the source is enabled. We can't snapshot disabled databases.
-        else:
-            print_info(engine["hostname"] + ": Deleting " + container_obj.name )
-            print_debug(engine["hostname"] + ": Type: " + source_obj.type )
-            print_debug(engine["hostname"] + ": " +source_obj.type)
-            #Delete it
-            database.delete(server, container_obj.reference)
-            #Add the job into the jobs dictionary so we can track its progress
-            jobs[container_obj] = server.last_job
-            #return the job object to the calling statement so that we can tell if a job was created or not (will return None, if no job)
-            return server.last_job
+    if source_obj.reference == None :
+        return False
+    #If we specified the --object_type flag, ensure this source is a match. Skip, if not.
+    if obj_type != None and ((obj_type.lower() == "vdb" and source_obj.virtual != True ) or (obj_type.lower() == "dsource" and source_obj.virtual != False )):
+        print_warning(engine["hostname"] + ": " + container_obj.name + " is not a " + obj_type.lower() + ". Skipping delete")
+        return False
+    #Ensure this source is not a staging database. We can't act upon those.
+    elif source_obj.staging == True:
+        print_warning(engine["hostname"] + ": " + container_obj.name + " is a staging database. Skipping.")
+        return False
+    return True
+
+def delete_database(engine, server, jobs, source_obj, container_obj, obj_type=None):
+    """
+    This function deletes container_obj and adds its job to jobs
+    """
+    if can_delete(engine, source_obj, container_obj, obj_type):
+        print_info(engine["hostname"] + ": Deleting " + container_obj.name )
+        print_debug(engine["hostname"] + ": Type: " + source_obj.type )
+        #Delete it. last_job is cleared first so a stale job is never tracked.
+        server.last_job = None
+        database.delete(server, container_obj.reference)
+        #Add the job into the jobs dictionary so we can track its progress
+        jobs[container_obj] = server.last_job
+        #return the job object to the calling statement so that we can tell if a job was created or not (will return None, if no job)
+        return server.last_job
 
 def time_elapsed():
     """
@@ -465,21 +533,26 @@ def time_elapsed():
     elapsed_minutes = round((time() - time_start)/60, +1)
     return elapsed_minutes
 
-def update_jobs_dictionary(engine, server, jobs):
+def update_jobs_dictionary(engine, job_watcher, jobs, finished=None):
     """
     This function checks each job in the dictionary and updates its status or removes it if the job is complete.
+    Jobs are read through job_watcher, so only the jobs that changed are fetched again.
+    If finished is given, the end state of each completed job is added to it, keyed like jobs.
     Return the number of jobs still running.
     """
     #Establish the running jobs counter, as we are about to update the count from the jobs report.
     i = 0
     #get all the jobs, then inspect them
     for j in jobs.keys():
-        job_obj = job.get(server, jobs[j])
+        job_obj = job_watcher.get(jobs[j])
         print_debug(engine["hostname"] + ": " + str(job_obj))
         print_info(engine["hostname"] + ": " + j.name + ": " + job_obj.job_state)
         
         if job_obj.job_state in ["CANCELED", "COMPLETED", "FAILED"]:
             #If the job is in a non-running state, remove it from the running jobs list.
+            if finished is not None:
+                finished[j] = job_obj.job_state
+            job_watcher.forget(jobs[j])
             del jobs[j]
         else:
             #If the job is in a running state, increment the running job count.
@@ -509,6 +582,7 @@ def main(argv):
         database_name = arguments['--name']
         host_name = arguments['--host']
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
         #Parse the dxtools.conf and put it into a dictionary
         dxtools_objects = get_config(config_file_path)
         
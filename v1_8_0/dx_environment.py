@@ -14,10 +14,10 @@ Usage:
 --ip <address> [--toolkit <path_to_the_toolkit>] [--ase --ase_user <name> --ase_pw <name>] \
 |--update_ase_pw <name> --env_name <name> | --update_ase_user <name> --env_name <name> \
 | --delete <env_name> | --refresh <env_name> | --list)
-[--logdir <directory>][--debug] [--config <filename>] [--connector_name <name>]
+[--logdir <directory>][--debug] [--config <filename>] [--cache-ttl <n>] [--profile-api] [--connector_name <name>]
 [--pw <password>][--engine <identifier>][--all] [--poll <n>]
-  dx_environment.py (--update_host --old_host_address <name> --new_host_address <name>) [--logdir <directory>][--debug] [--config <filename>]
-  dx_environment.py ([--enable]|[--disable]) --env_name <name> [--logdir <directory>][--debug] [--config <filename>]
+  dx_environment.py (--update_host --old_host_address <name> --new_host_address <name>) [--logdir <directory>][--debug] [--config <filename>] [--cache-ttl <n>] [--profile-api]
+  dx_environment.py ([--enable]|[--disable]) --env_name <name> [--logdir <directory>][--debug] [--config <filename>] [--cache-ttl <n>] [--profile-api]
   dx_environment.py -h | --help | -v | --version
 
 Create a Delphix environment. (current support for standalone environments only)
@@ -56,6 +56,11 @@ Options:
 
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -76,13 +81,12 @@ from docopt import docopt
 from os.path import basename
 import sys
 import traceback
-from time import sleep, time
+from time import time
 
 from delphixpy.exceptions import HttpError
 from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
 from delphixpy.web import environment
-from delphixpy.web import job
 from delphixpy.web import host
 from delphixpy.web.vo import UnixHostEnvironment
 from delphixpy.web.vo import ASEHostEnvironmentParameters
@@ -92,6 +96,12 @@ from delphixpy.web.vo import WindowsHost
 from delphixpy.web.vo import UnixHost
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import invalidate_cache
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
 from lib.GetReferences import find_obj_by_name
 from lib.GetReferences import find_obj_name
@@ -188,9 +198,9 @@ def delete_env(engine, env_name):
                                  env_name)
 
     if env_obj:
-        environment.delete(dx_session_obj.server_session, env_obj.reference)
-        dx_session_obj.jobs[engine['hostname']] = \
-                                   dx_session_obj.server_session.last_job
+        dx_session_obj.job_tracker.submit(env_name, environment.delete,
+                                          env_obj.reference)
+        invalidate_cache(dx_session_obj.server_session, environment)
 
     elif env_obj is None:
         print('Environment was not found in the Engine: {}'.format(env_name))
@@ -209,9 +219,8 @@ def refresh_env(engine, env_name):
       env_list = find_all_objects(dx_session_obj.server_session, environment)
       for env_obj in env_list:
         try:
-          environment.refresh(dx_session_obj.server_session, env_obj.reference)
-          dx_session_obj.jobs[engine['hostname']] = \
-                                     dx_session_obj.server_session.last_job
+          dx_session_obj.job_tracker.submit(env_obj.name, environment.refresh,
+                                            env_obj.reference)
 
         except (DlpxException, RequestError) as e:
           print_exception('\nERROR: Refreshing the environment {} '
@@ -223,9 +232,8 @@ def refresh_env(engine, env_name):
           env_obj = find_obj_by_name(dx_session_obj.server_session, environment,
                                      env_name)
 
-          environment.refresh(dx_session_obj.server_session, env_obj.reference)
-          dx_session_obj.jobs[engine['hostname']] = \
-                                     dx_session_obj.server_session.last_job
+          dx_session_obj.job_tracker.submit(env_name, environment.refresh,
+                                            env_obj.reference)
 
       except (DlpxException, RequestError) as e:
           print_exception('\nERROR: Refreshing the environment {} '
@@ -330,10 +338,9 @@ def create_linux_env(engine, env_name, host_user, ip_addr, toolkit_path,
                             ' required with the --ase flag.\n')
 
     try:
-        environment.create(dx_session_obj.server_session,
-                           env_params_obj)
-        dx_session_obj.jobs[engine['hostname']] = \
-                                   dx_session_obj.server_session.last_job
+        dx_session_obj.job_tracker.submit(env_name, environment.create,
+                                          env_params_obj)
+        invalidate_cache(dx_session_obj.server_session, environment)
 
     except (DlpxException, RequestError, HttpError) as e:
         print('\nERROR: Encountered an exception while creating the '
@@ -387,51 +394,15 @@ def create_windows_env(engine, env_name, host_user, ip_addr,
         sys.exit(1)
 
     try:
-        environment.create(dx_session_obj.server_session,
-                           env_params_obj)
-        dx_session_obj.jobs[engine['hostname']] = \
-                                   dx_session_obj.server_session.last_job
+        dx_session_obj.job_tracker.submit(env_name, environment.create,
+                                          env_params_obj)
+        invalidate_cache(dx_session_obj.server_session, environment)
 
     except (DlpxException, RequestError, HttpError) as e:
         print('\nERROR: Encountered an exception while creating the '
               'environment:\n{}'.format(e))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine):
     """
@@ -454,9 +425,16 @@ def main_workflow(engine):
 
     thingstodo = ['thingtodo']
 
+    def report_job(tracked):
+        print_info('{}: Environment {}: {} in {:.1f} seconds'.format(
+                   engine['hostname'], tracked.target, tracked.job_state,
+                   tracked.duration))
+
     try:
         with dx_session_obj.job_mode(single_thread):
-            while (len(dx_session_obj.jobs) > 0 or len(thingstodo)> 0):
+            job_tracker = dx_session_obj.job_tracker
+            job_tracker.on_complete = report_job
+            while (len(job_tracker.running) > 0 or len(thingstodo)> 0):
                 if len(thingstodo)> 0:
 
                     if arguments['--type'] == 'linux' or arguments['--type'] == 'windows':
@@ -495,29 +473,15 @@ def main_workflow(engine):
 
                     thingstodo.pop()
 
-                #get all the jobs, then inspect them
-                i = 0
-                for j in dx_session_obj.jobs.keys():
-                    job_obj = job.get(dx_session_obj.server_session,
-                                      dx_session_obj.jobs[j])
-                    print_debug(job_obj,debug)
-                    print_info('{} Environment: {}'.format(
-                               engine['hostname'], job_obj.job_state))
-
-                    if job_obj.job_state in ["CANCELED", "COMPLETED", "FAILED"]:
-                    #If the job is in a non-running state, remove it from the
-                    # running jobs list.
-                        del dx_session_obj.jobs[j]
-                    else:
-                        #If the job is in a running state, increment the
-                        # running job count.
-                        i += 1
+                #Check the submitted jobs the notification channel reported
+                # a change for.
+                job_tracker.poll()
                 print_info('{}: {:d} jobs running.\n'.format(
-                           engine['hostname'], i))
+                           engine['hostname'], len(job_tracker.running)))
 
                 #If we have running jobs, pause before repeating the checks.
-                if len(dx_session_obj.jobs) > 0:
-                    sleep(float(arguments['--poll']))
+                if len(job_tracker.running) > 0:
+                    job_tracker.wait_for_change(float(arguments['--poll']))
 
     except (DlpxException, JobError) as e:
         print_exception('\nError while creating the environment {}:'
@@ -586,11 +550,9 @@ def run_job():
         #run the job against the engine
         threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -618,6 +580,9 @@ def main(argv):
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
 
         print_info('Welcome to %s version %s' % (basename(__file__),
                    VERSION))
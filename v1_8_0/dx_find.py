@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+#Description:
+# Search every Delphix engine in dxtools.conf for objects by name.
+# Engines are queried concurrently and matches are written as each engine
+# answers.
+#Requirements
+#pip install docopt delphixpy
+
+#The below doc follows the POSIX compliant standards and allows us to use
+#this doc to also define our arguments for the script.
+"""Find which Delphix engines hold an object
+Usage:
+  dx_find.py --name <name> [--type <type>] [--engine <identifier>]
+                  [--timeout <n>] [--format <type>]
+                  [--debug] [--parallel <n>]
+                  [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
+  dx_find.py -h | --help | -v | --version
+Find which Delphix engines hold an object
+
+Examples:
+  dx_find.py --name vdb_prod01
+  dx_find.py --name "*prod*" --type database,container
+  dx_find.py --name jsmith --type user --format csv
+  dx_find.py --name "nightly*" --type bookmark --timeout 10
+
+Options:
+  --name <name>             Name of the object. Shell wildcards are allowed
+                            and matching is case-insensitive.
+  --type <type>             Comma-separated list of object types to search:
+                            database, environment, container, bookmark and
+                            user. [default: all]
+  --engine <type>           Alt Identifier of Delphix engine in dxtools.conf.
+                            Default: search every engine
+  --timeout <n>             Seconds an engine may take to answer before it
+                            is reported as timed out. [default: 30]
+  --format <type>           Output format of the matches: text, csv or json.
+                            json writes one object per line. [default: text]
+  --debug                   Enable debug logging
+  --parallel <n>            Limit the number of engine queries running at
+                            the same time [default: 64]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
+  --config <path_to_file>   The path to the dxtools.conf file
+                            [default: ./dxtools.conf]
+  --logdir <path_to_file>    The path to the logfile you want to use.
+                            [default: ./dx_find.log]
+  -h --help                 Show this screen.
+  -v --version              Show version.
+"""
+
+VERSION = 'v.0.0.001'
+
+import csv
+import json
+import socket
+import sys
+import traceback
+from fnmatch import fnmatchcase
+from os.path import basename
+from Queue import Empty
+from Queue import Queue
+from time import time
+from docopt import docopt
+
+from delphixpy.v1_8_0.exceptions import HttpError
+from delphixpy.v1_8_0.exceptions import JobError
+from delphixpy.v1_8_0.exceptions import RequestError
+from delphixpy.v1_8_0.web import database
+from delphixpy.v1_8_0.web import environment
+from delphixpy.v1_8_0.web import user
+from delphixpy.v1_8_0.web.jetstream import bookmark
+from delphixpy.v1_8_0.web.jetstream import container
+
+from lib.DlpxException import DlpxException
+from lib.DxApiProfiler import configure_profiling
+from lib.DxCache import get_index
+from lib.DxInventoryCache import configure_cache
+from lib.DxLogging import logging_est
+from lib.DxLogging import print_debug
+from lib.DxLogging import print_exception
+from lib.DxLogging import print_info
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.GetSession import GetSession
+
+#Object types that can be searched, in the order they are queried
+SEARCH_TYPES = [('database', database), ('environment', environment),
+                ('container', container), ('bookmark', bookmark),
+                ('user', user)]
+
+OUTPUT_HEADER = ['Engine', 'Type', 'Name', 'Reference']
+
+
+def find_matches(engine, f_class, name_pattern):
+    """
+    Return the objects of one class whose name matches name_pattern
+
+    engine: A Delphix engine session object
+    f_class: The objects class. I.E. database or environment.
+    name_pattern: Name or shell wildcard pattern, compared case-insensitively
+    """
+
+    name_pattern = name_pattern.lower()
+    return [obj for obj in get_index(engine, f_class).objects
+            if fnmatchcase(str(obj.name).lower(), name_pattern)]
+
+
+@run_async
+def search_engine(engine, obj_types, results):
+    """
+    Search one engine for each object type in turn and put the outcome of
+    each on results. The types are queried one after another because an
+    engine session must not be used by two threads at once.
+
+    engine: Dictionary of the engine from dxtools.conf
+    obj_types: List of names in SEARCH_TYPES
+    results: Queue receiving (hostname, obj_type, status, value) tuples.
+             status is started (obj_type is None and value is the start
+             time), done (value is the matches) or error (value is the
+             exception).
+    """
+
+    results.put((engine['hostname'], None, 'started', time()))
+    for obj_type in obj_types:
+        try:
+            engine_session = dx_session_obj.serversess(
+                engine['ip_address'], engine['username'], engine['password'])
+            matches = find_matches(engine_session,
+                                   dict(SEARCH_TYPES)[obj_type],
+                                   arguments['--name'])
+        except (DlpxException, HttpError, RequestError, JobError,
+                socket.error) as e:
+            results.put((engine['hostname'], obj_type, 'error', e))
+        except Exception:
+            #Anything else is reported too, instead of being mistaken for
+            # a timeout.
+            results.put((engine['hostname'], obj_type, 'error',
+                         'Unexpected error:\n{}'.format(
+                             traceback.format_exc())))
+        else:
+            results.put((engine['hostname'], obj_type, 'done', matches))
+
+
+def create_writer(output_format, output=None):
+    """
+    Write the header of output_format and return a function that writes one
+    match.
+
+    output_format: text, csv or json
+    output (optional): File object to write to. Default: sys.stdout
+    :return: Function taking the hostname, object type and object
+    """
+
+    output = output or sys.stdout
+
+    if output_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(OUTPUT_HEADER)
+    elif output_format == 'text':
+        output.write('{}\n'.format(', '.join(OUTPUT_HEADER)))
+    elif output_format != 'json':
+        raise DlpxException('{} is not a valid output format. Valid formats '
+                            'are text, csv and json.'.format(output_format))
+
+    def write_match(hostname, obj_type, obj):
+        match_row = [hostname, obj_type, str(obj.name), str(obj.reference)]
+        if output_format == 'csv':
+            writer.writerow(match_row)
+        elif output_format == 'json':
+            output.write('{}\n'.format(json.dumps(dict(zip(
+                ['engine', 'type', 'name', 'reference'], match_row)))))
+        else:
+            output.write('{}\n'.format(', '.join(match_row)))
+        #Flush so a caller piping the output sees each match as it arrives.
+        output.flush()
+
+    return write_match
+
+
+def run_search(engines, obj_types, timeout, write_match):
+    """
+    Search every engine concurrently and write matches as they arrive. An
+    engine that has not answered every query within timeout seconds of its
+    search starting is reported and its remaining results are dropped.
+
+    engines: List of engine dictionaries from dxtools.conf
+    obj_types: List of names in SEARCH_TYPES
+    timeout: Seconds each engine may take
+    write_match: Function returned by create_writer
+    :return: Tuple of the number of matches and the list of hostnames that
+             failed or timed out
+    """
+
+    results = Queue()
+    pending = set()
+    started = {}
+    failed = []
+    num_matches = 0
+
+    for engine in engines:
+        search_engine(engine, obj_types, results)
+        pending.update((engine['hostname'], obj_type) for obj_type in
+                       obj_types)
+
+    while pending:
+        #Wait in short slices so Ctrl+C is received and timeouts are checked.
+        try:
+            hostname, obj_type, status, value = results.get(timeout=0.5)
+        except Empty:
+            hostname = status = None
+
+        if status == 'started' and hostname not in failed:
+            started.setdefault(hostname, value)
+        elif hostname is not None and (hostname, obj_type) in pending:
+            if status == 'done':
+                pending.discard((hostname, obj_type))
+                for obj in value:
+                    write_match(hostname, obj_type, obj)
+                num_matches += len(value)
+            elif status == 'error':
+                print_exception('ERROR: Engine {} could not be searched for '
+                                '{} objects:\n{}'.format(hostname, obj_type,
+                                                         value))
+                if hostname not in failed:
+                    failed.append(hostname)
+                pending.discard((hostname, obj_type))
+
+            #Every type of this engine has answered, so it cannot time out.
+            if not [obj_type for obj_type in obj_types if
+                    (hostname, obj_type) in pending]:
+                started.pop(hostname, None)
+
+        for hostname, start in started.items():
+            if time() - start > timeout:
+                print_exception('ERROR: Engine {} did not answer within {} '
+                                'seconds.'.format(hostname, timeout))
+                if hostname not in failed:
+                    failed.append(hostname)
+                del started[hostname]
+                pending.difference_update([(hostname, obj_type) for
+                                           obj_type in obj_types])
+    return num_matches, failed
+
+
+def select_engines():
+    """
+    Return the engines to search: the one given with --engine, otherwise
+    every engine in dxtools.conf
+    """
+
+    if arguments['--engine']:
+        try:
+            return [dx_session_obj.dlpx_engines[arguments['--engine']]]
+        except KeyError:
+            raise DlpxException('\nERROR: Delphix Engine {} cannot be found '
+                                'in {}. Please check your value and try '
+                                'again. Exiting.\n'.format(
+                                    arguments['--engine'], config_file_path))
+    return dx_session_obj.dlpx_engines.values()
+
+
+def select_types():
+    """
+    Return the object types given with --type, in the order of SEARCH_TYPES
+    """
+
+    if arguments['--type'] == 'all':
+        return [obj_type for obj_type, _ in SEARCH_TYPES]
+
+    obj_types = [obj_type.strip().lower() for obj_type in
+                 arguments['--type'].split(',')]
+    invalid_types = [obj_type for obj_type in obj_types if obj_type not in
+                     dict(SEARCH_TYPES)]
+    if invalid_types:
+        raise DlpxException('{} is not a valid object type. Valid types are '
+                            '{}.'.format(', '.join(invalid_types), ', '.join(
+                                obj_type for obj_type, _ in SEARCH_TYPES)))
+    return [obj_type for obj_type, _ in SEARCH_TYPES if obj_type in obj_types]
+
+
+def time_elapsed():
+    """
+    This function calculates the time elapsed since the beginning of the script.
+    Call this anywhere you want to note the progress in terms of time
+    """
+    return round((time() - time_start)/60, +1)
+
+
+def main(arguments):
+    #We want to be able to call on these variables anywhere in the script.
+    global time_start
+    global config_file_path
+    global dx_session_obj
+
+    try:
+        dx_session_obj = GetSession()
+        logging_est(arguments['--logdir'])
+        print_debug(arguments)
+        time_start = time()
+        config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
+        #Parse the dxtools.conf and put it into a dictionary
+        dx_session_obj.get_config(config_file_path)
+
+        timeout = float(arguments['--timeout'])
+        engines = select_engines()
+        write_match = create_writer(arguments['--format'])
+        num_matches, failed = run_search(engines, select_types(), timeout,
+                                         write_match)
+
+        print_debug('Found {} matches on {} engines in {:.2f} minutes'.format(
+            num_matches, len(engines), time_elapsed()))
+        if failed:
+            print_exception('{} of {} engines could not be searched: '
+                            '{}'.format(len(failed), len(engines),
+                                        ', '.join(failed)))
+            sys.exit(2)
+        elif num_matches == 0:
+            sys.exit(1)
+
+    #Here we handle what we do when the unexpected happens
+    except DlpxException as e:
+        print_exception('script encountered an error while processing the'
+                        'config file:\n{}'.format(e))
+        sys.exit(1)
+
+    except SystemExit as e:
+        """
+        This is what we use to handle our sys.exit(#)
+        """
+        sys.exit(e)
+
+    except KeyboardInterrupt:
+        """
+        We use this exception handler to gracefully handle ctrl+c exits
+        """
+        print_debug("You sent a CTRL+C to interrupt the process")
+        elapsed_minutes = time_elapsed()
+        print_info('{} took {:.2f} minutes to get this far\n'.format(
+                   basename(__file__), elapsed_minutes))
+
+    except:
+        """
+        Everything else gets caught here
+        """
+        print_exception(sys.exc_info()[0])
+        elapsed_minutes = time_elapsed()
+        print_info('{} took {:.2f} minutes to get this far\n'.format(
+                   basename(__file__), elapsed_minutes))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    #Grab our arguments from the doc at the top of the script
+    arguments = docopt(__doc__, version=basename(__file__) + " " + VERSION)
+    #Feed our arguments to the main function, and off we go!
+    main(arguments)
@@ -14,10 +14,12 @@ Usage:
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
     dx_groups.py (--list)
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   dx_groups.py -h | --help | -v | --version
 Description
 
@@ -36,6 +38,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -48,24 +55,30 @@ VERSION = 'v.0.0.001'
 
 import sys
 from os.path import basename
-from time import sleep, time
+from time import time
 from docopt import docopt
 
 from delphixpy.exceptions import HttpError
 from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
-from delphixpy.web import job
 from delphixpy.web import group
 from delphixpy.web.vo import Group
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import invalidate_cache
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
 from lib.GetReferences import find_obj_by_name
 from lib.GetReferences import find_all_objects
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
 def add_group(group_name):
     """
@@ -77,6 +90,7 @@ def add_group(group_name):
 
     try:
       group.create(dx_session_obj.server_session,group_obj)
+      invalidate_cache(dx_session_obj.server_session, group)
       print('Attempting to create {}'.format(group_name))
     except (DlpxException, RequestError) as e:
       print_exception('\nERROR: Creating the group {} '
@@ -93,6 +107,7 @@ def delete_group(group_name):
 
     try:
       group.delete(dx_session_obj.server_session,group_obj.reference)
+      invalidate_cache(dx_session_obj.server_session, group)
       print('Attempting to delete {}'.format(group_name))
     except (DlpxException, RequestError) as e:
       print_exception('\nERROR: Deleting the group {} '
@@ -109,38 +124,6 @@ def list_groups():
         print('Group: {}'.format(group_obj.name))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine):
     """
@@ -164,6 +147,7 @@ def main_workflow(engine):
     thingstodo = ["thingtodo"]
     try:
         with dx_session_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dx_session_obj.server_session)
             while (len(dx_session_obj.jobs) > 0 or len(thingstodo)> 0):
                 if len(thingstodo) > 0:
                     if arguments['--add'] :
@@ -176,8 +160,7 @@ def main_workflow(engine):
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dx_session_obj.jobs.keys():
-                    job_obj = job.get(dx_session_obj.server_session,
-                                      dx_session_obj.jobs[j])
+                    job_obj = job_watcher.get(dx_session_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: Group: {}'.format(
                         engine['hostname'], job_obj.job_state))
@@ -195,7 +178,7 @@ def main_workflow(engine):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dx_session_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
 
     except (HttpError, RequestError, JobError, DlpxException) as e:
         print_exception('ERROR: Could not complete group '
@@ -260,11 +243,9 @@ def run_job():
     #run the job against the engine
     threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -296,6 +277,9 @@ def main(arguments):
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -65,10 +65,9 @@ import sys
 import time
 import traceback
 import json
-import threading
 
 from multiprocessing import Process
-from time import sleep, time
+from time import time
 
 from delphixpy.v1_6_0.delphix_engine import DelphixEngine
 from delphixpy.v1_6_0.exceptions import HttpError, JobError
@@ -77,47 +76,15 @@ from delphixpy.v1_6_0.web import jetstream, job
 from delphixpy.v1_6_0.web.vo import JSBookmark, JSBookmarkCreateParameters, JSTimelinePointLatestTimeInput 
 #from delphixpy.v1_6_0.web.vo import 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    #from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = threading.Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
+from lib.JobWatcher import JobWatcher
 
-    return async_func
-
-@run_async
 def container_bookmark(engine, server, container_obj, bookmark_name, bookmark_shared, tags):
-    '''This function bookmarks the current branch on the container'''
-    #But first, let's make sure it is in a CONSISTENT state
-    container_recover(engine, server, container_obj)
-    #Next let's make sure it is started
-    container_start(engine, server, container_obj)
+    '''This function bookmarks the current branch on the container and returns the job reference'''
+    #But first, let's make sure it is in a CONSISTENT state and started
+    container_prepare(engine, server, container_obj)
     #Prepare the bookmark creation parameters
     bookmark_create_params = JSBookmarkCreateParameters()
     bookmark_create_params.bookmark = JSBookmark()
@@ -128,65 +95,61 @@ def container_bookmark(engine, server, container_obj, bookmark_name, bookmark_sh
     bookmark_create_params.timeline_point_parameters = JSTimelinePointLatestTimeInput()
     bookmark_create_params.timeline_point_parameters.source_data_layout = container_obj.reference
 
-    jetstream.bookmark.create(server, bookmark_create_params)
+    return submit_job(server, jetstream.bookmark.create, bookmark_create_params)
+
+def container_prepare(engine, server, container_obj):
+    '''This function recovers and starts a container, waiting for both, before another operation is run on it'''
+    container_recover(engine, server, container_obj)
+    start_job = container_start(engine, server, container_obj)
+    if start_job:
+        job_context.wait(server, start_job)
 
 def container_recover(engine, server, container_obj):
     '''This function recovers a container that is in an "INCONSISTENT" state'''
     if container_obj.state == "INCONSISTENT":
         #if not recover it
-        job_obj = jetstream.container.recover(server, container_obj.reference)
+        recover_job = submit_job(server, jetstream.container.recover, container_obj.reference)
         #wait for the recovery action to finish
-        job_context.wait(server,job_obj.reference)
+        if recover_job:
+            job_context.wait(server, recover_job)
         #get the updated object with the new state
         container_obj = jetstream.container.get(server, container_obj.reference)
         return container_obj
 
-@run_async   
-def container_recover_async(engine, server, container_obj):
-    '''This function recovers all specified containers asynchronously'''
-    container_recover(engine, server, container_obj)
-
-@run_async
 def container_refresh(engine, server, container_obj):
-    '''This function refreshes a container'''
-    #But first, let's make sure it is in a CONSISTENT state
-    container_recover(engine, server, container_obj)
-    #Next let's make sure it is started
-    container_start(engine, server, container_obj)
+    '''This function refreshes a container and returns the job reference'''
+    #But first, let's make sure it is in a CONSISTENT state and started
+    container_prepare(engine, server, container_obj)
     #Now let's refresh it.
-    refresh_job = jetstream.container.refresh(server, container_obj.reference)
+    return submit_job(server, jetstream.container.refresh, container_obj.reference)
 
-@run_async
 def container_reset(engine, server, container_obj):
-    '''This function resets a container'''
-    #But first, let's make sure it is in a CONSISTENT state
-    container_recover(engine, server, container_obj)
-    #Next let's make sure it is started
-    container_start(engine, server, container_obj)
-    #Now let's refresh it.
-    reset_job = jetstream.container.reset(server, container_obj.reference)
+    '''This function resets a container and returns the job reference'''
+    #But first, let's make sure it is in a CONSISTENT state and started
+    container_prepare(engine, server, container_obj)
+    #Now let's reset it.
+    return submit_job(server, jetstream.container.reset, container_obj.reference)
 
 def container_start(engine, server, container_obj):
-    '''This function starts/enables a container that is in an "OFFLINE" state'''
+    '''This function starts/enables a container that is in an "OFFLINE" state and returns the job reference'''
     if container_obj.state == "OFFLINE":
         #if not, enable it
-        jetstream.container.enable(server, container_obj.reference)
-
-@run_async   
-def container_start_async(engine, server, container_obj):
-    '''This function starts all specified containers asynchronously'''
-    container_start(engine, server, container_obj)
+        return submit_job(server, jetstream.container.enable, container_obj.reference)
 
 def container_stop(engine, server, container_obj):
-    '''This function starts/enables a container that is in an "OFFLINE" state'''
+    '''This function stops/disables a container that is in an "ONLINE" state and returns the job reference'''
     if container_obj.state == "ONLINE":
-        #if not, enable it
-        jetstream.container.disable(server, container_obj.reference)
-
-@run_async   
-def container_stop_async(engine, server, container_obj):
-    '''This function starts all specified containers asynchronously'''
-    container_stop(engine, server, container_obj)
+        #if not, disable it
+        return submit_job(server, jetstream.container.disable, container_obj.reference)
+
+def submit_job(server, func, *args):
+    '''
+    This function calls func(server, *args) and returns the reference of the job it started, or None.
+    last_job keeps the previous job when a call starts none, so it is cleared first.
+    '''
+    server.last_job = None
+    func(server, *args)
+    return server.last_job
 
 def find_container_by_name_and_template_name(engine, server, container_name, template_name):
     template_obj = find_obj_by_name(engine, server, jetstream.template, template_name)
@@ -375,63 +338,60 @@ def main_workflow(engine):
         return
     #reset the running job count before we begin
     i = 0
-    container_threads = []
-    #While there are still running jobs or containers still to process....
-    while (i > 0 or len(containers) > 0):
-        #While there are containers still to process and we are still under 
-        #the max simultaneous jobs threshold (if specified)
-        while len(containers) > 0 and (arguments['--parallel'] == None or i < int(arguments['--parallel'])):
-            #Give us the next database in the list, and remove it from the list
-            container_obj = containers.pop()
-            #what do we want to do?
-            if arguments['--operation'] == "refresh":
-                #refresh the container
-                container_threads.append(container_refresh(engine, server, container_obj))
-            elif arguments['--operation'] == "reset":
-                container_threads.append(container_reset(engine, server, container_obj))
-            elif arguments['--operation'] == "start":
-                container_threads.append(container_start_async(engine, server, container_obj))
-            elif arguments['--operation'] == "stop":
-                container_threads.append(container_stop_async(engine, server, container_obj))
-            elif arguments['--operation'] == "recover":
-                container_threads.append(container_recover_async(engine, server, container_obj))
-            elif arguments['--operation'] == "bookmark":
-                if arguments['--bookmark_tags']:
-                    tags = arguments['--bookmark_tags'].split(',')
-                else:
-                    tags = []
-                if arguments['--bookmark_shared']:
-                    if str(arguments['--bookmark_shared']).lower() == "true":
-                        bookmark_shared = True
-                    elif str(arguments['--bookmark_shared']).lower() == "false":
-                        bookmark_shared = False
+    with job_mode(server):
+        job_watcher = JobWatcher(server)
+        #While there are still running jobs or containers still to process....
+        while (len(jobs) > 0 or len(containers) > 0):
+            #While there are containers still to process and we are still under 
+            #the max simultaneous jobs threshold (if specified)
+            while len(containers) > 0 and (arguments['--parallel'] == None or i < int(arguments['--parallel'])):
+                #Give us the next database in the list, and remove it from the list
+                container_obj = containers.pop()
+                container_job = None
+                #what do we want to do?
+                if arguments['--operation'] == "refresh":
+                    #refresh the container
+                    container_job = container_refresh(engine, server, container_obj)
+                elif arguments['--operation'] == "reset":
+                    container_job = container_reset(engine, server, container_obj)
+                elif arguments['--operation'] == "start":
+                    container_job = container_start(engine, server, container_obj)
+                elif arguments['--operation'] == "stop":
+                    container_job = container_stop(engine, server, container_obj)
+                elif arguments['--operation'] == "recover":
+                    container_recover(engine, server, container_obj)
+                elif arguments['--operation'] == "bookmark":
+                    if arguments['--bookmark_tags']:
+                        tags = arguments['--bookmark_tags'].split(',')
+                    else:
+                        tags = []
+                    if arguments['--bookmark_shared']:
+                        if str(arguments['--bookmark_shared']).lower() == "true":
+                            bookmark_shared = True
+                        elif str(arguments['--bookmark_shared']).lower() == "false":
+                            bookmark_shared = False
+                        else:
+                            print_error("Invalid argument \"" + str(arguments['--bookmark_shared']).lower() + "\"  for --bookmark_shared")
+                            print_error("--bookmark_shared only takes a value of true/false.")
+                            print_error("Exiting")
+                            sys.exit(1)
                     else:
-                        print_error("Invalid argument \"" + str(arguments['--bookmark_shared']).lower() + "\"  for --bookmark_shared")
-                        print_error("--bookmark_shared only takes a value of true/false.")
-                        print_error("Exiting")
-                        sys.exit(1)
-                else:
-                    bookmark_shared=False
-                container_threads.append(container_bookmark(engine, server, container_obj, arguments['--bookmark_name'], bookmark_shared, tags))
-            #For each thread in the list...
-            i = len(container_threads)
-        #Check to see if we are running at max parallel processes, and report if so.
-        if ( arguments['--parallel'] != None and i >= int(arguments['--parallel'])):
-            print_info(engine["hostname"] + ": Max jobs reached (" + str(i) + ")")
-        #reset the running jobs counter, as we are about to update the count from the jobs report.
-        i=0
-        for t in container_threads:
-            if t.isAlive():
-                i+=1
-        print_info(engine["hostname"] + ": " + str(i) + " jobs running. " + str(len(containers)) + " jobs waiting to run")
-        #If we have running jobs, pause before repeating the checks.
-        if i > 0:
-            sleep(float(arguments['--poll']))
-    print "made it out"
-    #For each thread in the list...
-    for each in container_threads:
-        #join them back together so that we wait for all threads to complete before moving on
-        each.join()
+                        bookmark_shared=False
+                    container_job = container_bookmark(engine, server, container_obj, arguments['--bookmark_name'], bookmark_shared, tags)
+                #If container_job has any value, then we know that a job was initiated.
+                if container_job:
+                    jobs[container_obj] = container_job
+                    #increment the running job count
+                    i += 1
+            #Check to see if we are running at max parallel processes, and report if so.
+            if ( arguments['--parallel'] != None and i >= int(arguments['--parallel'])):
+                print_info(engine["hostname"] + ": Max jobs reached (" + str(i) + ")")
+            #reset the running jobs counter, as we are about to update the count from the jobs report.
+            i = update_jobs_dictionary(engine, job_watcher, jobs)
+            print_info(engine["hostname"] + ": " + str(i) + " jobs running. " + str(len(containers)) + " jobs waiting to run")
+            #If we have running jobs, wait for one of them to change before repeating the checks.
+            if len(jobs) > 0:
+                job_watcher.wait_for_change(float(arguments['--poll']))
 
 def run_job(engine):
     """
@@ -479,10 +439,9 @@ def run_job(engine):
         #run the job against the engine
         threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 def time_elapsed():
     """
@@ -492,21 +451,23 @@ def time_elapsed():
     elapsed_minutes = round((time() - time_start)/60, +1)
     return elapsed_minutes
 
-def update_jobs_dictionary(engine, server, jobs):
+def update_jobs_dictionary(engine, job_watcher, jobs):
     """
     This function checks each job in the dictionary and updates its status or removes it if the job is complete.
+    Jobs are read through job_watcher, so only the jobs that changed are fetched again.
     Return the number of jobs still running.
     """
     #Establish the running jobs counter, as we are about to update the count from the jobs report.
     i = 0
     #get all the jobs, then inspect them
     for j in jobs.keys():
-        job_obj = job.get(server, jobs[j])
+        job_obj = job_watcher.get(jobs[j])
         print_debug(engine["hostname"] + ": " + str(job_obj))
         print_info(engine["hostname"] + ": " + j.name + ": " + job_obj.job_state)
         
         if job_obj.job_state in ["CANCELED", "COMPLETED", "FAILED"]:
             #If the job is in a non-running state, remove it from the running jobs list.
+            job_watcher.forget(jobs[j])
             del jobs[j]
         else:
             #If the job is in a running state, increment the running job count.
@@ -530,6 +491,7 @@ def main(argv):
         single_thread = False
         
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
         #Parse the dxtools.conf and put it into a dictionary
         dxtools_objects = get_config(config_file_path)
         
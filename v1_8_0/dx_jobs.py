@@ -10,7 +10,7 @@
 #this doc to also define our arguments for the script.
 """List jobs on an engine
 Usage:
-  dx_jobs.py (--list [--state <name>][--title <name>])
+  dx_jobs.py (--list [--state <name>][--title <name>][--max_jobs <n>])
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
@@ -22,12 +22,16 @@ Examples:
     dx_jobs.py --list --state failed
     dx_jobs.py --list --title snapsync
     dx_jobs.py --list --state failed --title snapsync
+    dx_jobs.py --list --max_jobs 0
 
 
 Options:
-  --list                    List all jobs on an engine.
+  --list                    List the most recent jobs on an engine.
   --title <name>            Filter job by title name. Note: The search is case insensitive.
   --state <name>            Filter jobs by state: RUNNING, SUSPENDED, CANCELED, COMPLETED, FAILED
+  --max_jobs <n>            The number of matching jobs to list. 0 lists the
+                            whole job history.
+                            [default: 25]
   --engine <type>           Alt Identifier of Delphix engine in dxtools.conf.
   --all                     Run against all engines.
   --debug                   Enable debug logging
@@ -42,12 +46,12 @@ Options:
   -v --version              Show version.
 """
 
-VERSION = 'v.0.0.002'
+VERSION = 'v.0.0.003'
 
 import sys
 import re
 from os.path import basename
-from time import sleep, time
+from time import time
 from docopt import docopt
 
 from delphixpy.exceptions import HttpError
@@ -60,97 +64,60 @@ from lib.DxLogging import logging_est
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
+from lib.DxPager import DEFAULT_PAGE_SIZE
+from lib.DxPager import iter_pages
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
 
 def list_jobs():
+    """
+    Print up to --max_jobs jobs on the engine, filtered by --state and
+    --title. Jobs are requested a page at a time, so the first jobs print
+    while the rest are still being downloaded, and no page is requested
+    once enough jobs have been printed.
+    """
+
+    max_jobs = int(arguments['--max_jobs'])
+    page_size = DEFAULT_PAGE_SIZE
+    #Without a title filter every job is printed, so a single page of
+    # max_jobs is all that is needed and there is no next page to prefetch.
+    single_page = max_jobs > 0 and not arguments['--title']
+    if single_page:
+        page_size = max_jobs
 
+    job_filters = {}
     if arguments['--state']:
         if re.match('RUNNING|SUSPENDED|CANCELED|COMPLETED|FAILED',
                     arguments['--state'].upper()):
-            pass
+            job_filters['job_state'] = arguments['--state'].upper()
         else:
             print_info('The state should be one of these options:\n'
                   'RUNNING, SUSPENDED, CANCELED, COMPLETED, FAILED')
             sys.exit(1)
 
-        for job_info in job.get_all(dx_session_obj.server_session,
-                                    job_state=arguments['--state'].upper()):
-
-            if arguments['--title']:
-                if re.search(arguments['--title'], job_info.title,
-                                       re.IGNORECASE):
-                    print('Action={}, Job State={}, Parent Action State={},'
-                           'Percent Complete={}, Reference={}, Target={},'
-                           'Target Name={}, Title={}, User={}\n'.format(
-                           job_info.action_type, job_info.job_state,
-                           job_info.parent_action_state,
-                           job_info.percent_complete, job_info.reference,
-                           job_info.target, job_info.target_name,
-                           job_info.title, job_info.user))
-            else:
-                print('Action=%s, Job State=%s, Parent Action State=%s,'
-                       'Percent Complete=%s, Reference=%s, Target=%s,'
-                       'Target Name=%s, Title=%s, User=%s\n' %
-                       (job_info.action_type, job_info.job_state,
-                        job_info.parent_action_state,
-                        job_info.percent_complete, job_info.reference,
-                        job_info.target, job_info.target_name,
-                        job_info.title, job_info.user))
-    else:
-        for job_info in job.get_all(dx_session_obj.server_session):
-
-            if arguments['--title']:
-                if re.search(arguments['--title'], job_info.title,
-                                       re.IGNORECASE):
-                    print('Action=%s, Job State=%s, Parent Action State=%s,'
-                    'Percent Complete=%s, Reference=%s, Target=%s,'
-                    'Target Name=%s, Title=%s, User=%s\n' %
-                    (job_info.action_type, job_info.job_state,
-                     job_info.parent_action_state, job_info.percent_complete,
-                     job_info.reference, job_info.target, job_info.target_name,
-                     job_info.title, job_info.user))
-            else:
-                print('Action=%s, Job State=%s, Parent Action State=%s,'
-                      'Percent Complete=%s, Reference=%s, Target=%s,'
-                      'Target Name=%s, Title=%s, User=%s\n' %
-                      (job_info.action_type, job_info.job_state,
-                       job_info.parent_action_state, job_info.percent_complete,
-                       job_info.reference, job_info.target,
-                       job_info.target_name, job_info.title, job_info.user))
-
-
-
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
+    num_jobs = 0
+    for job_info in iter_pages(job.get_all, dx_session_obj.server_session,
+                               page_size, prefetch=not single_page,
+                               **job_filters):
 
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
+        if arguments['--title'] and not re.search(
+                arguments['--title'], job_info.title, re.IGNORECASE):
+            continue
 
-    return async_func
+        print('Action=%s, Job State=%s, Parent Action State=%s,'
+              'Percent Complete=%s, Reference=%s, Target=%s,'
+              'Target Name=%s, Title=%s, User=%s\n' %
+              (job_info.action_type, job_info.job_state,
+               job_info.parent_action_state, job_info.percent_complete,
+               job_info.reference, job_info.target,
+               job_info.target_name, job_info.title, job_info.user))
+        num_jobs += 1
+        if num_jobs == max_jobs:
+            break
 
 
 @run_async
@@ -177,6 +144,7 @@ def main_workflow(engine):
 
     thingstodo = ["thingtodo"]
     with dx_session_obj.job_mode(single_thread):
+        job_watcher = JobWatcher(dx_session_obj.server_session)
         while len(dx_session_obj.jobs) > 0 or len(thingstodo) > 0:
             if len(thingstodo) > 0:
 
@@ -187,8 +155,7 @@ def main_workflow(engine):
             # get all the jobs, then inspect them
             i = 0
             for j in dx_session_obj.jobs.keys():
-                job_obj = job.get(dx_session_obj.server_session,
-                                  dx_session_obj.jobs[j])
+                job_obj = job_watcher.get(dx_session_obj.jobs[j])
                 print_debug(job_obj)
                 print_info('{}: Operations: {}'.format(engine['hostname'],
                                                        job_obj.job_state))
@@ -206,7 +173,7 @@ def main_workflow(engine):
 
             # If we have running jobs, pause before repeating the checks.
             if len(dx_session_obj.jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
 
 
 def run_job():
@@ -267,11 +234,9 @@ def run_job():
     #run the job against the engine
     threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -304,6 +269,7 @@ def main(argv):
         engine = None
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -8,10 +8,11 @@
 # this doc to also define our arguments for the script.
 """List all VDBs or Start, stop, enable, disable a VDB
 Usage:
-  dx_operations_vdb.py (--vdb <name> [--stop | --start | --enable | --disable] | --list | --all_dbs <name>)
+  dx_operations_vdb.py (--vdb <name> [--stop | --start | --enable | --disable] | --list [--format <type>] | --all_dbs <name>)
                   [-d <identifier> | --engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   dx_operations_vdb.py -h | --help | -v | --version
 List all VDBs, start, stop, enable, disable a VDB
 
@@ -21,6 +22,7 @@ Examples:
   dx_operations_vdb.py --all_dbs enable
   dx_operations_vdb.py --all_dbs disable
   dx_operations_vdb.py --list
+  dx_operations_vdb.py --list --format csv
 
 Options:
   --vdb <name>              Name of the VDB to stop or start
@@ -28,6 +30,8 @@ Options:
   --stop                    Stop the VDB
   --all_dbs <name>          Enable or disable all dSources and VDBs
   --list                    List all databases from an engine
+  --format <type>           Output format of --list: text, csv or json.
+                            json writes one object per line. [default: text]
   --enable                  Enable the VDB
   --disable                 Disable the VDB
   -d <identifier>           Identifier of Delphix engine in dxtools.conf.
@@ -37,6 +41,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -45,20 +54,20 @@ Options:
   -v --version              Show version.
 """
 
-VERSION = 'v.0.3.015'
+VERSION = 'v.0.3.016'
 
+import csv
+import json
 import sys
 from os.path import basename
-from time import sleep, time
+from time import time
 import traceback
 
 from delphixpy.exceptions import HttpError
 from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
 from delphixpy.web import database
-from delphixpy.web import job
 from delphixpy.web import source
-from delphixpy.web.capacity import consumer
 from docopt import docopt
 
 from lib.DlpxException import DlpxException
@@ -67,9 +76,15 @@ from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
 from lib.GetReferences import find_obj_by_name
-from lib.GetReferences import find_all_objects
-from lib.GetReferences import find_obj_list
+from lib.EngineObjectInfo import DATABASE_USAGE_KEYS
+from lib.EngineObjectInfo import get_database_usage
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
 
 def dx_obj_operation(dlpx_obj, vdb_name, operation):
@@ -115,86 +130,65 @@ def all_databases(dlpx_obj, operation):
     :type operation: str
     """
 
+    engine_name = dlpx_obj.dlpx_engines.keys()[0]
     for db in database.get_all(dlpx_obj.server_session):
         try:
             dx_obj_operation(dlpx_obj, db.name, operation)
         except (RequestError, HttpError, JobError):
             pass
+        # Track each database's job under its own name, so main_workflow
+        # waits for all of them rather than only the last one submitted.
+        if engine_name in dlpx_obj.jobs:
+            dlpx_obj.jobs[db.name] = dlpx_obj.jobs.pop(engine_name)
         print '{} {}\n'.format(operation, db.name)
-        sleep(2)
 
 
-def list_databases(dlpx_obj):
+def list_databases(dlpx_obj, output_format='text', output=None):
     """
-    Function to list all databases for a given engine
+    Function to list all databases for a given engine. Rows are written as
+    they are produced.
 
     :param dlpx_obj: Virtualization Engine session object
     :type dlpx_obj: lib.GetSession.GetSession
+    :param output_format: text, csv or json. json writes one object per line
+    :type output_format: str
+    :param output: File object to write to. Default: sys.stdout
+    :type output: file
     """
 
-    source_stats_lst = find_all_objects(dlpx_obj.server_session, source)
-    is_dSource = None
+    output = output or sys.stdout
+
+    if output_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(DATABASE_USAGE_KEYS)
+    elif output_format not in ['json', 'text']:
+        raise DlpxException('{} is not a valid output format. Valid formats '
+                            'are text, csv and json.'.format(output_format))
+
     try:
-        for db_stats in find_all_objects(dlpx_obj.server_session,
-                                         consumer):
-            source_stats = find_obj_list(source_stats_lst, db_stats.name)
-            if source_stats is not None:
-                if source_stats.virtual is False:
-                    is_dSource = 'dSource'
-                elif source_stats.virtual is True:
-                    is_dSource = db_stats.parent
-                print('name: {},provision container: {},database disk '
-                      'usage: {:.2f} GB,Size of Snapshots: {:.2f} GB,'
-                      'Enabled: {},Status:{},'.format(str(db_stats.name),
-                      str(is_dSource),
-                      db_stats.breakdown.active_space / 1024 / 1024 / 1024,
-                      db_stats.breakdown.sync_space / 1024 / 1024 / 1024,
-                      source_stats.runtime.enabled,
-                      source_stats.runtime.status))
-            elif source_stats is None:
-                print('name = {},provision container= {},database disk '
-                      'usage: {:.2f} GB,Size of Snapshots: {:.2f} GB,'
-                      'Could not find source information. This could be a '
-                      'result of an unlinked object'.format(
-                      str(db_stats.name), str(db_stats.parent),
-                      db_stats.breakdown.active_space / 1024 / 1024 / 1024,
-                      db_stats.breakdown.sync_space / 1024 / 1024 / 1024))
+        for db_usage in get_database_usage(dlpx_obj.server_session):
+            if output_format == 'csv':
+                writer.writerow([db_usage[key] for key in
+                                 DATABASE_USAGE_KEYS])
+            elif output_format == 'json':
+                output.write('{}\n'.format(json.dumps(db_usage)))
+            elif db_usage['enabled'] is not None:
+                output.write('name: {name},provision container: '
+                             '{provision_container},database disk usage: '
+                             '{active_space_gb:.2f} GB,Size of Snapshots: '
+                             '{snapshot_space_gb:.2f} GB,Enabled: {enabled},'
+                             'Status:{status},\n'.format(**db_usage))
+            else:
+                output.write('name = {name},provision container= '
+                             '{provision_container},database disk usage: '
+                             '{active_space_gb:.2f} GB,Size of Snapshots: '
+                             '{snapshot_space_gb:.2f} GB,Could not find source '
+                             'information. This could be a result of an '
+                             'unlinked object\n'.format(**db_usage))
     except (RequestError, JobError, AttributeError, DlpxException) as e:
         print 'An error occurred while listing databases: {}'.format((e))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine, dlpx_obj):
     """
@@ -223,6 +217,7 @@ def main_workflow(engine, dlpx_obj):
     thingstodo = ["thingtodo"]
     try:
         with dlpx_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dlpx_obj.server_session)
             while len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0:
                 if len(thingstodo)> 0:
                     if arguments['--start']:
@@ -235,31 +230,32 @@ def main_workflow(engine, dlpx_obj):
                         dx_obj_operation(dlpx_obj, arguments['--vdb'],
                                          'disable')
                     elif arguments['--list']:
-                        list_databases(dlpx_obj)
+                        list_databases(dlpx_obj, arguments['--format'])
                     elif arguments['--all_dbs']:
                         all_databases(dlpx_obj, arguments['--all_dbs'])
                     thingstodo.pop()
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dlpx_obj.jobs.keys():
-                    job_obj = job.get(dlpx_obj.server_session, dlpx_obj.jobs[j])
+                    job_obj = job_watcher.get(dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: Running JS Bookmark: {}'.format(
                         engine['hostname'], job_obj.job_state))
                     if job_obj.job_state in ["CANCELED", "COMPLETED", "FAILED"]:
                         # If the job is in a non-running state, remove it
                         # from the running jobs list.
+                        job_watcher.forget(dlpx_obj.jobs[j])
                         del dlpx_obj.jobs[j]
                     elif job_obj.job_state in 'RUNNING':
                         # If the job is in a running state, increment the
                         # running job count.
                         i += 1
-                    print_info('{}: {:d} jobs running.'.format(
-                        engine['hostname'], i))
-                    # If we have running jobs, pause before repeating the
-                    # checks.
-                    if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                print_info('{}: {:d} jobs running.'.format(
+                    engine['hostname'], i))
+                # If we have running jobs, wait for one of them to change
+                # before repeating the checks.
+                if len(dlpx_obj.jobs) > 0:
+                    job_watcher.wait_for_change(float(arguments['--poll']))
     except (DlpxException, RequestError, JobError, HttpError) as e:
         print_exception('Error in js_bookmark: {}\n{}'.format(
             engine['hostname'], e))
@@ -334,11 +330,9 @@ def run_job(dlpx_obj, config_file_path):
         # run the job against the engine
         threads.append(main_workflow(engine, dlpx_obj))
 
-    # For each thread in the list...
-    for each in threads:
-        # join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    # Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def main():
@@ -354,6 +348,9 @@ def main():
         logging_est(arguments['--logdir'])
         print_debug(arguments)
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         # Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -8,10 +8,11 @@
 #this doc to also define our arguments for the script.
 """List all VDBs or Start, stop, enable, disable a VDB
 Usage:
-  dx_operations_vdb.py (--vdb <name> [--stop | --start | --enable | --disable] | --list | --all_dbs <name>)
+  dx_operations_vdb.py (--vdb <name> [--stop | --start | --enable | --disable] | --list [--format <type>] | --all_dbs <name> [--max_inflight <n>])
                   [-d <identifier> | --engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   dx_operations_vdb.py -h | --help | -v | --version
 List all VDBs, start, stop, enable, disable a VDB
 
@@ -20,14 +21,20 @@ Examples:
   dx_operations_vdb.py --vdb testvdb --start
   dx_operations_vdb.py --all_dbs enable
   dx_operations_vdb.py --all_dbs disable
+  dx_operations_vdb.py --all_dbs disable --max_inflight 20
   dx_operations_vdb.py --list
+  dx_operations_vdb.py --list --format csv
 
 Options:
   --vdb <name>              Name of the VDB to stop or start
   --start                   Stop the VDB
   --stop                    Stop the VDB
   --all_dbs <name>          Enable or disable all dSources and VDBs
+  --max_inflight <n>        Number of --all_dbs jobs each engine runs at the
+                            same time [default: 10]
   --list                    List all databases from an engine
+  --format <type>           Output format of --list: text, csv or json.
+                            json writes one object per line. [default: text]
   --enable                  Enable the VDB
   --disable                 Disable the VDB
   -d <identifier>           Identifier of Delphix engine in dxtools.conf.
@@ -37,6 +44,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -45,19 +57,20 @@ Options:
   -v --version              Show version.
 """
 
-VERSION = 'v.0.3.002'
+VERSION = 'v.0.3.003'
 
+import csv
+import json
 import sys
+from collections import deque
 from os.path import basename
-from time import sleep, time
+from time import time
 
 from delphixpy.v1_8_0.exceptions import HttpError
 from delphixpy.v1_8_0.exceptions import JobError
 from delphixpy.v1_8_0.exceptions import RequestError
 from delphixpy.v1_8_0.web import database
-from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web import source
-from delphixpy.v1_8_0.web.capacity import consumer
 from docopt import docopt
 
 from lib.DlpxException import DlpxException
@@ -66,10 +79,17 @@ from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
 from lib.GetReferences import find_obj_by_name
-from lib.GetReferences import find_all_objects
-from lib.GetReferences import find_obj_list
+from lib.EngineObjectInfo import DATABASE_USAGE_KEYS
+from lib.EngineObjectInfo import get_database_usage
 from lib.GetReferences import find_source_by_dbname
+from lib.DxApiProfiler import configure_profiling
+from lib.DxCache import get_index
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
 
 def vdb_operation(vdb_name, operation):
@@ -98,95 +118,130 @@ def vdb_operation(vdb_name, operation):
              '{}\n'.format(operation, vdb_name, e))
 
 
-def all_databases(operation):
+def all_databases(engine, operation, job_watcher, max_inflight):
     """
-    Enable or disable all dSources and VDBs on an engine
+    Enable or disable all dSources and VDBs on an engine. The databases and
+    their sources are listed once, then jobs are started as earlier ones
+    finish so that up to max_inflight run at the same time. A summary in
+    database order is printed at the end.
 
+    engine: Dictionary of the engine from dxtools.conf
     operation: enable or disable dSources and VDBs
+    job_watcher: lib.JobWatcher.JobWatcher for the engine session
+    max_inflight: Maximum number of jobs running at the same time
+    :return: Number of databases the operation did not complete on
     """
 
-    for db in database.get_all(dx_session_obj.server_session, no_js_container_data_source=True):
-        print '{} {}\n'.format(operation, db.name)
-        vdb_operation(db.name, operation)
-        sleep(2)
-
-
-def list_databases():
-    """
-    Function to list all databases for a given engine
+    server = dx_session_obj.server_session
+    db_objs = database.get_all(server, no_js_container_data_source=True)
+    source_index = get_index(server, source)
+    pending = deque(db_objs)
+    running = {}
+    results = {}
+
+    while pending or running:
+        while pending and len(running) < max_inflight:
+            db_obj = pending.popleft()
+            src_objs = source_index.by_container.get(db_obj.reference)
+            if not src_objs:
+                print_exception('Could not find the source for {} on engine '
+                                '{}.'.format(db_obj.name, engine['hostname']))
+                results[db_obj.reference] = ('NO SOURCE', None)
+                continue
+
+            print_info('{}: {} {}'.format(engine['hostname'], operation,
+                                          db_obj.name))
+            #last_job keeps the previous job if this call does not start
+            # one, so clear it first.
+            server.last_job = None
+            try:
+                if operation == 'enable':
+                    source.enable(server, src_objs[0].reference)
+                elif operation == 'disable':
+                    source.disable(server, src_objs[0].reference)
+            except (RequestError, HttpError, JobError) as e:
+                print_exception('An error occurred while performing {} on '
+                                '{}:\n{}'.format(operation, db_obj.name, e))
+                results[db_obj.reference] = ('ERROR', None)
+                continue
+
+            if server.last_job:
+                running[server.last_job] = (db_obj, time())
+            else:
+                results[db_obj.reference] = ('COMPLETED', None)
+
+        for job_ref in running.keys():
+            job_obj = job_watcher.get(job_ref)
+            if job_obj.job_state in ['CANCELED', 'COMPLETED', 'FAILED']:
+                db_obj, started = running.pop(job_ref)
+                job_watcher.forget(job_ref)
+                results[db_obj.reference] = (job_obj.job_state,
+                                             time() - started)
+
+        print_info('{}: {:d} jobs running, {:d} waiting.'.format(
+            engine['hostname'], len(running), len(pending)))
+
+        if running:
+            job_watcher.wait_for_change(float(arguments['--poll']))
+
+    failed = 0
+    print_info('{}: {} of {:d} databases:'.format(engine['hostname'],
+                                                  operation, len(db_objs)))
+    for db_obj in db_objs:
+        job_state, duration = results[db_obj.reference]
+        if duration is None:
+            print_info('  {}: {}'.format(db_obj.name, job_state))
+        else:
+            print_info('  {}: {} in {:.1f} seconds'.format(
+                db_obj.name, job_state, duration))
+        if job_state != 'COMPLETED':
+            failed += 1
+    return failed
+
+
+def list_databases(output_format='text', output=None):
     """
+    Function to list all databases for a given engine. Rows are written as
+    they are produced.
 
-    source_stats_lst = find_all_objects(dx_session_obj.server_session, source)
-    is_dSource = None
-
-    try:
-        for db_stats in find_all_objects(dx_session_obj.server_session,
-                                         consumer):
-
-            source_stats = find_obj_list(source_stats_lst, db_stats.name)
-
-            if source_stats is not None:
-                if source_stats.virtual is False:
-                    is_dSource = 'dSource'
-
-                elif source_stats.virtual is True:
-                    is_dSource = db_stats.parent
-
-                print('name = {}\nprovision container= {}\ndatabase disk '
-                      'usage: {:.2f} GB\nSize of Snapshots: {:.2f} GB\n'
-                      'Enabled: {}\nStatus:{}\n'.format(str(db_stats.name),
-                      str(is_dSource),
-                      db_stats.breakdown.active_space / 1024 / 1024 / 1024,
-                      db_stats.breakdown.sync_space / 1024 / 1024 / 1024,
-                      source_stats.runtime.enabled,
-                      source_stats.runtime.status))
+    output_format (optional): text, csv or json. json writes one object per
+                              line. Default: text
+    output (optional): File object to write to. Default: sys.stdout
+    """
 
-            elif source_stats is None:
-                print('name = {}\nprovision container= {}\ndatabase disk '
-                      'usage: {:.2f} GB\nSize of Snapshots: {:.2f} GB\n'
-                      'Could not find source information. This could be a '
-                      'result of an unlinked object.\n'.format(
-                      str(db_stats.name), str(db_stats.parent),
-                      db_stats.breakdown.active_space / 1024 / 1024 / 1024,
-                      db_stats.breakdown.sync_space / 1024 / 1024 / 1024))
+    output = output or sys.stdout
 
+    if output_format == 'csv':
+        writer = csv.writer(output)
+        writer.writerow(DATABASE_USAGE_KEYS)
+    elif output_format not in ['json', 'text']:
+        raise DlpxException('{} is not a valid output format. Valid formats '
+                            'are text, csv and json.'.format(output_format))
 
+    try:
+        for db_usage in get_database_usage(dx_session_obj.server_session):
+            if output_format == 'csv':
+                writer.writerow([db_usage[key] for key in
+                                 DATABASE_USAGE_KEYS])
+            elif output_format == 'json':
+                output.write('{}\n'.format(json.dumps(db_usage)))
+            elif db_usage['enabled'] is not None:
+                output.write('name = {name}\nprovision container= '
+                             '{provision_container}\ndatabase disk usage: '
+                             '{active_space_gb:.2f} GB\nSize of Snapshots: '
+                             '{snapshot_space_gb:.2f} GB\nEnabled: {enabled}\n'
+                             'Status:{status}\n\n'.format(**db_usage))
+            else:
+                output.write('name = {name}\nprovision container= '
+                             '{provision_container}\ndatabase disk usage: '
+                             '{active_space_gb:.2f} GB\nSize of Snapshots: '
+                             '{snapshot_space_gb:.2f} GB\nCould not find '
+                             'source information. This could be a result of '
+                             'an unlinked object.\n\n'.format(**db_usage))
     except (RequestError, JobError, AttributeError, DlpxException) as e:
         print 'An error occurred while listing databases: {}'.format((e))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine):
     """
@@ -211,6 +266,7 @@ def main_workflow(engine):
 
     thingstodo = ["thingtodo"]
     with dx_session_obj.job_mode(single_thread):
+        job_watcher = JobWatcher(dx_session_obj.server_session)
         while len(dx_session_obj.jobs) > 0 or len(thingstodo) > 0:
             if len(thingstodo)> 0:
 
@@ -227,26 +283,30 @@ def main_workflow(engine):
                     vdb_operation(arguments['--vdb'], 'disable')
 
                 elif arguments['--list']:
-                    list_databases()
+                    list_databases(arguments['--format'])
 
                 elif arguments['--all_dbs']:
-                    try:
-                        assert arguments['--all_dbs'] in 'disable' or \
-                        arguments['--all_dbs'] in 'enable', \
-                        '--all_dbs should be either enable or disable'
-                        all_databases(arguments['--all_dbs'])
-
-                    except AssertionError as e:
-                        print 'ERROR:\n{}\n'.format(e)
+                    if arguments['--all_dbs'] not in ['enable', 'disable']:
+                        print 'ERROR:\n--all_dbs should be either enable or ' \
+                              'disable\n'
                         sys.exit(1)
 
+                    failed = all_databases(engine, arguments['--all_dbs'],
+                                           job_watcher,
+                                           int(arguments['--max_inflight']))
+                    if failed:
+                        raise DlpxException('{}: {} did not complete on {:d} '
+                                            'databases.'.format(
+                                                engine['hostname'],
+                                                arguments['--all_dbs'],
+                                                failed))
+
                 thingstodo.pop()
 
             #get all the jobs, then inspect them
             i = 0
             for j in dx_session_obj.jobs.keys():
-                job_obj = job.get(dx_session_obj.server_session,
-                                  dx_session_obj.jobs[j])
+                job_obj = job_watcher.get(dx_session_obj.jobs[j])
                 print_debug(job_obj)
                 print_info('{}: Operations: {}'.format(engine['hostname'],
                                                        job_obj.job_state))
@@ -264,7 +324,7 @@ def main_workflow(engine):
 
             #If we have running jobs, pause before repeating the checks.
             if len(dx_session_obj.jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
 
 
 def run_job():
@@ -324,11 +384,9 @@ def run_job():
     #run the job against the engine
     threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -361,6 +419,9 @@ def main(arguments):
         engine = None
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -387,6 +448,14 @@ def main(arguments):
                         'Please check the ERROR message:\n{}\n').format(e)
         sys.exit(1)
 
+    except DlpxException as e:
+        """
+        We use this exception handler when an error occurs in a function call.
+        """
+        print_exception('ERROR: Please check the ERROR message below:\n'
+                        '{}'.format(e))
+        sys.exit(2)
+
     except JobError as e:
         """
         We use this exception handler when a job fails in Delphix so that
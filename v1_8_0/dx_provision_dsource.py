@@ -15,14 +15,17 @@ Usage:
     [--engine <identifier> | --all]
     [--debug] [--parallel <n>] [--poll <n>]
     [--config <path_to_file>] [--logdir <path_to_file>]
+    [--cache-ttl <n>] [--profile-api]
   dx_provision_dsource.py --type <name> --dsource_name <name> --ase_user <name> --ase_passwd <name> --backup_path <name> --source_user <name> --stage_user aseadmin --stage_repo ASE1570_S2 --src_config <name> --env_name <name> --dx_group <name> [--bck_file <name>][--create_bckup]
     [--engine <identifier> | --all]
     [--debug] [--parallel <n>] [--poll <n>]
     [--config <path_to_file>] [--logdir <path_to_file>]
+    [--cache-ttl <n>] [--profile-api]
   dx_provision_dsource.py --type <name> --dsource_name <name> --dx_group <name> --db_passwd <name> --db_user <name> --stage_instance <name> --stage_env <name> --backup_path <name> [--backup_loc_passwd <passwd> --backup_loc_user <name> --logsync --load_from_backup]
     [--engine <identifier> | --all]
     [--debug] [--parallel <n>] [--poll <n>]
     [--config <path_to_file>] [--logdir <path_to_file>]
+    [--cache-ttl <n>] [--profile-api]
   dx_provision_dsource.py -h | --help | -v | --version
 
 Create and sync a dSource
@@ -84,6 +87,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -96,7 +104,7 @@ VERSION = 'v.0.2.0016'
 
 import sys
 from os.path import basename
-from time import sleep, time
+from time import time
 from docopt import docopt, DocoptExit
 
 from delphixpy.exceptions import HttpError
@@ -104,11 +112,11 @@ from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
 from delphixpy.web import sourceconfig
 from delphixpy.web import group
-from delphixpy.web import job
 from delphixpy.web import environment
 from delphixpy.web import repository
 #from delphixpy.web.database import link
 from delphixpy.web import database
+from delphixpy.web import source
 from delphixpy.web.vo import OracleSIConfig
 from delphixpy.web.vo import OracleInstance
 from delphixpy.web.vo import LinkParameters
@@ -122,6 +130,7 @@ from delphixpy.web.vo import MSSqlLinkData
 from delphixpy.web.vo import SourcingPolicy
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import invalidate_cache
 from lib.GetReferences import find_obj_by_name
 from lib.GetReferences import find_dbrepo
 from lib.GetReferences import get_running_job
@@ -129,13 +138,20 @@ from lib.DxLogging import logging_est
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
 
-def create_ora_sourceconfig(engine_name, port_num=1521):
+def create_ora_sourceconfig(engine_name, job_watcher, port_num=1521):
     """
     :param ip_addr:
     :param db_name:
+    :param job_watcher: JobWatcher used to wait for the link job
     :return:
     """
     create_ret = None
@@ -179,13 +195,12 @@ def create_ora_sourceconfig(engine_name, port_num=1521):
         print_info('Created and linked the dSource {} with reference {}.\n'.format(
               arguments['--db_name'], create_ret))
         link_job_ref = dx_session_obj.server_session.last_job
-        link_job_obj = job.get(dx_session_obj.server_session,
-                                      link_job_ref)
+        link_job_obj = job_watcher.get(link_job_ref)
         while link_job_obj.job_state not in ["CANCELED", "COMPLETED", "FAILED"]:
-          print_info('Waiting three seconds for link job to complete, and sync to begin')
-          sleep(3)
-          link_job_obj = job.get(dx_session_obj.server_session,
-                                      link_job_ref)
+          print_info('Waiting for link job to complete, and sync to begin')
+          job_watcher.wait_for_change(float(arguments['--poll']))
+          link_job_obj = job_watcher.get(link_job_ref)
+        job_watcher.forget(link_job_ref)
 
         #Add the snapsync job to the jobs dictionary
         dx_session_obj.jobs[engine_name + 'snap'] = get_running_job(
@@ -362,38 +377,6 @@ def link_ase_dsource(engine_name):
             arguments['--dsource_name'], e))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine):
     """
@@ -419,20 +402,25 @@ def main_workflow(engine):
     thingstodo = ["thingtodo"]
     try:
         with dx_session_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dx_session_obj.server_session)
             while (len(dx_session_obj.jobs) > 0 or len(thingstodo)> 0):
                 if len(thingstodo) > 0:
                     if arguments['--type'].lower() == 'oracle':
-                        create_ora_sourceconfig(engine["hostname"])
+                        create_ora_sourceconfig(engine["hostname"],
+                                                job_watcher)
                     elif arguments['--type'].lower() == 'sybase':
                         link_ase_dsource(engine["hostname"])
                     elif arguments['--type'].lower() == 'mssql':
                         link_mssql_dsource(engine["hostname"])
+                    #The new dSource is not in the cached listings.
+                    for f_class in [database, source, sourceconfig]:
+                        invalidate_cache(dx_session_obj.server_session,
+                                         f_class)
                     thingstodo.pop()
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dx_session_obj.jobs.keys():
-                    job_obj = job.get(dx_session_obj.server_session,
-                                      dx_session_obj.jobs[j])
+                    job_obj = job_watcher.get(dx_session_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: Provisioning dSource: {}'.format(
                         engine['hostname'], job_obj.job_state))
@@ -440,6 +428,7 @@ def main_workflow(engine):
                         # If the job is in a non-running state, remove it
                         # from the
                         # running jobs list.
+                        job_watcher.forget(dx_session_obj.jobs[j])
                         del dx_session_obj.jobs[j]
                     elif job_obj.job_state in 'RUNNING':
                         # If the job is in a running state, increment the
@@ -450,7 +439,7 @@ def main_workflow(engine):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dx_session_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
 
     except (HttpError, RequestError, JobError, DlpxException) as e:
         print_exception('ERROR: Could not complete ingesting the source '
@@ -517,11 +506,9 @@ def run_job():
     #run the job against the engine
     threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -554,6 +541,9 @@ def main(argv):
         engine = None
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -27,9 +27,15 @@ Usage:
                   [--vdb_restart <bool> ]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
                   [--postrefresh <name>] [--prerefresh <name>]
                   [--configure-clone <name>]
                   [--prerollback <name>] [--postrollback <name>]
+  dx_provision_db.py --manifest <file> [--max_inflight <n>]
+                  [--engine <identifier> | --all]
+                  [--debug] [--parallel <n>] [--poll <n>]
+                  [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   dx_provision_db.py -h | --help | -v | --version
 Provision VDB from a defined source on the defined target environment.
 
@@ -42,6 +48,8 @@ Examples:
 
   dx_provision_vdb.py --source UF_Source --target appDataVDB --target_grp Untitled --environment LinuxTarget --type vfiles --vfiles_path /mnt/provision/appDataVDB --prerollback "/u01/app/oracle/product/scripts/PreRollback.sh" --postrollback "/u01/app/oracle/product/scripts/PostRollback.sh" --vdb_restart true
 
+  dx_provision_vdb.py --manifest vdbs.csv --max_inflight 4 --all
+
 Options:
   --source_grp <name>       The group where the source resides.
   --source <name>           Name of the source object 
@@ -84,12 +92,28 @@ Options:
   --mntpoint <path>         Mount point for the VDB
                             [default: /mnt/provision]
   --noopen                  Don't open database after provision (Oracle Only)
+  --manifest <file>         CSV or JSON file with one VDB per row. Columns
+                            are the option names above without the leading
+                            dashes (I.E. source, target, target_grp,
+                            environment, type, envinst, db, timestamp).
+                            source, target, target_grp, environment and
+                            type are required. An optional engine column
+                            sends the row to that engine instead of the
+                            one selected with --engine or --all. A .json
+                            file holds a list of objects with the same keys.
+  --max_inflight <n>        Number of provision jobs each engine runs at
+                            the same time in --manifest mode [default: 4]
   --engine <type>           Alt Identifier of Delphix engine in dxtools.conf.
   --all                     Run against all engines.
   --debug                   Enable debug logging
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -100,11 +124,14 @@ Options:
 
 VERSION = 'v.0.2.305'
 
+import csv
+import json
 import signal
 import sys
 import time
 import traceback
 import re
+from collections import deque
 from docopt import docopt
 from os.path import basename
 from time import sleep, time
@@ -145,25 +172,53 @@ from delphixpy.web.vo import AppDataDirectSourceConfig
 
 from lib.DxTimeflow import DxTimeflow
 from lib.DlpxException import DlpxException
+from lib.DxApiProfiler import configure_profiling
+from lib.DxCache import get_index
+from lib.DxCache import invalidate_cache
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.GetReferences import find_dbrepo
 from lib.GetReferences import find_obj_by_name
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_info
 from lib.DxLogging import print_debug
+from lib.DxLogging import print_exception
+
+#Options a --manifest row may set, named without the leading dashes
+MANIFEST_COLUMNS = ['source', 'source_grp', 'target', 'target_grp', 'db',
+                    'vfiles_path', 'no_truncate_log', 'environment', 'type',
+                    'envinst', 'template', 'mapfile', 'timestamp_type',
+                    'timestamp', 'timeflow', 'instname', 'mntpoint', 'noopen',
+                    'uniqname', 'vdb_restart', 'prerefresh', 'postrefresh',
+                    'prerollback', 'postrollback', 'configure-clone']
+MANIFEST_FLAGS = ['no_truncate_log', 'noopen']
+MANIFEST_REQUIRED = ['source', 'target', 'target_grp', 'environment', 'type']
+VDB_TYPES = ['oracle', 'mssql', 'ase', 'vfiles']
 
 
 def create_ase_vdb(engine, server, jobs, vdb_group, vdb_name, environment_obj, 
-                   container_obj):
+                   container_obj, vdb_args=None, existing_dbs=None):
     '''
     Create a Sybase ASE VDB
+    existing_dbs (optional): Dictionary returned by index_databases_by_group,
+                             used instead of listing the group's databases
     '''
-    vdb_obj = find_database_by_name_and_group_name(engine, server, 
-                                                   vdb_group.name, vdb_name)
+    vdb_args = vdb_args or arguments
+
+    if existing_dbs is not None:
+        vdb_obj = existing_dbs.get((vdb_group.reference, vdb_name))
+    else:
+        vdb_obj = find_database_by_name_and_group_name(engine, server, 
+                                                       vdb_group.name,
+                                                       vdb_name)
     if vdb_obj == None:
         vdb_params = ASEProvisionParameters()
         vdb_params.container = ASEDBContainer()
-        if arguments['--no_truncate_log']:
+        if vdb_args['--no_truncate_log']:
             vdb_params.truncate_log_on_checkpoint = False
         else:
             vdb_params.truncate_log_on_checkpoint = True
@@ -171,19 +226,20 @@ def create_ase_vdb(engine, server, jobs, vdb_group, vdb_name, environment_obj,
         vdb_params.container.name = vdb_name
         vdb_params.source = ASEVirtualSource()
         vdb_params.source_config = ASESIConfig()
-        vdb_params.source_config.database_name = arguments['--db']
+        vdb_params.source_config.database_name = vdb_args['--db']
         vdb_params.source_config.instance = ASEInstanceConfig()
         vdb_params.source_config.instance.host = environment_obj.host
 
         vdb_repo = find_dbrepo_by_environment_ref_and_name(engine, server, 
                                                      "ASEInstance", 
                                                      environment_obj.reference,
-                                                     arguments['--envinst'])
+                                                     vdb_args['--envinst'])
 
         vdb_params.source_config.repository = vdb_repo.reference
         vdb_params.timeflow_point_parameters = set_timeflow_point(engine, 
                                                                   server, 
-                                                                  container_obj)
+                                                                  container_obj,
+                                                                  vdb_args)
 
         vdb_params.timeflow_point_parameters.container = container_obj.reference
         print_info("Provisioning " + vdb_name)
@@ -200,7 +256,8 @@ def create_ase_vdb(engine, server, jobs, vdb_group, vdb_name, environment_obj,
 
 
 def create_mssql_vdb(engine, jobs, vdb_group, vdb_name, 
-                     environment_obj, container_obj):
+                     environment_obj, container_obj, vdb_args=None,
+                     existing_dbs=None):
     '''
     Create a MSSQL VDB
     engine:
@@ -209,10 +266,18 @@ def create_mssql_vdb(engine, jobs, vdb_group, vdb_name,
     vdb_name,
     environment_obj:
     container_obj:
+    existing_dbs (optional): Dictionary returned by index_databases_by_group,
+                             used instead of listing the group's databases
     
     '''
-    vdb_obj = find_database_by_name_and_group_name(engine, dx_session_obj.server_session,
-                                                   vdb_group.name, vdb_name)
+    vdb_args = vdb_args or arguments
+
+    if existing_dbs is not None:
+        vdb_obj = existing_dbs.get((vdb_group.reference, vdb_name))
+    else:
+        vdb_obj = find_database_by_name_and_group_name(engine,
+                                                       dx_session_obj.server_session,
+                                                       vdb_group.name, vdb_name)
     if vdb_obj == None:
         vdb_params = MSSqlProvisionParameters()
         vdb_params.container = MSSqlDatabaseContainer()
@@ -221,15 +286,16 @@ def create_mssql_vdb(engine, jobs, vdb_group, vdb_name,
         vdb_params.source = MSSqlVirtualSource()
         vdb_params.source.allow_auto_vdb_restart_on_host_reboot = False
         vdb_params.source_config = MSSqlSIConfig()
-        vdb_params.source_config.database_name = arguments['--db']
+        vdb_params.source_config.database_name = vdb_args['--db']
 
         vdb_params.source_config.repository = find_dbrepo(
             dx_session_obj.server_session, 'MSSqlInstance', environment_obj.reference,
-            arguments['--envinst']).reference
+            vdb_args['--envinst']).reference
 
         vdb_params.timeflow_point_parameters = set_timeflow_point(engine, 
                                                                   dx_session_obj.server_session, 
-                                                                  container_obj)
+                                                                  container_obj,
+                                                                  vdb_args)
         if not vdb_params.timeflow_point_parameters:
             return
         vdb_params.timeflow_point_parameters.container = \
@@ -249,18 +315,26 @@ def create_mssql_vdb(engine, jobs, vdb_group, vdb_name,
 def create_vfiles_vdb(engine, jobs, vfiles_group, vfiles_name, 
                       environment_obj, container_obj, pre_refresh=None,
                       post_refresh=None, pre_rollback=None, 
-                      post_rollback=None, configure_clone=None):
+                      post_rollback=None, configure_clone=None,
+                      vdb_args=None, existing_dbs=None):
     '''
     Create a Vfiles VDB
+    existing_dbs (optional): Dictionary returned by index_databases_by_group.
+                             The VDB then only exists if its group has it.
     '''
+    vdb_args = vdb_args or arguments
+
 
     vfiles_obj = None
 
-    try:
-        vfiles_obj = find_obj_by_name(dx_session_obj.server_session,
-                                      database, vfiles_name)
-    except DlpxException:
-        pass
+    if existing_dbs is not None:
+        vfiles_obj = existing_dbs.get((vfiles_group.reference, vfiles_name))
+    else:
+        try:
+            vfiles_obj = find_obj_by_name(dx_session_obj.server_session,
+                                          database, vfiles_name)
+        except DlpxException:
+            pass
 
     if vfiles_obj is None:
         vfiles_repo = find_repo_by_environment_ref(engine,
@@ -273,18 +347,18 @@ def create_vfiles_vdb(engine, jobs, vfiles_group, vfiles_name,
 
         vdb_restart_reobj = re.compile('true', re.IGNORECASE)
 
-        if vdb_restart_reobj.search(str(arguments['--vdb_restart'])):
+        if vdb_restart_reobj.search(str(vdb_args['--vdb_restart'])):
             vfiles_params.source.allow_auto_vdb_restart_on_host_reboot = True
 
-        elif vdb_restart_reobj.search(str(arguments['--vdb_restart'])) is None:
+        elif vdb_restart_reobj.search(str(vdb_args['--vdb_restart'])) is None:
             vfiles_params.source.allow_auto_vdb_restart_on_host_reboot = False
 
         vfiles_params.container = { 'type': 'AppDataContainer', 
                                     'group': vfiles_group.reference,
                                     'name': vfiles_name }
 
-        vfiles_params.source_config.name = arguments['--target']
-        vfiles_params.source_config.path = arguments['--vfiles_path']
+        vfiles_params.source_config.name = vdb_args['--target']
+        vfiles_params.source_config.path = vdb_args['--vfiles_path']
         vfiles_params.source_config.environment_user = \
                                     environment_obj.primary_user
         vfiles_params.source_config.repository = vfiles_repo.reference
@@ -320,21 +394,21 @@ def create_vfiles_vdb(engine, jobs, vfiles_group, vfiles_name,
                                                  'RunCommandOnSourceOperation',
                                                  'command': configure_clone }]
  
-        if arguments['--timestamp_type'] is None:
+        if vdb_args['--timestamp_type'] is None:
             vfiles_params.timeflow_point_parameters = { 
                                          'type': 'TimeflowPointSemantic',
                                          'container': container_obj.reference,
                                          'location': 'LATEST_POINT'}
 
-        elif arguments['--timestamp_type'].upper() == 'SNAPSHOT':
+        elif vdb_args['--timestamp_type'].upper() == 'SNAPSHOT':
 
             try:
                 dx_timeflow_obj = DxTimeflow(dx_session_obj.server_session)
                 dx_snap_params = dx_timeflow_obj.set_timeflow_point(
                                                 container_obj,
-                                                arguments['--timestamp_type'],
-                                                arguments['--timestamp'],
-                                                arguments['--timeflow'])
+                                                vdb_args['--timestamp_type'],
+                                                vdb_args['--timestamp'],
+                                                vdb_args['--timeflow'])
 
             except RequestError as e:
                 raise DlpxException('Could not set the timeflow point:\n%s' 
@@ -382,25 +456,33 @@ def create_vfiles_vdb(engine, jobs, vfiles_group, vfiles_name,
 def create_oracle_si_vdb(engine, jobs, vdb_name, vdb_group_obj,
                          environment_obj, container_obj, pre_refresh=None,
                          post_refresh=None, pre_rollback=None,
-                         post_rollback=None, configure_clone=None):
+                         post_rollback=None, configure_clone=None,
+                         vdb_args=None, existing_dbs=None):
 
     '''
     Create an Oracle SI VDB
+    existing_dbs (optional): Dictionary returned by index_databases_by_group.
+                             The VDB then only exists if its group has it.
     '''
+    vdb_args = vdb_args or arguments
+
 
     vdb_obj = None
 
-    try:
-        vdb_obj = find_obj_by_name(dx_session_obj.server_session, database, 
-                                   vdb_name)
-    except DlpxException:
-        pass
+    if existing_dbs is not None:
+        vdb_obj = existing_dbs.get((vdb_group_obj.reference, vdb_name))
+    else:
+        try:
+            vdb_obj = find_obj_by_name(dx_session_obj.server_session,
+                                       database, vdb_name)
+        except DlpxException:
+            pass
 
     if vdb_obj == None:
         vdb_params = OracleProvisionParameters()
         vdb_params.open_resetlogs = True
 
-        if arguments['--noopen']:
+        if vdb_args['--noopen']:
             vdb_params.open_resetlogs = False
 
         vdb_params.container = OracleDatabaseContainer()
@@ -409,30 +491,30 @@ def create_oracle_si_vdb(engine, jobs, vdb_name, vdb_group_obj,
         vdb_params.source = OracleVirtualSource()
         vdb_params.source.allow_auto_vdb_restart_on_host_reboot = False
 
-        if arguments['--instname']:
-            inst_name = arguments['--instname']
-        elif arguments['--instname'] == None:
+        if vdb_args['--instname']:
+            inst_name = vdb_args['--instname']
+        elif vdb_args['--instname'] == None:
             inst_name = vdb_name
 
-        if arguments['--uniqname']:
-            unique_name = arguments['--uniqname']
-        elif arguments['--uniqname'] == None:
+        if vdb_args['--uniqname']:
+            unique_name = vdb_args['--uniqname']
+        elif vdb_args['--uniqname'] == None:
             unique_name = vdb_name
 
-        if arguments['--db']:
-            db = arguments['--db']
-        elif arguments['--db'] == None:
+        if vdb_args['--db']:
+            db = vdb_args['--db']
+        elif vdb_args['--db'] == None:
             db = vdb_name
 
-        vdb_params.source.mount_base = arguments['--mntpoint']
+        vdb_params.source.mount_base = vdb_args['--mntpoint']
 
-        if arguments['--mapfile']:
-            vdb_params.source.file_mapping_rules = arguments['--mapfile']
+        if vdb_args['--mapfile']:
+            vdb_params.source.file_mapping_rules = vdb_args['--mapfile']
 
-        if arguments['--template']:
+        if vdb_args['--template']:
                 template_obj = find_obj_by_name(dx_session_obj.server_session,
                                                 database.template, 
-                                                arguments['--template'])
+                                                vdb_args['--template'])
 
                 vdb_params.source.config_template = template_obj.reference
 
@@ -468,7 +550,7 @@ def create_oracle_si_vdb(engine, jobs, vdb_name, vdb_group_obj,
                                                 dx_session_obj.server_session,
                                                 'OracleInstall',
                                                 environment_obj.reference,
-                                                arguments['--envinst'])
+                                                vdb_args['--envinst'])
 
         vdb_params.source_config.database_name = db
         vdb_params.source_config.unique_name = unique_name
@@ -480,8 +562,8 @@ def create_oracle_si_vdb(engine, jobs, vdb_name, vdb_group_obj,
         dx_timeflow_obj = DxTimeflow(dx_session_obj.server_session)
         vdb_params.timeflow_point_parameters = \
                dx_timeflow_obj.set_timeflow_point(container_obj,
-                                                  arguments['--timestamp_type'],
-                                                  arguments['--timestamp'])
+                                                  vdb_args['--timestamp_type'],
+                                                  vdb_args['--timestamp'])
 
         print vdb_params, '\n\n\n'
         print_info(engine["hostname"] + ": Provisioning " + vdb_name)
@@ -514,6 +596,15 @@ def find_all_databases_by_group_name(engine, server, group_name,
         return databases
 
 
+def index_databases_by_group(server):
+    """
+    Return a dictionary of (group reference, name) to database object, built
+    from one listing of the engine's databases
+    """
+    return dict(((db_obj.group, db_obj.name), db_obj) for db_obj in
+                get_index(server, database).objects)
+
+
 def find_database_by_name_and_group_name(engine, server, group_name, 
                                          database_name):
 
@@ -543,7 +634,7 @@ def find_dbrepo_by_environment_ref_and_install_path(engine, server,
                 (engine['hostname'], install_type, f_environment_ref,
                 f_install_path), debug)
 
-    for obj in repository.get_all(server, environment=f_environment_ref):
+    for obj in find_repos_by_environment_ref(server, f_environment_ref):
         if install_type == 'PgSQLInstall':
             if (obj.type == install_type and
                 obj.installation_path == f_install_path):
@@ -576,8 +667,8 @@ def find_repo_by_environment_ref(engine, repo_type, f_environment_ref,
                 (engine['hostname'], repo_type, f_environment_ref), debug)
 
     obj_ref = ''
-    all_objs = repository.get_all(dx_session_obj.server_session,
-                                  environment=f_environment_ref)
+    all_objs = find_repos_by_environment_ref(dx_session_obj.server_session,
+                                             f_environment_ref)
 
     for obj in all_objs:
         if obj.name == repo_type:
@@ -594,6 +685,16 @@ def find_repo_by_environment_ref(engine, repo_type, f_environment_ref,
                         engine['hostname'], repo_type))
 
 
+def find_repos_by_environment_ref(server, f_environment_ref):
+    '''
+    Return the repositories of an environment. The repositories of an engine
+    are listed once and filtered here, so provisioning many VDBs does not
+    list them again for each VDB.
+    '''
+    return [obj for obj in get_index(server, repository).objects
+            if obj.environment == f_environment_ref]
+
+
 def find_dbrepo_by_environment_ref_and_name(engine, repo_type, 
                                             f_environment_ref, f_name):
     '''
@@ -608,7 +709,8 @@ def find_dbrepo_by_environment_ref_and_name(engine, repo_type,
                 debug)
 
     obj_ref = ''
-    all_objs = repository.get_all(server, environment=f_environment_ref)
+    all_objs = find_repos_by_environment_ref(dx_session_obj.server_session,
+                                             f_environment_ref)
 
     for obj in all_objs:
         if (repo_type == 'MSSqlInstance' or repo_type == 'ASEInstance'):
@@ -640,7 +742,7 @@ def find_snapshot_by_database_and_name(engine, database_obj, snap_name):
                                  database=database_obj.reference)
     matches = []
     for snapshot_obj in snapshots:
-        if str(snapshot_obj.name).startswith(arguments['--timestamp']):
+        if str(snapshot_obj.name).startswith(snap_name):
             matches.append(snapshot_obj)
 
     for each in matches:
@@ -667,7 +769,7 @@ def find_snapshot_by_database_and_time(engine, database_obj, snap_time):
     matches = []
 
     for snapshot_obj in snapshots:
-        if str(snapshot_obj.latest_change_point.timestamp).startswith(arguments['--timestamp']):
+        if str(snapshot_obj.latest_change_point.timestamp).startswith(snap_time):
 
             matches.append(snapshot_obj)
 
@@ -706,36 +808,74 @@ def find_source_by_database(engine, database_obj):
     return source_obj
 
 
-def run_async(func):
+def load_manifest(manifest_path):
     """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
+    Read the VDBs to provision from a CSV or JSON manifest.
+    Return a list of tuples of the engine named in the row (None if the row
+    does not name one) and the arguments of the row. Options a row leaves
+    empty keep their value from the command line.
+
+    manifest_path: Path to the manifest. Files ending in .json are read as
+                   JSON, everything else as CSV.
     """
-    from threading import Thread
-    from functools import wraps
 
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
+    try:
+        with open(manifest_path, 'rb') as manifest_file:
+            if manifest_path.lower().endswith('.json'):
+                manifest = json.load(manifest_file)
+            else:
+                manifest = list(csv.DictReader(manifest_file))
+    except (IOError, ValueError, csv.Error) as e:
+        raise DlpxException('Could not read the manifest %s:\n%s' %
+                            (manifest_path, e))
+
+    if not isinstance(manifest, list):
+        raise DlpxException('The manifest %s must contain a list of VDBs.' %
+                            (manifest_path))
+
+    manifest_rows = []
+    for row_num, row in enumerate(manifest, 1):
+        if not isinstance(row, dict) or None in row:
+            raise DlpxException('Row %s of %s does not match the manifest '
+                                'columns.' % (row_num, manifest_path))
+        engine_name = None
+        row_args = dict(arguments)
+
+        for column, value in row.items():
+            column = column.strip().lower()
+            if isinstance(value, basestring):
+                value = value.strip()
+            if value is None or value == '':
+                continue
+
+            if column == 'engine':
+                engine_name = value
+            elif column not in MANIFEST_COLUMNS:
+                raise DlpxException('Row %s of %s has an unknown column %s.' %
+                                    (row_num, manifest_path, column))
+            elif column in MANIFEST_FLAGS:
+                row_args['--' + column] = str(value).lower() in ['true',
+                                                                 'yes', '1']
+            elif isinstance(value, basestring):
+                row_args['--' + column] = value
+            else:
+                row_args['--' + column] = str(value)
+
+        missing = [column for column in MANIFEST_REQUIRED if
+                   not row_args['--' + column]]
+        if missing:
+            raise DlpxException('Row %s of %s is missing %s.' %
+                                (row_num, manifest_path, ', '.join(missing)))
+
+        row_args['--type'] = row_args['--type'].lower()
+        if row_args['--type'] not in VDB_TYPES:
+            raise DlpxException('Row %s of %s has a type of %s. Valid types '
+                                'are %s.' % (row_num, manifest_path,
+                                             row_args['--type'],
+                                             ', '.join(VDB_TYPES)))
+        manifest_rows.append((engine_name, row_args))
 
-    return async_func
+    return manifest_rows
 
 
 @run_async
@@ -788,6 +928,7 @@ def main_workflow(engine):
 
     try:
         with dx_session_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dx_session_obj.server_session)
             while (len(jobs) > 0 or len(thingstodo) > 0):
                 arg_type = arguments['--type'].lower()
                 if len(thingstodo)> 0:
@@ -822,12 +963,15 @@ def main_workflow(engine):
                                           arguments['--postrollback'],
                                           arguments['--configure-clone'])
 
+                    #The new VDB is not in the cached database listing.
+                    invalidate_cache(dx_session_obj.server_session, database)
+                    invalidate_cache(dx_session_obj.server_session, source)
                     thingstodo.pop()
 
                 #get all the jobs, then inspect them 
                 i = 0
                 for j in jobs.keys():
-                    job_obj = job.get(dx_session_obj.server_session, jobs[j])
+                    job_obj = job_watcher.get(jobs[j])
                     print_debug(job_obj, debug)
                     print_info(engine["hostname"] + ": VDB Provision: " + 
                                job_obj.job_state)
@@ -846,13 +990,176 @@ def main_workflow(engine):
 
                 #If we have running jobs, pause before repeating the checks.
                 if len(jobs) > 0:
-                    sleep(float(arguments['--poll']))
+                    job_watcher.wait_for_change(float(arguments['--poll']))
 
     except (DlpxException, JobError) as e:
         print '\nError while provisioning %s:\n%s' % (database_name, e.message)
         sys.exit(1)
 
 
+def submit_manifest_row(engine, row_args, group_obj, environment_obj,
+                        source_obj, existing_dbs=None):
+    """
+    Start the provision of one manifest row and return the reference of its
+    job, or None if no job was started.
+
+    engine: Dictionary containing engine information
+    row_args: Arguments of the row, as returned by load_manifest
+    group_obj, environment_obj, source_obj: Objects named by the row
+    existing_dbs (optional): Dictionary returned by index_databases_by_group
+    """
+
+    jobs = {}
+    vdb_name = row_args['--target']
+
+    if row_args['--type'] == 'oracle':
+        create_oracle_si_vdb(engine, jobs, vdb_name, group_obj,
+                             environment_obj, source_obj,
+                             row_args['--prerefresh'],
+                             row_args['--postrefresh'],
+                             row_args['--prerollback'],
+                             row_args['--postrollback'],
+                             row_args['--configure-clone'],
+                             vdb_args=row_args, existing_dbs=existing_dbs)
+
+    elif row_args['--type'] == 'ase':
+        create_ase_vdb(engine, dx_session_obj.server_session, jobs,
+                       group_obj, vdb_name, environment_obj, source_obj,
+                       vdb_args=row_args, existing_dbs=existing_dbs)
+
+    elif row_args['--type'] == 'mssql':
+        create_mssql_vdb(engine, jobs, group_obj, vdb_name, environment_obj,
+                         source_obj, vdb_args=row_args,
+                         existing_dbs=existing_dbs)
+
+    elif row_args['--type'] == 'vfiles':
+        create_vfiles_vdb(engine, jobs, group_obj, vdb_name,
+                          environment_obj, source_obj,
+                          row_args['--prerefresh'],
+                          row_args['--postrefresh'],
+                          row_args['--prerollback'],
+                          row_args['--postrollback'],
+                          row_args['--configure-clone'],
+                          vdb_args=row_args, existing_dbs=existing_dbs)
+
+    return jobs.get(engine['hostname'])
+
+
+@run_async
+def manifest_workflow(engine, manifest_rows):
+    """
+    Provision the VDBs of a manifest on one engine, keeping up to
+    --max_inflight provision jobs running at a time. The groups,
+    environments and sources named by the rows are looked up once per
+    engine.
+
+    engine: Dictionary containing engine information
+    manifest_rows: List of row arguments returned by load_manifest
+    """
+
+    max_inflight = int(arguments['--max_inflight'])
+    pending = deque()
+    inflight = {}
+    results = {}
+
+    dx_session_obj.serversess(engine['ip_address'], engine['username'],
+                              engine['password'])
+    server = dx_session_obj.server_session
+    existing_dbs = index_databases_by_group(server)
+
+    #Results are keyed by group and name, as a name can be reused in
+    # another group.
+    for row_args in manifest_rows:
+        vdb_name = row_args['--target']
+        row_key = (row_args['--target_grp'], vdb_name)
+        try:
+            group_obj = find_obj_by_name(server, group,
+                                         row_args['--target_grp'])
+            if (group_obj.reference, vdb_name) in existing_dbs:
+                print_info('%s: %s already exists in %s.' %
+                           (engine['hostname'], vdb_name,
+                            row_args['--target_grp']))
+                results[row_key] = ('EXISTS', None)
+                continue
+            pending.append((row_args, group_obj,
+                            find_obj_by_name(server, environment,
+                                             row_args['--environment']),
+                            find_obj_by_name(server, database,
+                                             row_args['--source'])))
+        except DlpxException as e:
+            print_exception('%s: Cannot provision %s:\n%s' %
+                            (engine['hostname'], vdb_name, e))
+            results[row_key] = ('NOT STARTED', None)
+
+    try:
+        with dx_session_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(server)
+            while pending or inflight:
+                #Top the window up before waiting on the running jobs.
+                while pending and len(inflight) < max_inflight:
+                    row_objs = pending.popleft()
+                    vdb_name = row_objs[0]['--target']
+                    row_key = (row_objs[0]['--target_grp'], vdb_name)
+                    try:
+                        job_ref = submit_manifest_row(
+                            engine, *row_objs, existing_dbs=existing_dbs)
+                    except (DlpxException, HttpError, RequestError,
+                            JobError) as e:
+                        print_exception('%s: Cannot provision %s:\n%s' %
+                                        (engine['hostname'], vdb_name, e))
+                        job_ref = None
+
+                    if job_ref is None:
+                        results[row_key] = ('NOT STARTED', None)
+                    else:
+                        inflight[job_ref] = (row_key, time())
+
+                for job_ref in inflight.keys():
+                    job_obj = job_watcher.get(job_ref)
+                    print_debug(job_obj, debug)
+                    if job_obj.job_state in ['CANCELED', 'COMPLETED',
+                                             'FAILED']:
+                        row_key, submitted = inflight.pop(job_ref)
+                        job_watcher.forget(job_ref)
+                        results[row_key] = (job_obj.job_state,
+                                             time() - submitted)
+                        print_info('%s: Provision of %s %s' %
+                                   (engine['hostname'], row_key[1],
+                                    job_obj.job_state))
+
+                print_info('%s: %s jobs running, %s waiting.' %
+                           (engine['hostname'], len(inflight), len(pending)))
+
+                if inflight:
+                    job_watcher.wait_for_change(float(arguments['--poll']))
+    finally:
+        #The new VDBs are not in the database listing read at the start.
+        invalidate_cache(server, database)
+        invalidate_cache(server, source)
+
+    print_info('%s: Provisioned %s of %s VDBs:' %
+               (engine['hostname'], len([state for state, _ in
+                                         results.values() if
+                                         state == 'COMPLETED']),
+                len(manifest_rows)))
+    failed = []
+    for row_args in manifest_rows:
+        vdb_name = row_args['--target']
+        state, duration = results[(row_args['--target_grp'], vdb_name)]
+        if duration is None:
+            print_info('  %s: %s' % (vdb_name, state))
+        else:
+            print_info('  %s: %s in %.1f minutes' % (vdb_name, state,
+                                                     duration / 60))
+        if state not in ['COMPLETED', 'EXISTS']:
+            failed.append(vdb_name)
+
+    if failed:
+        raise DlpxException('%s: %s VDBs were not provisioned: %s' %
+                            (engine['hostname'], len(failed),
+                             ', '.join(failed)))
+
+
 def run_job():
     """
     This function runs the main_workflow aynchronously against all the servers 
@@ -913,11 +1220,58 @@ def run_job():
         #run the job against the engine
         threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete 
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
+
+
+def run_manifest():
+    """
+    Provision the VDBs in --manifest. Each engine gets its own
+    manifest_workflow, so engines provision in parallel. Rows without an
+    engine column go to the engine selected with --engine, every engine
+    with --all, otherwise the default engine in dxtools.conf.
+    """
+
+    if arguments['--all']:
+        default_engines = dx_session_obj.dlpx_engines.keys()
+    elif arguments['--engine']:
+        default_engines = [arguments['--engine']]
+    else:
+        default_engines = [name for name, engine in
+                           dx_session_obj.dlpx_engines.items() if
+                           engine['default'] == 'true'][:1]
+
+    engine_rows = {}
+    for engine_name, row_args in load_manifest(arguments['--manifest']):
+        if engine_name is None and not default_engines:
+            raise DlpxException('\nERROR: %s does not have an engine and '
+                                'no default engine was found. Exiting' %
+                                (row_args['--target']))
+        for name in [engine_name] if engine_name else default_engines:
+            if name not in dx_session_obj.dlpx_engines:
+                raise DlpxException('\nERROR: Delphix Engine %s cannot be '
+                                    'found in %s. Please check your value '
+                                    'and try again. Exiting.\n' %
+                                    (name, config_file_path))
+            rows = engine_rows.setdefault(name, [])
+            if row_args['--target'] in [each['--target'] for each in rows]:
+                raise DlpxException('\nERROR: %s is listed more than once '
+                                    'for engine %s in %s. Exiting.\n' %
+                                    (row_args['--target'], name,
+                                     arguments['--manifest']))
+            rows.append(row_args)
+
+    threads = []
+    for name, rows in engine_rows.items():
+        print_info('Provisioning %s VDBs on Delphix Engine: %s' %
+                   (len(rows), name))
+        threads.append(manifest_workflow(dx_session_obj.dlpx_engines[name],
+                                         rows))
+
+    #Wait for every engine to finish. A failure in any of them is reported
+    # and re-raised here.
+    wait_all(threads)
 
 
 def serversess(f_engine_address, f_engine_username, f_engine_password):
@@ -936,13 +1290,15 @@ def set_exit_handler(func):
     signal.signal(signal.SIGTERM, func)
 
 
-def set_timeflow_point(engine, server, container_obj):
+def set_timeflow_point(engine, server, container_obj, vdb_args=None):
     """
     This returns the reference of the timestamp specified.
     """
+    vdb_args = vdb_args or arguments
 
-    if arguments['--timestamp_type'].upper() == "SNAPSHOT":
-        if arguments['--timestamp'].upper() == "LATEST":
+
+    if vdb_args['--timestamp_type'].upper() == "SNAPSHOT":
+        if vdb_args['--timestamp'].upper() == "LATEST":
             print_debug('%s: Using the latest Snapshot.' % 
                         (engine['hostname']), debug)
 
@@ -950,13 +1306,13 @@ def set_timeflow_point(engine, server, container_obj):
             timeflow_point_parameters.container = container_obj.reference
             timeflow_point_parameters.location = "LATEST_SNAPSHOT"
 
-        elif arguments['--timestamp'].startswith("@"):
+        elif vdb_args['--timestamp'].startswith("@"):
             print_debug('%s: Using a named snapshot' % (engine['hostname']),
                         debug)
 
-            snapshot_obj = find_snapshot_by_database_and_name(engine, server, 
+            snapshot_obj = find_snapshot_by_database_and_name(engine,
                                                      container_obj, 
-                                                     arguments['--timestamp'])
+                                                     vdb_args['--timestamp'])
 
             if snapshot_obj != None:
                 timeflow_point_parameters=TimeflowPointLocation()
@@ -968,16 +1324,16 @@ def set_timeflow_point(engine, server, container_obj):
                 raise DlpxException('%s: Was unable to use the specified '
                                     'snapshot %s for database %s\n' % 
                                     (engine['hostname'],
-                                    arguments['--timestamp'],
+                                    vdb_args['--timestamp'],
                                     container_obj.name))
 
         else:
             print_debug('%s: Using a time-designated snapshot' %
                         (engine['hostname']), debug)
 
-            snapshot_obj = find_snapshot_by_database_and_time(engine, server, 
+            snapshot_obj = find_snapshot_by_database_and_time(engine,
                                                      container_obj, 
-                                                     arguments['--timestamp'])
+                                                     vdb_args['--timestamp'])
             if snapshot_obj != None:
                 timeflow_point_parameters=TimeflowPointTimestamp()
                 timeflow_point_parameters.timeflow = snapshot_obj.timeflow
@@ -987,11 +1343,11 @@ def set_timeflow_point(engine, server, container_obj):
                 raise DlpxException('%s: Was unable to find a suitable time '
                                     ' for %s for database %s.\n' %
                                     (engine['hostname'],
-                                    arguments['--timestamp'],
+                                    vdb_args['--timestamp'],
                                     container_obj.name))
 
-    elif arguments['--timestamp_type'].upper() == "TIME":
-        if arguments['--timestamp'].upper() == "LATEST":
+    elif vdb_args['--timestamp_type'].upper() == "TIME":
+        if vdb_args['--timestamp'].upper() == "LATEST":
             timeflow_point_parameters = TimeflowPointSemantic()
             timeflow_point_parameters.location = "LATEST_POINT"
         else:
@@ -1001,7 +1357,7 @@ def set_timeflow_point(engine, server, container_obj):
 
     else:
         raise DlpxException('%s is not a valied timestamp_type. Exiting\n' %
-                            (arguments['--timestamp_type']))
+                            (vdb_args['--timestamp_type']))
 
     timeflow_point_parameters.container = container_obj.reference
     return timeflow_point_parameters
@@ -1059,6 +1415,9 @@ def main(argv):
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
 
         print_info('Welcome to %s version %s' % (basename(__file__), 
                    VERSION))
@@ -1072,7 +1431,10 @@ def main(argv):
 
         #This is the function that will handle processing main_workflow for 
         # all the servers.
-        run_job()
+        if arguments['--manifest']:
+            run_manifest()
+        else:
+            run_job()
         
         elapsed_minutes = time_elapsed()
         print_info('script took %s minutes to get this far. ' %
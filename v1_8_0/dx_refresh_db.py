@@ -9,12 +9,13 @@
 #this doc to also define our arguments for the script. This thing is brilliant.
 """Refresh a vdb
 Usage:
-  dx_refresh_db.py (--name <name> | --dsource <name> | --all_vdbs [--group_name <name>]| --host <name> | --list_timeflows | --list_snapshots)
-                   [--timestamp_type <type>]
+  dx_refresh_db.py (--name <name> | --dsource <name> | --all_vdbs [--group_name <name>]| --host <name> | --pipeline <name> | --list_timeflows | --list_snapshots)
+                   [--timestamp_type <type>] [--format <type>]
                    [--timestamp <timepoint_semantic> --timeflow <timeflow>]
                    [-d <identifier> | --engine <identifier> | --all]
                    [--debug] [--parallel <n>] [--poll <n>]
                    [--config <path_to_file>] [--logdir <path_to_file>]
+                   [--cache-ttl <n>] [--profile-api]
   dx_refresh_db.py -h | --help | -v | --version
 Refresh a Delphix VDB
 Examples:
@@ -22,12 +23,21 @@ Examples:
   dx_refresh_db.py --dsource "dlpxdb1"
   dx_refresh_db.py --all_vdbs --host LINUXSOURCE --parallel 4 --debug -d landsharkengine
   dx_refresh_db.py --all_vdbs --group_name "Analytics" --all
+  dx_refresh_db.py --pipeline "dlpxdb1,dlpxdb2" --parallel 4
 Options:
   --name <name>             Name of the object you are refreshing.
   --all_vdbs                Refresh all VDBs that meet the filter criteria.
   --dsource <name>          Name of dsource in Delphix to execute against.
+  --pipeline <name>         Comma-separated list of dSources. Snapshot each
+                            dSource, then refresh the VDBs provisioned from
+                            it as soon as its snapshot completes. The VDBs
+                            are refreshed from the new snapshot. --parallel
+                            limits the jobs running on an engine at a time.
   --group_name <name>       Name of the group to execute against.
   --list_timeflows          List all timeflows
+  --format <type>           Output format of --list_timeflows.
+                            Acceptable Values: text, csv, json
+                            [default: text]
   --list_snapshots          List all snapshots
   --host <name>             Name of environment in Delphix to execute against.
   --timestamp_type <type>   The type of timestamp you are specifying.
@@ -50,6 +60,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>   The path to the logfile you want to use.
@@ -67,7 +82,8 @@ from os.path import basename
 import sys
 import traceback
 import json
-from time import sleep, time
+from collections import deque
+from time import time
 
 from delphixpy.v1_8_0.delphix_engine import DelphixEngine
 from delphixpy.v1_8_0.exceptions import HttpError
@@ -81,6 +97,8 @@ from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web import source
 from delphixpy.v1_8_0.web import timeflow
 from delphixpy.v1_8_0.web.snapshot import snapshot
+from delphixpy.v1_8_0.web.vo import ASENewBackupSyncParameters
+from delphixpy.v1_8_0.web.vo import MSSqlSyncParameters
 from delphixpy.v1_8_0.web.vo import OracleRefreshParameters
 from delphixpy.v1_8_0.web.vo import RefreshParameters
 from delphixpy.v1_8_0.web.vo import TimeflowPointLocation
@@ -88,7 +106,16 @@ from delphixpy.v1_8_0.web.vo import TimeflowPointSemantic
 from delphixpy.v1_8_0.web.vo import TimeflowPointTimestamp
 
 from lib.DlpxException import DlpxException
+from lib.DxTimeflow import DxTimeflow
+from lib.DxApiProfiler import configure_profiling
+from lib.DxApiProfiler import instrument_engine
+from lib.DxCache import get_index
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.GetReferences import find_obj_by_name
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_info
@@ -96,37 +123,6 @@ from lib.DxLogging import print_debug
 from lib.DxLogging import print_exception
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-    
 
 def find_all_databases_by_dsource_name(engine, server, dsource_name, 
                                        exclude_js_container=True):
@@ -455,7 +451,7 @@ def main_workflow(engine):
         databases = database.get_all(server, no_js_container_data_source=True)
 
     elif arguments['--list_timeflows']:
-        list_timeflows(server)
+        list_timeflows(server, arguments['--format'])
 
     elif arguments['--list_snapshots']:
         list_snapshots(server)
@@ -463,6 +459,7 @@ def main_workflow(engine):
     #reset the running job count before we begin
     i = 0
     with job_mode(server):
+        job_watcher = JobWatcher(server)
         #While there are still running jobs or databases still to process....
 
         while (len(jobs) > 0 or len(databases) > 0):
@@ -510,13 +507,179 @@ def main_workflow(engine):
                 print_info(engine["hostname"] + ": Max jobs reached (" + 
                            str(i) + ")")
 
-            i = update_jobs_dictionary(engine, server, jobs)
+            i = update_jobs_dictionary(engine, job_watcher, jobs)
             print_info(engine["hostname"] + ": " + str(i) + " jobs running. " +
                        str(len(databases)) + " jobs waiting to run")
 
             #If we have running jobs, pause before repeating the checks.
             if len(jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
+
+def snapshot_dsource(engine, server, source_obj, dsource_obj):
+    """
+    Snapshot a dSource, taking a new backup for MSSQL and ASE dSources.
+    Return the job reference, or None if the dSource cannot be snapshot.
+    engine: Dictionary of the engine from dxtools.conf
+    server: Delphix Engine object
+    source_obj: Source of the dSource
+    dsource_obj: dSource database object
+    """
+
+    if source_obj.virtual or source_obj.staging:
+        print_warning(engine["hostname"] + ": " + dsource_obj.name + 
+                      " is not a dSource. Skipping.")
+        return
+
+    elif source_obj.runtime.enabled != "ENABLED":
+        print_warning(engine["hostname"] + ": " + dsource_obj.name + 
+                      " is not enabled. Skipping sync")
+        return
+
+    print_info(engine["hostname"] + ": Syncing " + dsource_obj.name)
+    if source_obj.type == "MSSqlLinkedSource":
+        sync_params = MSSqlSyncParameters()
+        sync_params.load_from_backup = False
+        database.sync(server, dsource_obj.reference, sync_params)
+    elif source_obj.type == "ASELinkedSource":
+        database.sync(server, dsource_obj.reference,
+                      ASENewBackupSyncParameters())
+    else:
+        database.sync(server, dsource_obj.reference)
+    DxTimeflow(server).invalidate_snapshots()
+    return server.last_job
+
+
+@run_async
+def pipeline_workflow(engine):
+    """
+    Snapshot the dSources given with --pipeline and refresh the VDBs
+    provisioned from each one as soon as its snapshot completes, instead of
+    waiting for every snapshot to finish first. At most --parallel jobs run
+    on the engine at a time.
+    engine: Dictionary of the engine from dxtools.conf
+    """
+
+    max_jobs = int(arguments['--parallel'] or 0)
+    server = serversess(engine["ip_address"], engine["username"],
+                        engine["password"])
+    #The runtime states checked below must be current, so the databases and
+    # sources are downloaded again rather than served from the cache.
+    db_index = get_index(server, database, refresh=True)
+    source_index = get_index(server, source, refresh=True)
+
+    dsource_objs = []
+    for dsource_name in arguments['--pipeline'].split(','):
+        dsource_obj = db_index.by_name.get(dsource_name.strip())
+        if dsource_obj is None:
+            raise DlpxException('%s: dSource %s was not found.' %
+                                (engine["hostname"], dsource_name.strip()))
+        dsource_objs.append(dsource_obj)
+
+    #Each task is the job kind, the database and the dSource it came from.
+    tasks = deque([('snapshot', dsource_obj, None) for dsource_obj in
+                   dsource_objs])
+    children = {}
+    running = {}
+    results = []
+
+    with job_mode(server):
+        job_watcher = JobWatcher(server)
+        while tasks or running:
+            while tasks and (not max_jobs or len(running) < max_jobs):
+                kind, database_obj, dsource_obj = tasks.popleft()
+                source_objs = source_index.by_container.get(
+                    database_obj.reference)
+                if not source_objs:
+                    print_error(engine["hostname"] + 
+                                ": Did not find a source for " + 
+                                database_obj.name)
+                    results.append((kind, database_obj.name, 'NOT STARTED',
+                                    None))
+                    continue
+
+                #A database that cannot be started is reported and the
+                # pipeline carries on with the others.
+                try:
+                    if kind == 'snapshot':
+                        job_ref = snapshot_dsource(engine, server,
+                                                   source_objs[0],
+                                                   database_obj)
+                        if job_ref:
+                            #List the children while the snapshot runs.
+                            children[database_obj.reference] = \
+                                database.get_all(
+                                    server,
+                                    provision_container=database_obj.reference,
+                                    no_js_container_data_source=True)
+                    else:
+                        timeflow_point_parameters = TimeflowPointSemantic()
+                        timeflow_point_parameters.container = \
+                                                    dsource_obj.reference
+                        timeflow_point_parameters.location = "LATEST_SNAPSHOT"
+                        job_ref = refresh_database(engine, server, {},
+                                                   source_objs[0],
+                                                   database_obj, dsource_obj,
+                                                   timeflow_point_parameters)
+                except (HttpError, JobError) as e:
+                    print_error(engine["hostname"] + ": " + 
+                                kind.capitalize() + " of " + 
+                                database_obj.name + " failed: " + str(e))
+                    results.append((kind, database_obj.name, 'FAILED', None))
+                    continue
+
+                if job_ref:
+                    running[job_ref] = (kind, database_obj, time())
+                else:
+                    results.append((kind, database_obj.name, 'NOT STARTED',
+                                    None))
+
+            for job_ref in running.keys():
+                job_obj = job_watcher.get(job_ref)
+                if job_obj.job_state not in ["CANCELED", "COMPLETED",
+                                             "FAILED"]:
+                    continue
+
+                kind, database_obj, started = running.pop(job_ref)
+                job_watcher.forget(job_ref)
+                results.append((kind, database_obj.name, job_obj.job_state,
+                                time() - started))
+                print_info(engine["hostname"] + ": " + kind.capitalize() + 
+                           " of " + database_obj.name + ": " + 
+                           job_obj.job_state)
+
+                if kind == 'snapshot':
+                    vdb_objs = children.pop(database_obj.reference, [])
+                    if job_obj.job_state == "COMPLETED":
+                        tasks.extend(('refresh', vdb_obj, database_obj) for
+                                     vdb_obj in vdb_objs)
+                    else:
+                        results.extend(('refresh', vdb_obj.name, 'SKIPPED',
+                                        None) for vdb_obj in vdb_objs)
+
+            print_info(engine["hostname"] + ": " + str(len(running)) + 
+                       " jobs running. " + str(len(tasks)) + 
+                       " jobs waiting to run")
+
+            if running:
+                job_watcher.wait_for_change(float(arguments['--poll']))
+
+    failed = []
+    print_info(engine["hostname"] + ": Pipeline summary:")
+    for kind, obj_name, job_state, duration in results:
+        if duration is None:
+            print_info("  %s %s: %s" % (kind, obj_name, job_state))
+        else:
+            print_info("  %s %s: %s in %.1f minutes" % (kind, obj_name,
+                                                        job_state,
+                                                        duration / 60))
+        if job_state != "COMPLETED":
+            failed.append(obj_name)
+
+    if failed:
+        raise DlpxException('%s: %s jobs did not complete: %s' %
+                            (engine["hostname"], len(failed),
+                             ', '.join(failed)))
+
 
 def print_error(print_obj):
     """
@@ -534,7 +697,8 @@ def print_warning(print_obj):
     logging.warning(str(print_obj))
 
 
-def refresh_database(engine, server, jobs, source_obj, container_obj):
+def refresh_database(engine, server, jobs, source_obj, container_obj,
+                     source_db=None, timeflow_point_parameters=None):
     """
     This function actually performs the refresh
     engine:
@@ -542,6 +706,10 @@ def refresh_database(engine, server, jobs, source_obj, container_obj):
     jobs: list containing running jobs
     source_obj: source object used to refresh from snapshot or timeflow
     container_obj: VDB container
+    source_db (optional): The database the VDB was provisioned from, if the
+                          caller already has it
+    timeflow_point_parameters (optional): Point to refresh from. Default:
+                          the point given by --timestamp
     """
 
     #Sanity check to make sure our source object has a reference
@@ -558,7 +726,9 @@ def refresh_database(engine, server, jobs, source_obj, container_obj):
 
         #Ensure the source is enabled. We can't refresh disabled databases.
         elif source_obj.runtime.enabled == "ENABLED" :
-            source_db = database.get(server, container_obj.provision_container)
+            if source_db is None:
+                source_db = database.get(server,
+                                         container_obj.provision_container)
             if not source_db:
                 print_error(engine["hostname"] + 
                             ":Was unable to retrieve the source container for "
@@ -577,15 +747,18 @@ def refresh_database(engine, server, jobs, source_obj, container_obj):
                 refresh_params = RefreshParameters()
             
             try:
-                refresh_params.timeflow_point_parameters = set_timeflow_point(
-                                                           engine, server, 
-                                                           source_db)
+                if timeflow_point_parameters is None:
+                    timeflow_point_parameters = set_timeflow_point(
+                                                engine, server, source_db)
+                refresh_params.timeflow_point_parameters = \
+                                                timeflow_point_parameters
                 print_debug(engine["hostname"] + ":" + str(refresh_params))
 
                 #Sync it
                 database.refresh(server, container_obj.reference, 
                                  refresh_params)
                 jobs[container_obj] = server.last_job
+                DxTimeflow(server).invalidate_snapshots()
 
             except RequestError as e:
                 print '\nERROR: Could not set timeflow point:\n%s\n' % (
@@ -615,6 +788,7 @@ def run_job(engine):
 
     #Create an empty list to store threads we create.
     threads = []
+    workflow = pipeline_workflow if arguments['--pipeline'] else main_workflow
     #If the --all argument was given, run against every engine in dxtools.conf
 
     if arguments['--all']:
@@ -624,7 +798,7 @@ def run_job(engine):
         for delphix_engine in dxtools_objects:
             engine = dxtools_objects[delphix_engine]
             #Create a new thread and add it to the list.
-            threads.append(main_workflow(engine))
+            threads.append(workflow(engine))
 
     else:
         #Else if the --engine argument was given, test to see if the engine 
@@ -666,13 +840,11 @@ def run_job(engine):
                 print_error("No default engine found. Exiting")
                 sys.exit(1)
         #run the job against the engine
-        threads.append(main_workflow(engine))
+        threads.append(workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete 
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def serversess(f_engine_address, f_engine_username, f_engine_password):
@@ -681,36 +853,17 @@ def serversess(f_engine_address, f_engine_username, f_engine_password):
     """
     server_session= DelphixEngine(f_engine_address, f_engine_username, 
                                   f_engine_password, "DOMAIN")
-    return server_session
+    return instrument_engine(server_session)
 
 
-def list_timeflows(server):
+def list_timeflows(server, output_format='text'):
     """
     Retrieve and print all timeflows for a given engine
+    server: Delphix Engine object
+    output_format: text, csv or json
     """
 
-    ret_timeflow_dct = {}
-    all_timeflows = timeflow.get_all(server)
-
-    print 'DB Name, Timeflow Name, Timestamp'
-
-    for tfbm_lst in all_timeflows:
-        try:
-
-            db_name = get_obj_name(server, database, tfbm_lst.container)
-            print '%s, %s, %s\n' % (str(db_name), str(tfbm_lst.name),
-                                    str(tfbm_lst.parent_point.timestamp))
-
-        except AttributeError:
-            print '%s, %s\n' % (str(tfbm_lst.name), str(db_name))
-
-        except TypeError as e:
-           raise DlpxException('Listing Timeflows encountered an error:\n%s' %
-                               (e.message))
-
-        except RequestError, e:
-            dlpx_err = e.message
-            raise DlpxException(dlpx_err.action)
+    DxTimeflow(server).list_timeflows(output_format)
 
 
 def set_timeflow_point(engine, server, container_obj):
@@ -796,18 +949,22 @@ def time_elapsed():
     return elapsed_minutes
 
 
-def update_jobs_dictionary(engine, server, jobs):
+def update_jobs_dictionary(engine, job_watcher, jobs):
     """
     This function checks each job in the dictionary and updates its status or 
     removes it if the job is complete.
+    Only jobs the notification channel reported as changed are fetched again.
     Return the number of jobs still running.
+    engine: Dictionary of the engine from dxtools.conf
+    job_watcher: lib.JobWatcher.JobWatcher for the engine session
+    jobs: Dictionary of running jobs keyed by container object
     """
     #Establish the running jobs counter, as we are about to update the count 
     # from the jobs report.
     i = 0
     #get all the jobs, then inspect them
     for j in jobs.keys():
-        job_obj = job.get(server, jobs[j])
+        job_obj = job_watcher.get(jobs[j])
         print_debug(engine["hostname"] + ": " + str(job_obj))
         print_info(engine["hostname"] + ": " + j.name + ": " + 
                    job_obj.job_state)
@@ -842,6 +999,9 @@ def main(argv):
         database_name = arguments['--name']
         host_name = arguments['--host']
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dxtools_objects = get_config(config_file_path)
         
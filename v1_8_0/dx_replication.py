@@ -17,6 +17,7 @@ Usage:
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   
   dx_replication.py -h | --help | -v | --version
 
@@ -47,6 +48,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -55,11 +61,11 @@ Options:
   -v --version              Show version.
 """
 
-VERSION = 'v.0.0.001'
+VERSION = 'v.0.0.002'
 
 import sys
 from os.path import basename
-from time import sleep, time
+from time import time
 from docopt import docopt
 
 from delphixpy.exceptions import HttpError
@@ -67,17 +73,25 @@ from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
 from delphixpy.web import job
 from delphixpy.web import database
+from delphixpy.web import group
 from delphixpy.web.replication import spec
 from delphixpy.web.vo import ReplicationSpec
 from delphixpy.web.vo import ReplicationList
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import get_index
+from lib.DxCache import invalidate_cache
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
 from lib.GetReferences import find_obj_by_name
 from lib.GetReferences import find_obj_specs
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
 
 
@@ -106,10 +120,9 @@ def create_replication_job():
         rep_spec.object_specification.objects = find_obj_specs(
             dx_session_obj.server_session, arguments['--rep_objs'].split(','))
 
-        ref = spec.create(dx_session_obj.server_session, rep_spec)
-        if dx_session_obj.server_session.last_job:
-            dx_session_obj.jobs[dx_session_obj.server_session.address] = \
-                dx_session_obj.server_session.last_job
+        ref = dx_session_obj.job_tracker.submit(arguments['--rep_name'],
+                                                spec.create, rep_spec)
+        invalidate_cache(dx_session_obj.server_session, spec)
         print_info('Successfully created {} with reference '
                    '{}\n'.format(arguments['--rep_name'], ref))
 
@@ -124,12 +137,11 @@ def delete_replication_job():
     :return: Reference to the spec object
     """
     try:
-        spec.delete(dx_session_obj.server_session,
-                    find_obj_by_name(dx_session_obj.server_session, spec,
-                                     arguments['--delete']).reference)
-        if dx_session_obj.server_session.last_job:
-            dx_session_obj.jobs[dx_session_obj.server_session.address] = \
-                dx_session_obj.server_session.last_job
+        dx_session_obj.job_tracker.submit(
+            arguments['--delete'], spec.delete,
+            find_obj_by_name(dx_session_obj.server_session, spec,
+                             arguments['--delete']).reference)
+        invalidate_cache(dx_session_obj.server_session, spec)
         print_info('Successfully deleted {}.\n'.format(arguments['--delete']))
 
     except (HttpError, RequestError, DlpxException) as e:
@@ -137,22 +149,53 @@ def delete_replication_job():
             arguments['--delete'], e))
 
 
+def find_last_run(engine, spec_ref):
+    """
+    Return the most recent job of a replication spec, or None if it has
+    not run
+
+    engine: A Delphix engine session object
+    spec_ref: Reference of the replication spec
+    """
+
+    #Jobs are listed newest first.
+    last_jobs = job.get_all(engine, target=spec_ref, page_size=1)
+    return last_jobs[0] if last_jobs else None
+
+
 def list_replication_jobs():
     """
     List the replication jobs on a given engine
+
+    The names of the replicated objects are resolved from one listing of
+    the databases and groups, shared by every spec.
     """
-    obj_names_lst = []
 
-    for rep_job in spec.get_all(dx_session_obj.server_session):
-        for obj_spec_ref in  rep_job.object_specification.objects:
-            obj_names_lst.append(database.get(dx_session_obj.server_session,
-                                              obj_spec_ref).name)
+    engine = dx_session_obj.server_session
+    db_index = get_index(engine, database)
+    group_index = get_index(engine, group)
+
+    for rep_job in spec.get_all(engine):
+        obj_names_lst = []
+        for obj_spec_ref in rep_job.object_specification.objects:
+            obj_spec = db_index.by_reference.get(obj_spec_ref) or \
+                group_index.by_reference.get(obj_spec_ref)
+            obj_names_lst.append(obj_spec.name if obj_spec else obj_spec_ref)
+
+        last_run = find_last_run(engine, rep_job.reference)
+        if last_run is not None:
+            last_run_stats = '{}, started {}, last updated {}'.format(
+                last_run.job_state, last_run.start_time,
+                last_run.update_time)
+        else:
+            last_run_stats = 'Never run'
 
         print('Name: {}\nReplicated Objects: {}\nEnabled: {}\nEncrypted: {}\n'
-              'Reference: {}\nSchedule: {}\nTarget Host: {}\n\n'.format(
+              'Reference: {}\nSchedule: {}\nTarget Host: {}\n'
+              'Last Run: {}\n\n'.format(
             rep_job.name, ', '.join(obj_names_lst), rep_job.enabled,
             rep_job.encrypted, rep_job.reference, rep_job.schedule,
-            rep_job.target_host))
+            rep_job.target_host, last_run_stats))
 
 
 def execute_replication_job(obj_name):
@@ -161,49 +204,15 @@ def execute_replication_job(obj_name):
     :param obj_name: name of object to execute.
     """
     try:
-        spec.execute(dx_session_obj.server_session,
-                     find_obj_by_name(dx_session_obj.server_session,
-                                      spec, obj_name).reference)
-        if dx_session_obj.server_session.last_job:
-            dx_session_obj.jobs[dx_session_obj.server_session.address] = \
-                dx_session_obj.server_session.last_job
+        dx_session_obj.job_tracker.submit(
+            obj_name, spec.execute,
+            find_obj_by_name(dx_session_obj.server_session, spec,
+                             obj_name).reference)
         print_info('Successfully executed {}.\n'.format(obj_name))
     except (HttpError, RequestError, DlpxException, JobError) as e:
         print_exception('Could not execute job {}:\n{}'.format(obj_name, e))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine):
     """
@@ -226,9 +235,17 @@ def main_workflow(engine):
         sys.exit(1)
 
     thingstodo = ["thingtodo"]
+
+    def report_job(tracked):
+        print_info('{}: Replication operation on {}: {} in {:.1f} '
+                   'seconds'.format(engine['hostname'], tracked.target,
+                                    tracked.job_state, tracked.duration))
+
     try:
         with dx_session_obj.job_mode(single_thread):
-            while (len(dx_session_obj.jobs) > 0 or len(thingstodo)> 0):
+            job_tracker = dx_session_obj.job_tracker
+            job_tracker.on_complete = report_job
+            while (len(job_tracker.running) > 0 or len(thingstodo)> 0):
                 if len(thingstodo) > 0:
                     if arguments['--rep_name']:
                         create_replication_job()
@@ -239,29 +256,15 @@ def main_workflow(engine):
                     elif arguments['--execute']:
                         execute_replication_job(arguments['--execute'])
                     thingstodo.pop()
-                # get all the jobs, then inspect them
-                i = 0
-                for j in dx_session_obj.jobs.keys():
-                    job_obj = job.get(dx_session_obj.server_session,
-                                      dx_session_obj.jobs[j])
-                    print_debug(job_obj)
-                    print_info('{}: Replication operations: {}'.format(
-                        engine['hostname'], job_obj.job_state))
-                    if job_obj.job_state in ["CANCELED", "COMPLETED", "FAILED"]:
-                        # If the job is in a non-running state, remove it
-                        # from the
-                        # running jobs list.
-                        del dx_session_obj.jobs[j]
-                    elif job_obj.job_state in 'RUNNING':
-                        # If the job is in a running state, increment the
-                        # running job count.
-                        i += 1
-                    print_info('{}: {:d} jobs running.'.format(
-                               engine['hostname'], i))
-                    # If we have running jobs, pause before repeating the
-                    # checks.
-                    if len(dx_session_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                # Check the submitted jobs the notification channel
+                # reported a change for.
+                job_tracker.poll()
+                print_info('{}: {:d} jobs running.'.format(
+                           engine['hostname'], len(job_tracker.running)))
+                # If we have running jobs, pause before repeating the
+                # checks.
+                if len(job_tracker.running) > 0:
+                    job_tracker.wait_for_change(float(arguments['--poll']))
 
     except (HttpError, RequestError, JobError, DlpxException) as e:
         print_exception('ERROR: Could not complete replication'
@@ -324,11 +327,9 @@ def run_job():
     #run the job against the engine
     threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -358,6 +359,9 @@ def main(arguments):
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -14,6 +14,7 @@ Usage:
                    [ --engine <identifier> --all]
                    [--debug] [--parallel <n>] [--poll <n>]
                    [--config <path_to_file>] [--logdir <path_to_file>]
+                   [--cache-ttl <n>] [--profile-api]
   dx_rewind_vdb.py -h | --help | -v | --version
 
 Rewinds a Delphix VDB
@@ -45,6 +46,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -59,21 +65,26 @@ VERSION = "v.0.2.015"
 from docopt import docopt
 from os.path import basename
 import sys
-from time import time, sleep
+from time import time
 import traceback
 
 from delphixpy.exceptions import HttpError
 from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
 from delphixpy.web import database
-from delphixpy.web import job
 from delphixpy.web.vo import RollbackParameters
 from delphixpy.web.vo import OracleRollbackParameters
 
 from lib.DlpxException import DlpxException
 from lib.DxTimeflow import DxTimeflow
 from lib.GetReferences import find_obj_by_name
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_info
 from lib.DxLogging import print_debug
@@ -131,6 +142,7 @@ def rewind_database(dlpx_obj, vdb_name, timestamp, timestamp_type='SNAPSHOT'):
             database.rollback(dlpx_obj.server_session, container_obj.reference,
                               rewind_params)
             dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
+            dx_timeflow_obj.invalidate_snapshots()
             print_info('VDB {} was rolled back.'.format(container_obj.name))
         except (RequestError, HttpError, JobError) as e:
             print_exception('ERROR: {} encountered an error on {}'
@@ -142,41 +154,6 @@ def rewind_database(dlpx_obj, vdb_name, timestamp, timestamp_type='SNAPSHOT'):
                                                             container_obj.name))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine, dlpx_obj):
     """
@@ -203,6 +180,7 @@ def main_workflow(engine, dlpx_obj):
     thingstodo = ["thingtodo"]
     try:
         with dlpx_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dlpx_obj.server_session)
             while len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0:
                 if len(thingstodo) > 0:
                     rewind_database(dlpx_obj, arguments['--vdb'],
@@ -213,8 +191,7 @@ def main_workflow(engine, dlpx_obj):
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dlpx_obj.jobs.keys():
-                    job_obj = job.get(dlpx_obj.server_session,
-                                      dlpx_obj.jobs[j])
+                    job_obj = job_watcher.get(dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: Refresh of {}: {}'.format(
                         engine['hostname'], arguments['--vdb'],
@@ -232,7 +209,7 @@ def main_workflow(engine, dlpx_obj):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
     except (DlpxException, RequestError, JobError, HttpError) as e:
         print_exception('Error in dx_rewind_vdb: {}\n{}'.format(
             engine['hostname'], e))
@@ -306,11 +283,9 @@ def run_job(dlpx_obj, config_file_path):
         # run the job against the engine
         threads.append(main_workflow(engine, dlpx_obj))
 
-    # For each thread in the list...
-    for each in threads:
-        # join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    # Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def main():
@@ -326,6 +301,9 @@ def main():
         logging_est(arguments['--logdir'])
         print_debug(arguments)
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         # Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -73,7 +73,7 @@ import traceback
 import json
 
 from multiprocessing import Process
-from time import sleep, time
+from time import time
 
 from delphixpy.v1_6_0.delphix_engine import DelphixEngine
 from delphixpy.v1_6_0.exceptions import HttpError, JobError
@@ -81,6 +81,11 @@ from delphixpy.v1_6_0 import job_context
 from delphixpy.v1_6_0.web import database, environment, group, job, source, user
 from delphixpy.v1_6_0.web.vo import ASESpecificBackupSyncParameters, ASENewBackupSyncParameters, ASELatestBackupSyncParameters, MSSqlSyncParameters
 
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
+from lib.JobWatcher import JobWatcher
+
 def ase_latest_backup_sync_parameters():
     obj = ASELatestBackupSyncParameters()
 
@@ -249,40 +254,6 @@ def set_exit_handler(func):
     """
     signal.signal(signal.SIGTERM, func)
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
 @run_async
 def main_workflow(engine):
     """
@@ -353,6 +324,7 @@ def main_workflow(engine):
     #reset the running job count before we begin
     i = 0
     with job_mode(server):
+        job_watcher = JobWatcher(server)
         #While there are still running jobs or databases still to process....
         while (len(jobs) > 0 or len(databases) > 0):
             #While there are databases still to process and we are still under 
@@ -383,11 +355,11 @@ def main_workflow(engine):
             if ( arguments['--parallel'] != None and i >= int(arguments['--parallel'])):
                 print_info(engine["hostname"] + ": Max jobs reached (" + str(i) + ")")
             #reset the running jobs counter, as we are about to update the count from the jobs report.
-            i = update_jobs_dictionary(engine, server, jobs)
+            i = update_jobs_dictionary(engine, job_watcher, jobs)
             print_info(engine["hostname"] + ": " + str(i) + " jobs running. " + str(len(databases)) + " jobs waiting to run")
-            #If we have running jobs, pause before repeating the checks.
+            #If we have running jobs, wait for one of them to change before repeating the checks.
             if len(jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
 
 def run_job(engine):
     """
@@ -435,10 +407,9 @@ def run_job(engine):
         #run the job against the engine
         threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 def snapshot_database(engine, server, jobs, source_obj, container_obj, obj_type=None):
     """
@@ -512,21 +483,23 @@ def time_elapsed():
     elapsed_minutes = round((time() - time_start)/60, +1)
     return elapsed_minutes
 
-def update_jobs_dictionary(engine, server, jobs):
+def update_jobs_dictionary(engine, job_watcher, jobs):
     """
     This function checks each job in the dictionary and updates its status or removes it if the job is complete.
+    Jobs are read through job_watcher, so only the jobs that changed are fetched again.
     Return the number of jobs still running.
     """
     #Establish the running jobs counter, as we are about to update the count from the jobs report.
     i = 0
     #get all the jobs, then inspect them
     for j in jobs.keys():
-        job_obj = job.get(server, jobs[j])
+        job_obj = job_watcher.get(jobs[j])
         print_debug(engine["hostname"] + ": " + str(job_obj))
         print_info(engine["hostname"] + ": " + j.name + ": " + job_obj.job_state)
         
         if job_obj.job_state in ["CANCELED", "COMPLETED", "FAILED"]:
             #If the job is in a non-running state, remove it from the running jobs list.
+            job_watcher.forget(jobs[j])
             del jobs[j]
         else:
             #If the job is in a running state, increment the running job count.
@@ -556,6 +529,7 @@ def main(argv):
         database_name = arguments['--name']
         host_name = arguments['--host']
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
         #Parse the dxtools.conf and put it into a dictionary
         dxtools_objects = get_config(config_file_path)
         
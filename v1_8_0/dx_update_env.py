@@ -14,6 +14,7 @@ Usage:
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   dx_update_env.py -h | --help | -v | --version
 Description
 
@@ -29,6 +30,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -41,13 +47,12 @@ VERSION = 'v.0.0.001'
 
 import sys
 from os.path import basename
-from time import sleep, time
+from time import time
 from docopt import docopt
 
 from delphixpy.exceptions import HttpError
 from delphixpy.exceptions import JobError
 from delphixpy.exceptions import RequestError
-from delphixpy.web import job
 from delphixpy.web import environment
 from delphixpy.web.vo import ASEHostEnvironmentParameters
 from delphixpy.web.vo import UnixHostEnvironment
@@ -59,7 +64,13 @@ from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
 from lib.GetReferences import find_obj_by_name
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
 def update_ase_db_pw():
 
@@ -79,38 +90,6 @@ def update_ase_db_pw():
         sys.exit(1)
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
-
 @run_async
 def main_workflow(engine):
     """
@@ -137,6 +116,7 @@ def main_workflow(engine):
     #reset the running job count before we begin
     i = 0
     with dx_session_obj.job_mode(single_thread):
+        job_watcher = JobWatcher(dx_session_obj.server_session)
         while (len(jobs) > 0 or len(thingstodo)> 0):
             if len(thingstodo)> 0:
                 if arguments['--pw']:
@@ -150,7 +130,7 @@ def main_workflow(engine):
             #get all the jobs, then inspect them
             i = 0
             for j in jobs.keys():
-                job_obj = job.get(dx_session_obj.server_session, jobs[j])
+                job_obj = job_watcher.get(jobs[j])
                 print_debug(job_obj)
                 print_info(engine["hostname"] + ": VDB Operations: " +
                            job_obj.job_state)
@@ -167,7 +147,7 @@ def main_workflow(engine):
             print_info(engine["hostname"] + ": " + str(i) + " jobs running. ")
             #If we have running jobs, pause before repeating the checks.
             if len(jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
 
 
 def run_job():
@@ -227,11 +207,9 @@ def run_job():
     #run the job against the engine
     threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -263,6 +241,9 @@ def main(argv):
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
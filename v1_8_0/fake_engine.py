@@ -0,0 +1,800 @@
+#!/usr/bin/env python
+# Offline stand-in for a Delphix Virtualization Engine
+# requirements
+# pip install docopt
+
+# The below doc follows the POSIX compliant standards and allows us to use
+# this doc to also define our arguments for the script.
+"""Run a fake Delphix engine for offline testing and benchmarking
+Usage:
+  fake_engine.py [--port <n>] [--latency <ms>] [--job_duration <seconds>]
+                 [--job_failure_rate <rate>] [--seed <n>]
+                 [--groups <n>] [--dsources <n>] [--vdbs <n>]
+                 [--snapshots <n>] [--bookmarks <n>]
+                 [--username <name>] [--password <password>]
+  fake_engine.py -h | --help | -v | --version
+
+Serves the delphixpy v1_8_0 REST endpoints used by these scripts (session,
+login, database, source, group, job, timeflow, timeflow/oracle/log,
+snapshot, selfservice (also as jetstream), capacity/consumer, user, role,
+authorization, notification, system and service/time) from a seeded
+synthetic inventory. Every dSource has two missing archive logs. Actions
+start jobs that finish after --job_duration seconds.
+
+Point a script at the fake engine by using 127.0.0.1:<port> as the
+ip_address of an engine in dxtools.conf.
+
+Examples:
+  fake_engine.py --port 8080
+  fake_engine.py --port 8080 --latency 50 --vdbs 10000 --job_duration 5
+
+Options:
+  --port <n>                Port to listen on. [default: 8080]
+  --latency <ms>            Milliseconds added to every response.
+                            [default: 0]
+  --job_duration <seconds>  Seconds a job runs before it finishes.
+                            [default: 2]
+  --job_failure_rate <rate> Fraction of jobs that end in FAILED.
+                            [default: 0]
+  --seed <n>                Seed of the synthetic inventory. [default: 1]
+  --groups <n>              Number of groups. [default: 10]
+  --dsources <n>            Number of dSources. [default: 200]
+  --vdbs <n>                Number of VDBs. [default: 2000]
+  --snapshots <n>           Snapshots per database. [default: 3]
+  --bookmarks <n>           Number of Jet Stream bookmarks. [default: 2000]
+  --username <name>         User accepted by login. [default: delphix_admin]
+  --password <password>     Password accepted by login. [default: delphix]
+  -h --help                 Show this screen.
+  -v --version              Show version.
+"""
+
+VERSION = 'v.0.0.001'
+
+import heapq
+import itertools
+import json
+import random
+import threading
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from Cookie import SimpleCookie
+from SocketServer import ThreadingMixIn
+from datetime import datetime
+from datetime import timedelta
+from os.path import basename
+from time import sleep
+from time import time
+from urlparse import parse_qs
+from urlparse import urlparse
+
+from docopt import docopt
+
+API_PREFIX = '/resources/json/delphix/'
+
+#Query parameters that are not object filters
+PAGING_PARAMS = ['pageSize', 'pageOffset', 'timeout', 'max']
+
+#Query parameters whose object field has a different name
+FILTER_FIELDS = {('snapshot', 'database'): 'container',
+                 ('source', 'database'): 'container',
+                 ('timeflow', 'database'): 'container',
+                 ('timeflow/oracle/log', 'database'): 'container',
+                 ('selfservice/bookmark', 'tag'): 'tags'}
+
+#Query parameters that bound an SCN range, with the object field they are
+# compared to and the comparison
+SCN_FILTERS = {'fromScn': ('endScn', lambda scn, bound: scn >= bound),
+               'toScn': ('startScn', lambda scn, bound: scn <= bound)}
+
+#Actions that change the object they are run on
+SOURCE_STATES = {'start': ('status', 'RUNNING'),
+                 'stop': ('status', 'INACTIVE'),
+                 'enable': ('enabled', 'ENABLED'),
+                 'disable': ('enabled', 'DISABLED')}
+
+
+def api_timestamp(offset=0):
+    """
+    Return a timestamp in the engine's format, offset seconds from now
+    """
+    point = datetime.utcnow() + timedelta(seconds=offset)
+    return point.strftime('%Y-%m-%dT%H:%M:%S.') + \
+        '{:03d}Z'.format(point.microsecond / 1000)
+
+
+def job_notification(job_ref):
+    """
+    Return the notification the engine posts when a job changes state
+    """
+    return {'type': 'ObjectNotification', 'eventType': 'UPDATE',
+            'object': job_ref, 'objectType': 'Job'}
+
+
+class FakeEngineState(object):
+    """
+    Inventory, jobs and notifications of one fake engine
+    """
+
+    def __init__(self, job_duration=2, job_failure_rate=0, seed=1,
+                 username='delphix_admin', password='delphix'):
+        self.job_duration = float(job_duration)
+        self.job_failure_rate = float(job_failure_rate)
+        self.username = username
+        self.password = password
+        self.random = random.Random(seed)
+        self.collections = {}
+        self.notifications = []
+        self.sessions = {}
+        self.cursors = {}
+        self.request_counts = {}
+        self.list_queries = {}
+        self._ref_ids = itertools.count(1)
+        self._job_queue = []
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._scheduler = threading.Thread(target=self._run_jobs)
+        self._scheduler.daemon = True
+        self._scheduler.start()
+
+
+    def new_reference(self, prefix):
+        return '{}-{}'.format(prefix, next(self._ref_ids))
+
+
+    def add(self, collection, obj):
+        """
+        Add an object to a collection and return it
+        """
+        with self._cond:
+            self.collections.setdefault(collection, {})[obj['reference']] = obj
+        return obj
+
+
+    def seed(self, groups=10, dsources=200, vdbs=2000, snapshots=3,
+             bookmarks=2000):
+        """
+        Build a synthetic inventory. Every database has a source, a timeflow
+        and snapshots. VDBs are provisioned from the dSources, and Jet Stream
+        containers are built on a share of the VDBs.
+        """
+
+        group_refs = [self.add('group', {
+            'type': 'Group', 'reference': 'GROUP-{}'.format(num),
+            'name': 'group{}'.format(num), 'namespace': None,
+            'description': None})['reference'] for num in range(groups)]
+
+        dsource_refs = [self.add_database('dsource{}'.format(num),
+                                          self.random.choice(group_refs),
+                                          snapshots)['reference']
+                        for num in range(dsources)]
+
+        vdb_refs = [self.add_database('vdb{}'.format(num),
+                                      self.random.choice(group_refs),
+                                      snapshots,
+                                      self.random.choice(dsource_refs)
+                                      if dsource_refs else None)['reference']
+                    for num in range(vdbs)]
+
+        template_refs = [self.add('selfservice/template', {
+            'type': 'JSDataTemplate',
+            'reference': 'JS_DATA_TEMPLATE-{}'.format(num),
+            'name': 'jstemplate{}'.format(num), 'activeBranch': None,
+            'lastUpdated': api_timestamp(), 'namespace': None})['reference']
+                         for num in range(max(len(dsource_refs) / 10, 1))]
+
+        container_refs = []
+        for num, vdb_ref in enumerate(vdb_refs[:max(len(vdb_refs) / 10, 1)]):
+            container_ref = 'JS_DATA_CONTAINER-{}'.format(num)
+            branch_ref = self.add('selfservice/branch', {
+                'type': 'JSBranch', 'reference': self.new_reference('JS_BRANCH'),
+                'name': 'default', 'dataLayout': container_ref,
+                'namespace': None})['reference']
+            self.add('selfservice/container', {
+                'type': 'JSDataContainer', 'reference': container_ref,
+                'name': 'jscontainer{}'.format(num), 'activeBranch': branch_ref,
+                'template': self.random.choice(template_refs),
+                'owner': None, 'lastUpdated': api_timestamp(),
+                'namespace': None, 'database': vdb_ref})
+            container_refs.append((container_ref, branch_ref))
+
+        #One user per ten VDBs, each authorized on its share of the VDBs
+        role_refs = [self.add('role', {
+            'type': 'Role', 'reference': 'ROLE-{}'.format(num + 1),
+            'name': role_name, 'namespace': None})['reference']
+                     for num, role_name in enumerate(['OWNER', 'PROVISIONER',
+                                                      'Data', 'Read'])]
+        user_refs = [self.add('user', {
+            'type': 'User', 'reference': 'USER-{}'.format(num + 100),
+            'name': 'user{}'.format(num), 'userType': 'DOMAIN',
+            'enabled': True, 'namespace': None})['reference']
+                     for num in range(max(len(vdb_refs) / 10, 1))]
+        for num, vdb_ref in enumerate(vdb_refs):
+            user_ref = user_refs[num % len(user_refs)]
+            role_ref = self.random.choice(role_refs)
+            self.add('authorization', {
+                'type': 'Authorization',
+                'reference': self.new_reference('AUTHORIZATION'),
+                'name': '({}, {}, {})'.format(user_ref, role_ref, vdb_ref),
+                'user': user_ref, 'role': role_ref, 'target': vdb_ref,
+                'namespace': None})
+
+        for num in range(bookmarks if container_refs else 0):
+            container_ref, branch_ref = self.random.choice(container_refs)
+            container_obj = self.collections['selfservice/container'][
+                container_ref]
+            self.add('selfservice/bookmark', {
+                'type': 'JSBookmark',
+                'reference': self.new_reference('JS_BOOKMARK'),
+                'name': 'bookmark{}'.format(num), 'branch': branch_ref,
+                'container': container_ref,
+                'template': container_obj['template'],
+                'templateName': self.collections['selfservice/template'][
+                    container_obj['template']]['name'],
+                'tags': ['tag{}'.format(num % 10)], 'shared': False,
+                'timestamp': api_timestamp(-num), 'description': None,
+                'namespace': None})
+
+
+    def add_database(self, name, group_ref, snapshots, parent_ref=None):
+        """
+        Add an Oracle database with its source, timeflow and snapshots
+        """
+
+        db_ref = self.new_reference('ORACLE_DB_CONTAINER')
+        tf_ref = self.new_reference('ORACLE_TIMEFLOW')
+        db_obj = self.add('database', {
+            'type': 'OracleDatabaseContainer', 'reference': db_ref,
+            'name': name, 'group': group_ref, 'currentTimeflow': tf_ref,
+            'provisionContainer': parent_ref, 'masked': False,
+            'namespace': None, 'os': 'Linux', 'processor': 'x86_64',
+            'runtime': {'type': 'OracleDBContainerRuntime',
+                        'logSyncActive': False, 'preProvisioningStatus': None},
+            'creationTime': api_timestamp(-86400)})
+        self.add('source', {
+            'type': 'OracleVirtualSource' if parent_ref else
+                    'OracleLinkedSource',
+            'reference': self.new_reference('ORACLE_SOURCE'), 'name': name,
+            'container': db_ref, 'virtual': parent_ref is not None,
+            'staging': False, 'enabled': 'ENABLED', 'namespace': None,
+            'runtime': {'type': 'OracleSourceRuntime', 'status': 'RUNNING',
+                        'enabled': 'ENABLED', 'accessible': True,
+                        'databaseSize': 1048576.0}})
+        self.add('capacity/consumer', {
+            'type': 'CurrentConsumerCapacityData', 'reference': db_ref,
+            'name': name, 'container': db_ref, 'group': group_ref,
+            'parent': parent_ref, 'namespace': None,
+            'breakdown': {'type': 'CapacityBreakdown',
+                          'activeSpace': 1073741824.0,
+                          'syncSpace': 536870912.0,
+                          'logSpace': 0.0, 'actualSpace': 1610612736.0}})
+        self.add('timeflow', {
+            'type': 'OracleTimeflow', 'reference': tf_ref,
+            'name': 'DB_PROVISION@{}'.format(api_timestamp(-86400)[:-5]),
+            'container': db_ref, 'namespace': None,
+            'parentPoint': {'type': 'OracleTimeflowPoint', 'timeflow': None,
+                            'location': '1000',
+                            'timestamp': api_timestamp(-86400)}})
+        for num in range(snapshots):
+            self.add_snapshot(db_obj, -3600 * (num + 1))
+        if parent_ref is None:
+            for sequence in [10, 12]:
+                self.add('timeflow/oracle/log', {
+                    'type': 'OracleTimeflowLog',
+                    'reference': self.new_reference('ORACLE_LOG'),
+                    'timeflow': tf_ref, 'container': db_ref,
+                    'instanceNum': 1, 'sequence': sequence,
+                    'startScn': sequence * 100,
+                    'endScn': sequence * 100 + 99})
+        return db_obj
+
+
+    def add_snapshot(self, db_obj, offset=0):
+        """
+        Add a snapshot of db_obj taken offset seconds from now
+        """
+
+        snap_time = api_timestamp(offset)
+        return self.add('snapshot', {
+            'type': 'OracleSnapshot',
+            'reference': self.new_reference('ORACLE_SNAPSHOT'),
+            'name': '@' + snap_time[:-1], 'container': db_obj['reference'],
+            'timeflow': db_obj['currentTimeflow'], 'namespace': None,
+            'creationTime': snap_time, 'consistency': 'CONSISTENT',
+            'latestChangePoint': {'type': 'OracleTimeflowPoint',
+                                  'timeflow': db_obj['currentTimeflow'],
+                                  'location': str(int(time())),
+                                  'timestamp': snap_time},
+            'firstChangePoint': {'type': 'OracleTimeflowPoint',
+                                 'timeflow': db_obj['currentTimeflow'],
+                                 'location': str(int(time())),
+                                 'timestamp': snap_time}})
+
+
+    def open_session(self):
+        """
+        Start an API session and return its id
+        """
+        session_id = self.new_reference('SESSION')
+        with self._cond:
+            self.sessions[session_id] = False
+        return session_id
+
+
+    def login(self, session_id, username, password):
+        """
+        Log a session in. Return False if the credentials are wrong.
+        """
+        if username != self.username or password != self.password:
+            return False
+        with self._cond:
+            self.sessions[session_id] = True
+            self.cursors[session_id] = len(self.notifications)
+        return True
+
+
+    def logged_in(self, session_id):
+        with self._cond:
+            return self.sessions.get(session_id, False)
+
+
+    def count_request(self, method, collection):
+        with self._cond:
+            key = '{} {}'.format(method, collection)
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+
+    def record_query(self, collection, query):
+        """
+        Keep the query parameters of a listing, so a test can check the
+        filters a script sent
+        """
+        with self._cond:
+            self.list_queries.setdefault(collection, []).append(
+                dict((param, values[0]) for param, values in query.items()))
+
+
+    def list_objects(self, collection, query):
+        """
+        Return the objects of a collection that match the query filters
+        """
+
+        with self._cond:
+            objs = self.collections.get(collection, {}).values()
+
+        for param, values in query.items():
+            if param in PAGING_PARAMS:
+                continue
+            if param in SCN_FILTERS:
+                field, in_range = SCN_FILTERS[param]
+                objs = [obj for obj in objs if field not in obj or
+                        in_range(obj[field], int(values[0]))]
+                continue
+            field = FILTER_FIELDS.get((collection, param), param)
+
+            #Filters on fields the fake engine does not model are ignored.
+            if objs and field not in objs[0]:
+                continue
+            objs = [obj for obj in objs if obj.get(field) == values[0] or
+                    (isinstance(obj.get(field), list) and
+                     values[0] in obj[field])]
+
+        objs.sort(key=lambda obj: obj['reference'])
+        if 'pageSize' in query:
+            offset = int(query.get('pageOffset', ['0'])[0])
+            page_size = int(query['pageSize'][0])
+            objs = objs[offset * page_size:(offset + 1) * page_size]
+        return objs
+
+
+    def get_object(self, collection, reference):
+        with self._cond:
+            return self.collections.get(collection, {}).get(reference)
+
+
+    def start_job(self, action_type, target_ref, target_name=None):
+        """
+        Start a job that finishes after job_duration seconds
+        :return: The job reference
+        """
+
+        job_ref = self.new_reference('JOB')
+        self.add('job', {
+            'type': 'Job', 'reference': job_ref, 'namespace': None,
+            'actionType': action_type, 'target': target_ref,
+            'targetName': target_name, 'jobState': 'RUNNING',
+            'parentActionState': 'EXECUTING',
+            'startTime': api_timestamp(), 'updateTime': api_timestamp(),
+            'percentComplete': 0.0, 'cancelable': True, 'queued': False,
+            'title': '{} {}'.format(action_type, target_name or target_ref),
+            'user': 'USER-2', 'emailAddresses': [], 'events': []})
+
+        with self._cond:
+            heapq.heappush(self._job_queue, (time() + self.job_duration,
+                                             job_ref))
+            self._cond.notify_all()
+        return job_ref
+
+
+    def _run_jobs(self):
+        """
+        Finish jobs when they are due and post their notifications
+        """
+
+        with self._cond:
+            while not self._stopped:
+                if not self._job_queue:
+                    self._cond.wait()
+                    continue
+
+                due, job_ref = self._job_queue[0]
+                if due > time():
+                    self._cond.wait(due - time())
+                    continue
+
+                heapq.heappop(self._job_queue)
+                job_obj = self.collections['job'][job_ref]
+                if job_obj['jobState'] != 'RUNNING':
+                    continue
+
+                failed = self.random.random() < self.job_failure_rate
+                job_obj['jobState'] = 'FAILED' if failed else 'COMPLETED'
+                job_obj['parentActionState'] = job_obj['jobState']
+                job_obj['percentComplete'] = 100.0
+                job_obj['updateTime'] = api_timestamp()
+                self.notifications.append(job_notification(job_ref))
+                self._cond.notify_all()
+
+
+    def cancel_job(self, job_ref):
+        with self._cond:
+            job_obj = self.collections['job'][job_ref]
+            if job_obj['jobState'] == 'RUNNING':
+                job_obj['jobState'] = 'CANCELED'
+                job_obj['parentActionState'] = 'CANCELED'
+                self.notifications.append(job_notification(job_ref))
+                self._cond.notify_all()
+
+
+    def wait_notifications(self, session_id, timeout, channel=None):
+        """
+        Long-poll: return notifications this session's channel has not seen
+        yet, waiting up to timeout seconds for one to arrive. The session's
+        default channel starts from the point the session logged in, a
+        named channel from the point it was first read.
+        """
+
+        deadline = time() + timeout
+        channel_key = (session_id, channel)
+        with self._cond:
+            if channel is None:
+                cursor = self.cursors.get(channel_key, self.cursors.get(
+                    session_id, len(self.notifications)))
+            else:
+                cursor = self.cursors.get(channel_key,
+                                          len(self.notifications))
+            while len(self.notifications) <= cursor and time() < deadline:
+                self._cond.wait(deadline - time())
+            self.cursors[channel_key] = len(self.notifications)
+            return self.notifications[cursor:]
+
+
+    def run_action(self, collection, reference, action, params):
+        """
+        Apply an action to an object and start its job
+        :return: The job reference
+        """
+
+        obj = self.get_object(collection, reference)
+        if obj is None:
+            raise KeyError(reference)
+
+        if action == 'delete':
+            with self._cond:
+                del self.collections[collection][reference]
+                for src_obj in self.collections.get('source', {}).values():
+                    if src_obj['container'] == reference:
+                        del self.collections['source'][src_obj['reference']]
+
+        elif action in SOURCE_STATES:
+            field, value = SOURCE_STATES[action]
+            src_obj = obj
+            if collection == 'database':
+                src_obj = self.list_objects('source',
+                                            {'database': [reference]})[0]
+            src_obj['runtime'][field] = value
+            if field == 'enabled':
+                src_obj[field] = value
+
+        elif collection == 'database' and action == 'sync':
+            self.add_snapshot(obj)
+
+        elif collection == 'job' and action == 'cancel':
+            self.cancel_job(reference)
+            return None
+
+        return self.start_job('{}_{}'.format(collection.split('/')[-1],
+                                             action).upper(),
+                              reference, obj.get('name'))
+
+
+    def provision_database(self, params):
+        """
+        Provision a VDB from the posted provision parameters and start its
+        job
+        :return: Tuple of the new reference and the job reference
+        """
+
+        container = params.get('container') or {}
+        timeflow_point = params.get('timeflowPointParameters') or {}
+        parent_ref = timeflow_point.get('container')
+        if parent_ref is None and timeflow_point.get('snapshot'):
+            snap_obj = self.get_object('snapshot', timeflow_point['snapshot'])
+            parent_ref = snap_obj and snap_obj['container']
+
+        db_obj = self.add_database(container.get('name'),
+                                   container.get('group'), 1, parent_ref)
+        return db_obj['reference'], self.start_job(
+            'DB_PROVISION', db_obj['reference'], db_obj['name'])
+
+
+    def create_object(self, collection, params):
+        """
+        Create an object from the posted parameters and start its job
+        :return: Tuple of the new reference and the job reference
+        """
+
+        obj = dict(params)
+        obj['reference'] = self.new_reference(
+            collection.split('/')[-1].upper())
+        obj['type'] = obj.get('type', '').replace('CreateParameters', '') \
+            or collection
+        obj['namespace'] = None
+        self.add(collection, obj)
+        return obj['reference'], self.start_job(
+            '{}_CREATE'.format(collection.split('/')[-1]).upper(),
+            obj['reference'], obj.get('name'))
+
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+
+class FakeEngineHandler(BaseHTTPRequestHandler):
+    """
+    Maps delphixpy requests onto a FakeEngineState
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, log_format, *args):
+        pass
+
+
+    def _send(self, status, body, session_id=None):
+        if self.server.latency:
+            sleep(self.server.latency)
+
+        data = json.dumps(body)
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        if session_id:
+            self.send_header('Set-Cookie',
+                             'JSESSIONID={}; Path=/'.format(session_id))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def _ok(self, result=None, job_ref=None, session_id=None):
+        self._send(200, {'type': 'OKResult', 'status': 'OK',
+                         'result': result, 'job': job_ref,
+                         'action': job_ref and job_ref.replace('JOB',
+                                                               'ACTION')},
+                   session_id)
+
+
+    def _error(self, status, details, error_id):
+        self._send(status, {'type': 'ErrorResult', 'status': 'ERROR',
+                            'error': {'type': 'APIError',
+                                      'details': details, 'action': None,
+                                      'id': error_id, 'commandOutput': None,
+                                      'diagnoses': []}})
+
+
+    def _session_id(self):
+        cookie = SimpleCookie(self.headers.get('Cookie', ''))
+        if 'JSESSIONID' in cookie:
+            return cookie['JSESSIONID'].value
+        return None
+
+
+    def _route(self):
+        """
+        Split the request into collection, reference, action and query
+        """
+
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        parts = url.path[len(API_PREFIX):].strip('/').split('/')
+
+        #jetstream is the older name of the selfservice endpoints
+        if parts[0] == 'jetstream':
+            parts[0] = 'selfservice'
+
+        #Three-level collections such as timeflow/oracle/log, then two-level
+        # collections such as selfservice/bookmark
+        if parts[:3] == ['timeflow', 'oracle', 'log']:
+            parts = ['/'.join(parts[:3])] + parts[3:]
+        elif parts[0] in ['selfservice', 'service', 'capacity'] or (
+                parts[0] == 'timeflow' and len(parts) > 1 and
+                parts[1] == 'bookmark'):
+            parts = ['/'.join(parts[:2])] + parts[2:]
+        parts += [None] * (3 - len(parts))
+        return parts[0], parts[1], parts[2], query
+
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length)) if length else {}
+
+
+    def do_GET(self):
+        state = self.server.state
+        if not self.path.startswith(API_PREFIX):
+            return self._error(404, 'Not found', 'exception.webservices.notfound')
+
+        collection, reference, action, query = self._route()
+        state.count_request('GET', collection)
+        session_id = self._session_id()
+
+        if not state.logged_in(session_id):
+            return self._error(403, 'Use of the API requires authentication',
+                               'exception.webservices.login.notLoggedIn')
+
+        if collection == 'notification':
+            timeout = float(query.get('timeout', ['60000'])[0]) / 1000
+            channel = query.get('channel', [None])[0]
+            return self._ok(state.wait_notifications(session_id, timeout,
+                                                     channel))
+
+        if collection == 'system':
+            return self._ok({'type': 'SystemInfo', 'hostname': 'fake-engine',
+                             'productType': 'standard',
+                             'engineType': 'VIRTUALIZATION',
+                             'apiVersion': {'type': 'APIVersion', 'major': 1,
+                                            'minor': 8, 'micro': 0}})
+
+        if collection == 'service/time':
+            return self._ok({'type': 'TimeConfig', 'systemTimeZone': 'UTC',
+                             'currentTime': api_timestamp(),
+                             'ntpConfig': None})
+
+        if reference is None:
+            state.record_query(collection, query)
+            return self._ok(state.list_objects(collection, query))
+
+        obj = state.get_object(collection, reference)
+        if obj is None:
+            return self._error(404, 'The object {} does not exist'.format(
+                reference), 'exception.webservices.notfound')
+        self._ok(obj)
+
+
+    def do_POST(self):
+        state = self.server.state
+        if not self.path.startswith(API_PREFIX):
+            return self._error(404, 'Not found', 'exception.webservices.notfound')
+
+        collection, reference, action, query = self._route()
+        state.count_request('POST', collection)
+        params = self._read_body()
+        session_id = self._session_id()
+
+        if collection == 'session':
+            return self._ok(params, session_id=state.open_session())
+
+        if collection == 'login':
+            if not state.login(session_id, params.get('username'),
+                               params.get('password')):
+                return self._error(401, 'Invalid username or password',
+                                   'exception.webservices.login.failed')
+            return self._ok('USER-2')
+
+        if not state.logged_in(session_id):
+            return self._error(403, 'Use of the API requires authentication',
+                               'exception.webservices.login.notLoggedIn')
+
+        try:
+            if reference is None:
+                obj_ref, job_ref = state.create_object(collection, params)
+                return self._ok(obj_ref, job_ref)
+
+            #database/provision is an operation on the collection, not on a
+            # database with the reference "provision".
+            if collection == 'database' and reference == 'provision':
+                obj_ref, job_ref = state.provision_database(params)
+                return self._ok(obj_ref, job_ref)
+
+            if action is None:
+                obj = state.get_object(collection, reference)
+                if obj is None:
+                    raise KeyError(reference)
+                obj.update(params)
+                return self._ok()
+
+            self._ok(None, state.run_action(collection, reference, action,
+                                            params))
+        except KeyError as e:
+            self._error(404, 'The object {} does not exist'.format(e),
+                        'exception.webservices.notfound')
+
+
+class FakeEngineServer(ThreadingMixIn, HTTPServer):
+    """
+    Threaded HTTP server for one fake engine. Use address to connect.
+        E.g.:
+        server = FakeEngineServer(port=0, vdbs=100)
+        server.start()
+        GetSession().serversess(server.address, 'delphix_admin', 'delphix')
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port=8080, latency=0, job_duration=2,
+                 job_failure_rate=0, seed=1, groups=10, dsources=200,
+                 vdbs=2000, snapshots=3, bookmarks=2000,
+                 username='delphix_admin', password='delphix'):
+        HTTPServer.__init__(self, ('127.0.0.1', int(port)), FakeEngineHandler)
+        self.latency = float(latency) / 1000
+        self.state = FakeEngineState(job_duration, job_failure_rate, seed,
+                                     username, password)
+        self.state.seed(int(groups), int(dsources), int(vdbs),
+                        int(snapshots), int(bookmarks))
+        self.address = '127.0.0.1:{}'.format(self.server_address[1])
+        self._thread = None
+
+
+    def start(self):
+        """
+        Serve requests on a background thread
+        """
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def stop(self):
+        """
+        Stop serving and finish the job scheduler
+        """
+        if self._thread is not None:
+            self.shutdown()
+        self.server_close()
+        self.state.stop()
+
+
+def main(argv):
+    fake_engine = FakeEngineServer(
+        arguments['--port'], arguments['--latency'],
+        arguments['--job_duration'], arguments['--job_failure_rate'],
+        arguments['--seed'], arguments['--groups'], arguments['--dsources'],
+        arguments['--vdbs'], arguments['--snapshots'],
+        arguments['--bookmarks'], arguments['--username'],
+        arguments['--password'])
+    print 'Fake engine listening on {} with {} objects'.format(
+        fake_engine.address, sum(len(objs) for objs in
+                                 fake_engine.state.collections.values()))
+
+    try:
+        fake_engine.serve_forever()
+    except KeyboardInterrupt:
+        fake_engine.stop()
+
+
+if __name__ == "__main__":
+    #Grab our arguments from the doc at the top of the script
+    arguments = docopt(__doc__, version=basename(__file__) + " " + VERSION)
+    #Feed our arguments to the main function, and off we go!
+    main(arguments)
@@ -0,0 +1,89 @@
+"""
+Test utility with stand-ins for engine sessions, delphixpy web modules and
+the objects they return, for unit tests that do not need a fake engine.
+
+FakeClass counts its get_all() calls, so a test can check how many times a
+workflow downloaded a class.
+    E.g.:
+    db_class = FakeClass('database', [FakeObject('vdb1', 'DB-1')])
+    DxCache().get_index(FakeEngine('engine1'), db_class)
+    self.assertEqual(1, db_class.calls)
+"""
+
+VERSION = 'v.0.0.001'
+
+
+class FakeEngine(object):
+    """
+    Engine session with only an address
+    """
+
+    def __init__(self, address):
+        self.address = address
+
+
+class FakePoint(object):
+    """
+    Timeflow point with only a timestamp
+    """
+
+    def __init__(self, timestamp):
+        self.timestamp = timestamp
+
+
+class FakeObject(object):
+    """
+    Object with a name, reference and container. Other attributes are
+    passed as keyword arguments.
+    """
+
+    def __init__(self, name, reference, container=None, **attributes):
+        self.name = name
+        self.reference = reference
+        self.container = container
+        for attr, value in attributes.items():
+            setattr(self, attr, value)
+
+
+    def to_dict(self):
+        return {'type': 'FakeObject', 'name': self.name,
+                'reference': self.reference, 'container': self.container}
+
+
+    @staticmethod
+    def from_dict(obj_dct):
+        return FakeObject(obj_dct['name'], obj_dct['reference'],
+                          obj_dct.get('container'))
+
+
+class FakeSnapshot(FakeObject):
+    """
+    Snapshot named after the timestamp of its latest change point
+    """
+
+    def __init__(self, timestamp, container=None):
+        super(FakeSnapshot, self).__init__('@' + timestamp[:-1],
+                                           'ORACLE_SNAPSHOT-' + timestamp,
+                                           container)
+        self.latest_change_point = FakePoint(timestamp)
+
+
+class FakeClass(object):
+    """
+    Stands in for a delphixpy web module and counts get_all() calls
+    """
+
+    def __init__(self, name, objects):
+        self.__name__ = name
+        self.objects = objects
+        self.calls = 0
+
+
+    def get_all(self, engine, database=None):
+        """
+        Return the objects, or only those of one container if database is
+        given
+        """
+        self.calls += 1
+        return [obj for obj in self.objects if
+                database is None or obj.container == database]
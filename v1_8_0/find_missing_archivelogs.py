@@ -10,26 +10,50 @@
 #this doc to also define our arguments for the script.
 """Description
 Usage:
-  find_missing_archivelogs.py --outdir <dir>
+  find_missing_archivelogs.py --outdir <dir> [--format <type>]
+                  [--dsource_parallel <n>]
+                  [--incremental [--state_file <path>]]
                   [--engine <identifier> | --all]
                   [--debug] [--parallel <n>] [--poll <n>]
                   [--config <path_to_file>] [--logdir <path_to_file>]
+                  [--cache-ttl <n>] [--profile-api]
   find_missing_archivelogs.py -h | --help | -v | --version
 Description
     Find missing archive logs for each engine
 
 Examples:
     find_missing_archivelogs.py --outdir /var/tmp
+    find_missing_archivelogs.py --outdir /var/tmp --all --format json
+    find_missing_archivelogs.py --outdir /var/tmp --all --incremental
 
 
 Options:
-  --outdir <dir>           Directory for the output files
+  --outdir <dir>           Directory for the output files. One file is
+                            written per engine, named <engine>.<format>
+  --format <type>           Output format: csv, or json for one object per
+                            line. [default: csv]
+  --dsource_parallel <n>    Number of dSources of an engine queried at the
+                            same time. [default: 8]
+  --incremental             Only write the gaps opened or closed since the
+                            previous incremental run, with a Status column
+                            of NEW or CLOSED. The first run writes every gap
+                            as NEW. Later runs only request the logs from
+                            the lowest open gap or the highest SCN seen.
+  --state_file <path>       File keeping the open gaps, highest missing SCN
+                            and highest missing sequence per dSource and
+                            thread between incremental runs.
+                            [default: ./find_missing_archivelogs.state]
   --engine <type>           Identifier of Delphix engine in dxtools.conf.
   --all                     Run against all engines.
   --debug                   Enable debug logging
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -38,17 +62,21 @@ Options:
   -v --version              Show version.
 """
 
-VERSION = 'v.0.0.005'
+VERSION = 'v.0.1.001'
 
+import csv
+import json
 import sys
+import threading
+from httplib import HTTPException
+from os import rename
 from os.path import basename
-from time import sleep, time
+from time import time
 from docopt import docopt
 
 from delphixpy.v1_8_0.exceptions import HttpError
 from delphixpy.v1_8_0.exceptions import JobError
 from delphixpy.v1_8_0.exceptions import RequestError
-from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web import source
 from delphixpy.v1_8_0.web import database
 from delphixpy.v1_8_0.web.timeflow import oracle
@@ -59,72 +87,288 @@ from lib.DxLogging import logging_est
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
+from lib.DxPager import fetch_pages
 from lib.GetReferences import find_all_objects
-from lib.GetReferences import find_obj_by_name
+from lib.DxCache import get_index
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
+from lib.DxWorkerPool import WorkerPool
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 
+#Number of missing logs requested per page
+LOG_PAGE_SIZE = 1000
 
-def find_missing_archivelogs(hostname):
+#Bytes buffered before the output file is written
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+
+class ArchiveLogState(object):
     """
-    Function to find missing archive log files for Oracle dSources.
+    Open gaps, the highest missing SCN and the highest missing sequence per
+    dSource and thread, kept in a JSON file between --incremental runs
     """
-    print 'Now working on engine {}.'.format(hostname)
 
-    log_file = open('{}/{}.csv'.format(arguments['--outdir'], hostname), 'a+')
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        try:
+            with open(path) as state_file:
+                self.dsources = json.load(state_file)
+        except IOError:
+            self.dsources = {}
+        except ValueError as e:
+            raise DlpxException('ERROR: {} is not a valid state file. Remove '
+                                'it to start a new baseline:\n{}'.format(
+                                    path, e))
 
-    log_file.write('InstanceNumber,Sequence,StartSCN,EndSCN\n')
-    src_objs = find_all_objects(dx_session_obj.server_session, source)
 
-    for src_obj in src_objs:
-        if src_obj.virtual is False and src_obj.type == 'OracleLinkedSource':
-            ora_logs = oracle.log.get_all(dx_session_obj.server_session,
-                                          database=find_obj_by_name(
-                                              dx_session_obj.server_session,
-                                              database, src_obj.name).reference,
-                                          missing=True, page_size=1000)
-
-            if ora_logs:
-                for log_data in ora_logs:
-                    log_file.write('{}, {}, {}, {}, {}, {}\n'.format(
-                        src_obj.name, log_data.instance_num,
-                        log_data.instance_num, log_data.sequence,
-                        log_data.start_scn, log_data.end_scn))
-            elif not ora_logs:
-                log_file.write('{} has no missing files.\n'.format(
-                    src_obj.name))
-    log_file.close()
-
-
-def run_async(func):
+    def update(self, dsource_key, log_rows):
+        """
+        Replace the open gaps of a dSource and return what changed since
+        the previous run
+
+        dsource_key: Identifier of the dSource, unique across engines
+        log_rows: Set of (instance_num, sequence, start_scn, end_scn) tuples
+                  of the logs missing now, from at least from_scn() on
+        :return: Tuple of the sets of new and closed gaps
+        """
+
+        with self._lock:
+            dsource_state = self.dsources.get(dsource_key,
+                                              {'threads': {}, 'missing': []})
+            previous_rows = set(tuple(log_row) for log_row in
+                                dsource_state['missing'])
+            high_water = dsource_state['threads']
+            high_scn = dsource_state.get('high_scn')
+
+            for log_row in log_rows:
+                thread = str(log_row[0])
+                high_water[thread] = max(high_water.get(thread, 0),
+                                         log_row[1])
+                high_scn = max(high_scn, log_row[3])
+
+            self.dsources[dsource_key] = {'threads': high_water,
+                                          'high_scn': high_scn,
+                                          'missing': sorted(log_rows)}
+        return log_rows - previous_rows, previous_rows - log_rows
+
+
+    def from_scn(self, dsource_key):
+        """
+        Return the lowest SCN a run must request to see every change since
+        the previous run: the start of the lowest open gap, or the highest
+        missing SCN seen if no gap is open. None if the dSource has no
+        missing logs on record, so its whole listing is requested.
+        """
+
+        with self._lock:
+            dsource_state = self.dsources.get(dsource_key, {})
+            scns = [log_row[2] for log_row in
+                    dsource_state.get('missing', [])]
+            if dsource_state.get('high_scn') is not None:
+                scns.append(dsource_state['high_scn'])
+        return min(scns) if scns else None
+
+
+    def high_water(self, dsource_key):
+        """
+        Return a dictionary of thread to the highest missing sequence seen
+        """
+        with self._lock:
+            return dict(self.dsources.get(dsource_key, {}).get('threads', {}))
+
+
+    def save(self):
+        """
+        Write the state file. It is replaced in one step so an interrupted
+        run leaves the previous state intact.
+        """
+
+        with self._lock:
+            with open(self.path + '.tmp', 'w') as state_file:
+                json.dump(self.dsources, state_file)
+            rename(self.path + '.tmp', self.path)
+
+
+class ArchiveLogWriter(object):
     """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-            @run_async
-            def task2():
-                do_something_too
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
+    Buffered writer of missing archive log rows, shared by the threads that
+    query the dSources of one engine
     """
-    from threading import Thread
-    from functools import wraps
 
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
+    header = ['dSource', 'InstanceNumber', 'Sequence', 'StartSCN', 'EndSCN']
+    keys = ['dsource', 'instance_num', 'sequence', 'start_scn', 'end_scn']
+
+    def __init__(self, path, output_format='csv', incremental=False):
+        self.output_format = output_format
+        self.num_rows = 0
+        self._lock = threading.Lock()
+        self._file = open(path, 'wb', OUTPUT_BUFFER_SIZE)
+
+        #Incremental runs report whether each gap is NEW or CLOSED
+        if incremental:
+            self.header = self.header + ['Status']
+            self.keys = self.keys + ['status']
+
+        if output_format == 'csv':
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(self.header)
+
+
+    def write_logs(self, dsource_name, log_rows, status=None):
+        """
+        Write one row per missing log
+
+        dsource_name: Name of the dSource the logs belong to
+        log_rows: List of (instance_num, sequence, start_scn, end_scn)
+        status (optional): NEW or CLOSED, added to incremental rows
+        """
+
+        rows = [[dsource_name] + list(log_row) + ([status] if status else [])
+                for log_row in log_rows]
 
-    return async_func
+        with self._lock:
+            if self.output_format == 'csv':
+                self._writer.writerows(rows)
+            else:
+                self._file.writelines('{}\n'.format(json.dumps(dict(zip(
+                    self.keys, log_row)))) for log_row in rows)
+            self.num_rows += len(rows)
+
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def find_dsource_logs(engine, db_obj, log_writer, log_state=None,
+                      dsource_key=None):
+    """
+    Write the missing archive logs of one dSource a page at a time. With a
+    log_state only the logs from log_state.from_scn() on are requested, and
+    only the gaps opened or closed since the previous run are written.
+
+    engine: A Delphix engine session object
+    db_obj: Database object of the dSource
+    log_writer: ArchiveLogWriter of the engine
+    log_state (optional): ArchiveLogState of an incremental run
+    dsource_key (optional): Key of the dSource in log_state
+    :return: Number of missing logs
+    """
+
+    num_logs = 0
+    log_rows = set()
+    from_scn = None
+    if log_state is not None:
+        from_scn = log_state.from_scn(dsource_key)
+
+    for ora_logs in fetch_pages(oracle.log.get_all, engine, LOG_PAGE_SIZE,
+                                database=db_obj.reference, missing=True,
+                                from_scn=from_scn):
+        page_rows = [(log_data.instance_num, log_data.sequence,
+                      log_data.start_scn, log_data.end_scn)
+                     for log_data in ora_logs]
+        if log_state is None:
+            log_writer.write_logs(db_obj.name, page_rows)
+        else:
+            log_rows.update(page_rows)
+        num_logs += len(page_rows)
+
+    if log_state is not None:
+        new_gaps, closed_gaps = log_state.update(dsource_key, log_rows)
+        log_writer.write_logs(db_obj.name, sorted(new_gaps), 'NEW')
+        log_writer.write_logs(db_obj.name, sorted(closed_gaps), 'CLOSED')
+        print_debug('{}: {} new and {} closed gaps from SCN {}, highest '
+                    'missing sequence per thread: {}'.format(
+                        db_obj.name, len(new_gaps), len(closed_gaps),
+                        from_scn, log_state.high_water(dsource_key)))
+    return num_logs
+
+
+def find_engine_dsource_logs(engine, db_obj, log_writer, log_state=None,
+                             dsource_key=None):
+    """
+    Run find_dsource_logs on the calling thread's own session of the engine.
+    An engine session must not be used by two threads at once.
+
+    engine: Dictionary of the engine from dxtools.conf
+    See find_dsource_logs for the other arguments.
+    """
+
+    engine_session = dx_session_obj.serversess(
+        engine['ip_address'], engine['username'], engine['password'])
+    return find_dsource_logs(engine_session, db_obj, log_writer, log_state,
+                             dsource_key)
+
+
+def find_missing_archivelogs(engine):
+    """
+    Function to find missing archive log files for Oracle dSources.
+
+    The dSource databases are resolved from one database listing and up to
+    --dsource_parallel dSources are queried at the same time, each worker
+    with its own session. With --incremental only the gaps that changed
+    since the last run are written.
+
+    engine: Dictionary of the engine from dxtools.conf
+    """
+    hostname = engine['hostname']
+    print 'Now working on engine {}.'.format(hostname)
+
+    engine_session = dx_session_obj.serversess(
+        engine['ip_address'], engine['username'], engine['password'])
+    db_index = get_index(engine_session, database)
+    dsource_dbs = []
+    for src_obj in find_all_objects(engine_session, source):
+        if src_obj.virtual is False and src_obj.type == 'OracleLinkedSource':
+            try:
+                dsource_dbs.append(db_index.by_reference[src_obj.container])
+            except KeyError:
+                print_exception('{}: Database {} of dSource {} was not '
+                                'found.'.format(hostname, src_obj.container,
+                                                src_obj.name))
+
+    log_writer = ArchiveLogWriter('{}/{}.{}'.format(
+        arguments['--outdir'], hostname, arguments['--format']),
+        arguments['--format'], log_state is not None)
+    log_pool = WorkerPool(int(arguments['--dsource_parallel']))
+
+    try:
+        tasks = [(db_obj, log_pool.submit(
+            hostname, find_engine_dsource_logs, engine, db_obj, log_writer,
+            log_state, '{}/{}'.format(hostname, db_obj.reference)))
+                 for db_obj in dsource_dbs]
+
+        for db_obj, task in tasks:
+            try:
+                if task.join() == 0:
+                    print_debug('{}: {} has no missing files.'.format(
+                        hostname, db_obj.name))
+            except (DlpxException, HttpError, RequestError, JobError,
+                    HTTPException, IOError, ValueError) as e:
+                print_exception('{}: Could not list the archive logs of {}:'
+                                '\n{}'.format(hostname, db_obj.name, e))
+
+    except KeyboardInterrupt:
+        log_pool.cancel_pending()
+        raise
+
+    finally:
+        log_writer.close()
+
+    if log_state is not None:
+        log_state.save()
+        print_info('{}: {} archive log gaps opened or closed in {} Oracle '
+                   'dSources.'.format(hostname, log_writer.num_rows,
+                                      len(dsource_dbs)))
+    else:
+        print_info('{}: {} missing archive logs in {} Oracle dSources.'.format(
+            hostname, log_writer.num_rows, len(dsource_dbs)))
 
 
 @run_async
@@ -153,18 +397,19 @@ def main_workflow(engine):
     #reset the running job count before we begin
     i = 0
     with dx_session_obj.job_mode(single_thread):
+        job_watcher = JobWatcher(dx_session_obj.server_session)
         while (len(jobs) > 0 or len(thingstodo)> 0):
             if len(thingstodo)> 0:
 
                 #if OPERATION:
-                find_missing_archivelogs(engine['hostname'])
+                find_missing_archivelogs(engine)
 
                 thingstodo.pop()
 
             #get all the jobs, then inspect them
             i = 0
             for j in jobs.keys():
-                job_obj = job.get(dx_session_obj.server_session, jobs[j])
+                job_obj = job_watcher.get(jobs[j])
                 print_debug(job_obj)
                 print_info('{}: VDB Operations:{}\n'.format(engine['hostname'],
                            job_obj.job_state))
@@ -181,7 +426,7 @@ def main_workflow(engine):
             print_info(engine["hostname"] + ": " + str(i) + " jobs running. ")
             #If we have running jobs, pause before repeating the checks.
             if len(jobs) > 0:
-                sleep(float(arguments['--poll']))
+                job_watcher.wait_for_change(float(arguments['--poll']))
 
 
 def run_job():
@@ -236,15 +481,14 @@ def run_job():
 
         if engine is None:
             print_exception('\nERROR: No default engine found. Exiting\n')
+            sys.exit(1)
 
-    #run the job against the engine
-    threads.append(main_workflow(engine))
+        #run the job against the engine
+        threads.append(main_workflow(engine))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def time_elapsed():
@@ -263,6 +507,7 @@ def main(arguments):
     global time_start
     global config_file_path
     global dx_session_obj
+    global log_state
     global debug
 
     if arguments['--debug']:
@@ -276,6 +521,16 @@ def main(arguments):
         engine = None
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
+        if arguments['--format'] not in ['csv', 'json']:
+            print_exception('{} is not a valid output format. Valid formats '
+                            'are csv and json.'.format(arguments['--format']))
+            sys.exit(1)
+        log_state = None
+        if arguments['--incremental']:
+            log_state = ArchiveLogState(arguments['--state_file'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -288,6 +543,11 @@ def main(arguments):
                    elapsed_minutes))
 
     #Here we handle what we do when the unexpected happens
+    except DlpxException as e:
+        print_exception('script encountered an error while processing the'
+                        'config file:\n{}'.format(e))
+        sys.exit(1)
+
     except SystemExit as e:
         """
         This is what we use to handle our sys.exit(#)
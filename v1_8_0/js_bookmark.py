@@ -16,16 +16,19 @@
 #
 """Creates, lists, removes a Jet Stream Bookmark
 Usage:
-  js_bookmark.py (--create_bookmark <name> --data_layout <name> [--branch_name <name]| --list_bookmarks | --delete_bookmark <name> | --activate_bookmark <name> | --update_bookmark <name> | --share_bookmark <name> | --unshare_bookmark <name>)
+  js_bookmark.py (--create_bookmark <name> --data_layout <name> [--branch_name <name]| --list_bookmarks [--template_name <name>] [--container_name <name>] [--tag <name>] [--format <type>] | --delete_bookmark <name> | --activate_bookmark <name> | --update_bookmark <name> | --share_bookmark <name> | --unshare_bookmark <name>)
                    [--engine <identifier> | --all] [--parallel <n>]
                    [--poll <n>] [--debug]
                    [--config <path_to_file>] [--logdir <path_to_file>]
+                   [--cache-ttl <n>] [--profile-api]
   js_bookmark.py -h | --help | -v | --version
 
 Creates, Lists, Removes a Jet Stream Bookmark
 
 Examples:
   js_bookmark.py --list_bookmarks
+  js_bookmark.py --list_bookmarks --container_name jscontainer1 --format csv
+  js_bookmark.py --list_bookmarks --template_name jstemplate1 --tag nightly
   js_bookmark.py --create_bookmark jsbookmark1 --data_layout jstemplate1
   js_bookmark.py --create_bookmark jsbookmark1 --data_layout jstemplate1 --branch_name jsbranch1
   js_bookmark.py --activate_bookmark jsbookmark1
@@ -36,7 +39,13 @@ Examples:
 
 Options:
   --create_bookmark <name>    Name of the new JS Bookmark
-  --container_name <name>     Name of the container to use
+  --container_name <name>     Name of the container to use. With
+                              --list_bookmarks, only list its bookmarks
+  --template_name <name>      Only list bookmarks of this template
+  --tag <name>                Only list bookmarks with this tag
+  --format <type>             Output format of --list_bookmarks: text, csv or
+                              json. json writes one object per line.
+                              [default: text]
   --update_bookmark <name>    Name of the bookmark to update
   --share_bookmark <name>     Name of the bookmark to share
   --unshare_bookmark <name>   Name of the bookmark to unshare
@@ -51,6 +60,11 @@ Options:
   --parallel <n>              Limit number of jobs to maxjob
   --poll <n>                  The number of seconds to wait between job polls
                               [default: 10]
+  --cache-ttl <n>             Reuse engine inventory saved by earlier runs for
+                              up to n seconds. Inventory is kept in
+                              ./dx_inventory.db
+  --profile-api               Report the count and latency of API calls per
+                              endpoint when the script exits
   --config <path_to_file>     The path to the dxtools.conf file
                               [default: ./dxtools.conf]
   --logdir <path_to_file>     The path to the logfile you want to use.
@@ -59,15 +73,16 @@ Options:
   -v --version                Show version.
 """
 
-VERSION="v.0.0.015"
+VERSION="v.0.0.016"
 
 from docopt import docopt
 from os.path import basename
+import csv
+import json
 import sys
-from time import sleep, time
+from time import time
 import traceback
 
-from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web.jetstream import bookmark
 from delphixpy.v1_8_0.web.jetstream import branch
 from delphixpy.v1_8_0.web.jetstream import template
@@ -80,9 +95,16 @@ from delphixpy.v1_8_0.exceptions import JobError
 from delphixpy.v1_8_0.exceptions import HttpError
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import get_index
+from lib.DxCache import invalidate_cache
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.GetReferences import find_obj_by_name
-from lib.GetReferences import find_obj_name
 from lib.GetReferences import get_obj_reference
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_info
@@ -136,6 +158,7 @@ def create_bookmark(dlpx_obj, bookmark_name, source_layout, branch_name=None):
             'JSTimelinePointLatestTimeInput'}
     try:
         bookmark.create(dlpx_obj.server_session, js_bookmark_params)
+        invalidate_cache(dlpx_obj.server_session, bookmark)
         dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
         print_info('JS Bookmark {} was created successfully.'.format(
             bookmark_name))
@@ -145,25 +168,69 @@ def create_bookmark(dlpx_obj, bookmark_name, source_layout, branch_name=None):
                         'was:\n\n{}'.format(bookmark_name, e))
 
 
-def list_bookmarks(dlpx_obj):
+def list_bookmarks(dlpx_obj, template_name=None, container_name=None,
+                   tag=None, output_format='text', output=None):
     """
-    List all bookmarks on a given engine
+    List all bookmarks on a given engine. The template and container filters
+    are applied by the engine, the tag filter to each bookmark returned.
+    Rows are written as they are produced.
 
     :param dlpx_obj: Virtualization Engine session object
-
+    :param template_name: Only list bookmarks of this template
+    :param container_name: Only list bookmarks of this container
+    :param tag: Only list bookmarks with this tag
+    :param output_format: text, csv or json. json writes one object per line
+    :param output: File object to write to. Default: sys.stdout
     """
 
-    header = '\nName, Reference, Branch Name, Template Name'
+    output = output or sys.stdout
+    header = ['Name', 'Reference', 'Branch Name', 'Template Name']
+    engine = dlpx_obj.server_session
+
+    if output_format not in ['text', 'csv', 'json']:
+        raise DlpxException('{} is not a valid output format. Valid formats '
+                            'are text, csv and json.'.format(output_format))
+
     try:
-        js_bookmarks = bookmark.get_all(dlpx_obj.server_session)
-        print header
+        bookmark_filters = {}
+        if template_name:
+            bookmark_filters['template'] = find_obj_by_name(
+                engine, template, template_name).reference
+        if container_name:
+            bookmark_filters['container'] = find_obj_by_name(
+                engine, container, container_name).reference
+
+        #Branch names are joined from one listing instead of a lookup per
+        # bookmark.
+        branch_names = dict((branch_obj.reference, branch_obj.name) for
+                            branch_obj in get_index(engine, branch).objects)
+        js_bookmarks = bookmark.get_all(engine, **bookmark_filters)
+
+        if output_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(header)
+        elif output_format == 'text':
+            output.write('\n{}\n'.format(', '.join(header)))
+
         for js_bookmark in js_bookmarks:
-            branch_name = find_obj_name(dlpx_obj.server_session, branch,
-                                        js_bookmark.branch)
-            print '{}, {}, {}, {}'.format(js_bookmark.name,
-                                          js_bookmark.reference, branch_name,
-                                          js_bookmark.template_name)
-        print '\n'
+            #bookmark.get_all has no tag filter.
+            if tag and tag not in (js_bookmark.tags or []):
+                continue
+            bookmark_row = [js_bookmark.name, js_bookmark.reference,
+                            branch_names.get(js_bookmark.branch,
+                                             js_bookmark.branch),
+                            js_bookmark.template_name]
+            if output_format == 'csv':
+                writer.writerow(bookmark_row)
+            elif output_format == 'json':
+                output.write('{}\n'.format(json.dumps(dict(zip(
+                    ['name', 'reference', 'branch_name', 'template_name'],
+                    bookmark_row)))))
+            else:
+                output.write('{}\n'.format(', '.join(
+                    str(bookmark_field) for bookmark_field in bookmark_row)))
+        if output_format == 'text':
+            output.write('\n\n')
 
     except (DlpxException, HttpError, RequestError) as e:
         print_exception('\nERROR: The bookmarks on could not be listed. The '
@@ -243,6 +310,7 @@ def delete_bookmark(dlpx_obj, bookmark_name):
         bookmark.delete(dlpx_obj.server_session,
                         get_obj_reference(dlpx_obj.server_session,
                                           bookmark, bookmark_name).pop())
+        invalidate_cache(dlpx_obj.server_session, bookmark)
         print_info('The bookmark {} was deleted successfully.'.format(
             bookmark_name))
     except (DlpxException, HttpError, RequestError) as e:
@@ -250,40 +318,6 @@ def delete_bookmark(dlpx_obj, bookmark_name):
                         'error was:\n\n{}'.format(bookmark_name, e.message))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target=func, args=args, kwargs=kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
 
 def time_elapsed(time_start):
     """
@@ -323,6 +357,7 @@ def main_workflow(engine, dlpx_obj):
     thingstodo = ["thingtodo"]
     try:
         with dlpx_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dlpx_obj.server_session)
             while len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0:
                 if len(thingstodo) > 0:
                     if arguments['--create_bookmark']:
@@ -345,13 +380,16 @@ def main_workflow(engine, dlpx_obj):
                         unshare_bookmark(dlpx_obj,
                                          arguments['--unshare_bookmark'])
                     elif arguments['--list_bookmarks']:
-                        list_bookmarks(dlpx_obj)
+                        list_bookmarks(dlpx_obj,
+                                       arguments['--template_name'],
+                                       arguments['--container_name'],
+                                       arguments['--tag'],
+                                       arguments['--format'])
                     thingstodo.pop()
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dlpx_obj.jobs.keys():
-                    job_obj = job.get(dlpx_obj.server_session,
-                                      dlpx_obj.jobs[j])
+                    job_obj = job_watcher.get(dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: Running JS Bookmark: {}'.format(
                         engine['hostname'], job_obj.job_state))
@@ -368,7 +406,7 @@ def main_workflow(engine, dlpx_obj):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
     except (DlpxException, RequestError, JobError, HttpError) as e:
         print_exception('Error in js_bookmark: {}\n{}'.format(
             engine['hostname'], e))
@@ -432,11 +470,9 @@ def run_job(dlpx_obj, config_file_path):
         # run the job against the engine
         threads.append(main_workflow(engine, dlpx_obj))
 
-    # For each thread in the list...
-    for each in threads:
-        # join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    # Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def main():
@@ -452,6 +488,9 @@ def main():
         logging_est(arguments['--logdir'])
         print_debug(arguments)
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         # Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -20,6 +20,7 @@ Usage:
                    [--engine <identifier> | --all] [--parallel <n>]
                    [--poll <n>] [--debug]
                    [--config <path_to_file>] [--logdir <path_to_file>]
+                   [--cache-ttl <n>] [--profile-api]
   js_branch.py -h | --help | -v | --version
 
 Creates, Lists, Removes a Jet Stream Branch
@@ -45,6 +46,11 @@ Options:
   --parallel <n>            Limit number of jobs to maxjob
   --poll <n>                The number of seconds to wait between job polls
                             [default: 10]
+  --cache-ttl <n>           Reuse engine inventory saved by earlier runs for
+                            up to n seconds. Inventory is kept in
+                            ./dx_inventory.db
+  --profile-api             Report the count and latency of API calls per
+                            endpoint when the script exits
   --config <path_to_file>   The path to the dxtools.conf file
                             [default: ./dxtools.conf]
   --logdir <path_to_file>   The path to the logfile you want to use.
@@ -60,9 +66,8 @@ from os.path import basename
 import sys
 import traceback
 import re
-from time import time, sleep
+from time import time
 
-from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web.jetstream import branch
 from delphixpy.v1_8_0.web.jetstream import container
 from delphixpy.v1_8_0.web.jetstream import template
@@ -74,7 +79,14 @@ from delphixpy.v1_8_0.exceptions import JobError
 from delphixpy.v1_8_0.exceptions import HttpError
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import invalidate_cache
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.GetReferences import find_obj_by_name
 from lib.GetReferences import find_obj_name
 from lib.DxLogging import logging_est
@@ -108,6 +120,7 @@ def create_branch(dlpx_obj, branch_name, template_name, container_name):
                                               'type':
                                               'JSTimelinePointLatestTimeInput'}
         branch.create(dlpx_obj.server_session, js_branch_params)
+        invalidate_cache(dlpx_obj.server_session, branch)
         dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
         print_info('JS Branch {} was created successfully.'.format(
             branch_name))
@@ -201,45 +214,12 @@ def delete_branch(dlpx_obj, branch_name):
         branch_obj = find_obj_by_name(dlpx_obj.server_session,
                                       branch, branch_name)
         branch.delete(dlpx_obj.server_session, branch_obj.reference)
+        invalidate_cache(dlpx_obj.server_session, branch)
     except (DlpxException, HttpError, RequestError) as e:
         print_exception('\nERROR: The branch was not deleted. The '
                             'error was:\n\n{}'.format(e.message))
 
 
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target = func, args = args, kwargs = kwargs)
-        func_hl.start()
-        return func_hl
-
-    return async_func
-
 
 def time_elapsed():
     """
@@ -279,6 +259,7 @@ def main_workflow(engine, dlpx_obj):
     thingstodo = ["thingtodo"]
     try:
         with dlpx_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dlpx_obj.server_session)
             while (len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0):
                 if len(thingstodo) > 0:
                     if arguments['--create_branch']:
@@ -298,8 +279,7 @@ def main_workflow(engine, dlpx_obj):
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dlpx_obj.jobs.keys():
-                    job_obj = job.get(dlpx_obj.server_session,
-                                      dlpx_obj.jobs[j])
+                    job_obj = job_watcher.get(dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: Provisioning JS Branch: {}'.format(
                         engine['hostname'], job_obj.job_state))
@@ -316,7 +296,7 @@ def main_workflow(engine, dlpx_obj):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
     except (DlpxException, RequestError, JobError, HttpError) as e:
         print_exception('\nError in js_branch: {}\n{}'.format(
             engine['hostname'], e))
@@ -379,11 +359,9 @@ def run_job(dlpx_obj, config_file_path):
         #run the job against the engine
         threads.append(main_workflow(engine, dlpx_obj))
 
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def main():
@@ -399,6 +377,9 @@ def main():
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -20,6 +20,7 @@ Usage:
                    [--engine <identifier> | --all] [--parallel <n>]
                    [--poll <n>] [--debug]
                    [--config <path_to_file>] [--logdir <path_to_file>]
+                   [--cache-ttl <n>] [--profile-api]
   js_container.py -h | --help | -v | --version
 
 Creates, Lists, Removes a Jet Stream Template
@@ -58,6 +59,11 @@ Options:
   --parallel <n>             Limit number of jobs to maxjob
   --poll <n>                 The number of seconds to wait between job polls
                              [default: 10]
+  --cache-ttl <n>            Reuse engine inventory saved by earlier runs for
+                             up to n seconds. Inventory is kept in
+                             ./dx_inventory.db
+  --profile-api              Report the count and latency of API calls per
+                             endpoint when the script exits
   --config <path_to_file>    The path to the dxtools.conf file
                              [default: ./dxtools.conf]
   --logdir <path_to_file>    The path to the logfile you want to use.
@@ -71,7 +77,7 @@ VERSION = "v.0.0.015"
 from os.path import basename
 import sys
 import traceback
-from time import sleep, time
+from time import time
 from docopt import docopt
 
 from delphixpy.v1_8_0.web.jetstream import container
@@ -80,7 +86,6 @@ from delphixpy.v1_8_0.web.jetstream import template
 from delphixpy.v1_8_0.web.jetstream import datasource
 from delphixpy.v1_8_0.web import database
 from delphixpy.v1_8_0.web import user
-from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web.vo import JSDataContainerCreateParameters
 from delphixpy.v1_8_0.web.vo import JSDataSourceCreateParameters
 from delphixpy.v1_8_0.web.vo import JSTimelinePointBookmarkInput
@@ -91,11 +96,19 @@ from delphixpy.v1_8_0.exceptions import JobError
 from delphixpy.v1_8_0.exceptions import HttpError
 
 from lib.DlpxException import DlpxException
+from lib.DxCache import invalidate_cache
+from lib.DxApiProfiler import configure_profiling
+from lib.DxInventoryCache import configure_cache
+from lib.DxWorkerPool import run_async
+from lib.DxWorkerPool import set_max_workers
+from lib.DxWorkerPool import wait_all
 from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
 from lib.GetReferences import find_obj_by_name
+from lib.GetReferences import resolve_names
 from lib.GetReferences import get_obj_reference
 from lib.GetReferences import find_obj_name
-from lib.GetReferences import convert_timestamp
+from lib.GetReferences import convert_timestamps
 from lib.DxLogging import logging_est
 from lib.DxLogging import print_info
 from lib.DxLogging import print_exception
@@ -114,10 +127,12 @@ def create_container(dlpx_obj, template_name, container_name, database_name):
     js_container_params = JSDataContainerCreateParameters()
     container_ds_lst = []
     engine_name = dlpx_obj.dlpx_engines.keys()[0]
-    for db in database_name.split(':'):
-        container_ds_lst.append(build_ds_params(dlpx_obj, database, db))
 
     try:
+        db_names = database_name.split(':')
+        db_refs = resolve_names(dlpx_obj.server_session, database, db_names)
+        for db in db_names:
+            container_ds_lst.append(build_ds_params(db, db_refs[db]))
         js_template_obj = find_obj_by_name(dlpx_obj.server_session,
                                            template, template_name)
         js_container_params.template = js_template_obj.reference
@@ -127,6 +142,7 @@ def create_container(dlpx_obj, template_name, container_name, database_name):
         js_container_params.data_sources = container_ds_lst
         js_container_params.name = container_name
         container.create(dlpx_obj.server_session, js_container_params)
+        invalidate_cache(dlpx_obj.server_session, container)
         dlpx_obj.jobs[engine_name] = dlpx_obj.server_session.last_job
         print_info('JS Container {} was created successfully.'.format(
             container_name))
@@ -249,6 +265,7 @@ def delete_container(dlpx_obj, container_name, keep_vdbs=False):
             container.delete(dlpx_obj.server_session,
                              get_obj_reference(dlpx_obj.server_session,
                                                container, container_name).pop())
+        invalidate_cache(dlpx_obj.server_session, container)
     except (DlpxException, RequestError, HttpError) as e:
         print_exception('\nContainer {} was not deleted. The error '
                          'was:\n{}\n'.format(container_name, e))
@@ -265,9 +282,11 @@ def list_containers(dlpx_obj):
     js_containers = container.get_all(dlpx_obj.server_session)
     try:
         print header
-        for js_container in js_containers:
-            last_updated = convert_timestamp(dlpx_obj.server_session,
-                                             js_container.last_updated[:-5])
+        last_updated_lst = convert_timestamps(
+            dlpx_obj.server_session,
+            [js_container.last_updated[:-5] for js_container in js_containers])
+        for js_container, last_updated in zip(js_containers,
+                                               last_updated_lst):
             print_info('{}, {}, {}, {}, {}, {}'.format(js_container.name,
                        js_container.active_branch, str(js_container.owner),
                        str(js_container.reference), str(js_container.template),
@@ -324,57 +343,18 @@ def convert_dct_str(obj_dct):
     return js_str
 
 
-def build_ds_params(dlpx_obj, obj, db):
+def build_ds_params(db, db_ref):
     """
     Builds the datasource parameters
 
-    dlpx_obj: Virtualization Engine session object
-    obj: object type to use when finding db
     db: Name of the database to use when building the parameters
+    db_ref: Reference of the database
     """
     ds_params = JSDataSourceCreateParameters()
     ds_params.source = {'type': 'JSDataSource', 'name': db}
-    try:
-        db_obj = find_obj_by_name(dlpx_obj.server_session, obj, db)
-        ds_params.container = db_obj.reference
-        return ds_params
-    except RequestError as e:
-        print_exception('\nCould not find {}\n{}'.format(db, e.message))
-
-
-def run_async(func):
-    """
-        http://code.activestate.com/recipes/576684-simple-threading-decorator/
-        run_async(func)
-            function decorator, intended to make "func" run in a separate
-            thread (asynchronously).
-            Returns the created Thread object
-
-            E.g.:
-            @run_async
-            def task1():
-                do_something
-
-            @run_async
-            def task2():
-                do_something_too
-
-            t1 = task1()
-            t2 = task2()
-            ...
-            t1.join()
-            t2.join()
-    """
-    from threading import Thread
-    from functools import wraps
-
-    @wraps(func)
-    def async_func(*args, **kwargs):
-        func_hl = Thread(target=func, args=args, kwargs=kwargs)
-        func_hl.start()
-        return func_hl
+    ds_params.container = db_ref
+    return ds_params
 
-    return async_func
 
 
 def time_elapsed():
@@ -411,6 +391,7 @@ def main_workflow(engine, dlpx_obj):
     thingstodo = ["thingtodo"]
     try:
         with dlpx_obj.job_mode(single_thread):
+            job_watcher = JobWatcher(dlpx_obj.server_session)
             while len(dlpx_obj.jobs) > 0 or len(thingstodo) > 0:
                 if len(thingstodo) > 0:
                     if arguments['--create_container']:
@@ -443,8 +424,7 @@ def main_workflow(engine, dlpx_obj):
                 # get all the jobs, then inspect them
                 i = 0
                 for j in dlpx_obj.jobs.keys():
-                    job_obj = job.get(dlpx_obj.server_session,
-                                      dlpx_obj.jobs[j])
+                    job_obj = job_watcher.get(dlpx_obj.jobs[j])
                     print_debug(job_obj)
                     print_info('{}: JS Container operations: {}'.format(
                         engine['hostname'], job_obj.job_state))
@@ -462,7 +442,7 @@ def main_workflow(engine, dlpx_obj):
                     # If we have running jobs, pause before repeating the
                     # checks.
                     if len(dlpx_obj.jobs) > 0:
-                        sleep(float(arguments['--poll']))
+                        job_watcher.wait_for_change(float(arguments['--poll']))
 
     except (DlpxException, RequestError, JobError, HttpError) as e:
         print '\nError in js_container: {}:\n{}'.format(engine['hostname'], e)
@@ -526,11 +506,9 @@ def run_job(dlpx_obj, config_file_path):
 
         #run the job against the engine
         threads.append(main_workflow(engine, dlpx_obj))
-    #For each thread in the list...
-    for each in threads:
-        #join them back together so that we wait for all threads to complete
-        # before moving on
-        each.join()
+    #Wait for every workflow to finish. A failure in any of them is
+    # reported and re-raised here.
+    wait_all(threads)
 
 
 def main():
@@ -551,6 +529,9 @@ def main():
         time_start = time()
         single_thread = False
         config_file_path = arguments['--config']
+        set_max_workers(arguments['--parallel'])
+        configure_cache(arguments['--cache-ttl'])
+        configure_profiling(arguments['--profile-api'])
         #Parse the dxtools.conf and put it into a dictionary
         dx_session_obj.get_config(config_file_path)
 
@@ -0,0 +1,224 @@
+"""
+Record every API call made through a DelphixEngine session and report the
+count, latency percentiles and totals per endpoint. Calls are recorded where
+the session sends its HTTP requests, so the status and size of the raw
+response are recorded, logins included.
+
+GetSession.serversess instruments each session it creates. Nothing is
+recorded unless profiling was enabled, normally by --profile-api.
+"""
+
+import atexit
+import json
+import math
+import re
+import sys
+import threading
+from time import time
+
+VERSION = 'v.0.1.000'
+
+#Methods of the DelphixEngine HTTP session that are wrapped
+TRANSPORT_METHODS = ['get', 'post']
+
+#HTTP statuses of a successful call
+OK_STATUSES = [200, 202]
+
+#Object references in a URL, i.e. ORACLE_DB_CONTAINER-12 or JOB-3
+REFERENCE_RE = re.compile(r'/[A-Z][A-Z0-9_]*-\d+(?=/|$)')
+
+
+class ApiCallRegistry(object):
+    """
+    Thread-safe record of API calls, grouped by method and URL template
+    """
+
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def url_template(url):
+        """
+        Return url without its query string, with object references
+        replaced by {ref}
+        """
+        return REFERENCE_RE.sub('/{ref}', url.split('?')[0])
+
+
+    def record(self, method, url, status, num_bytes, latency):
+        """
+        Record one API call
+
+        method: HTTP method
+        url: URL of the call
+        status: HTTP status of the response, RequestError if the engine
+                answered with an ErrorResult, or the name of the exception
+                raised if there was no response
+        num_bytes: Size of the response body
+        latency: Seconds the call took
+        """
+
+        endpoint = '{} {}'.format(method, self.url_template(url))
+        with self._lock:
+            self.calls.setdefault(endpoint, []).append((status, num_bytes,
+                                                        latency))
+
+
+    def summary(self):
+        """
+        Return one dictionary per endpoint with the number of calls, errors,
+        bytes, total seconds and the p50, p95 and p99 latency, ordered by
+        total seconds.
+        """
+
+        with self._lock:
+            calls = dict((endpoint, list(endpoint_calls)) for
+                         endpoint, endpoint_calls in self.calls.items())
+
+        rows = []
+        for endpoint, endpoint_calls in calls.items():
+            latencies = sorted(latency for _, _, latency in endpoint_calls)
+            rows.append({
+                'endpoint': endpoint, 'count': len(endpoint_calls),
+                'errors': len([status for status, _, _ in endpoint_calls
+                               if status not in OK_STATUSES]),
+                'bytes': sum(num_bytes for _, num_bytes, _ in endpoint_calls),
+                'total': sum(latencies),
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99)})
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+
+    def report(self, output=None):
+        """
+        Write the summary as a table
+
+        output: File object to write to. Default: sys.stderr, so the report
+                does not mix with output that is parsed.
+        """
+
+        output = output or sys.stderr
+        rows = self.summary()
+        output.write('\nAPI profile\n{:<60} {:>7} {:>6} {:>10} {:>8} {:>8} '
+                     '{:>8} {:>9}\n'.format('Endpoint', 'Calls', 'Errors',
+                                            'Bytes', 'p50 ms', 'p95 ms',
+                                            'p99 ms', 'Total s'))
+        for row in rows:
+            output.write('{endpoint:<60} {count:>7} {errors:>6} {bytes:>10} '
+                         '{p50:>8.1f} {p95:>8.1f} {p99:>8.1f} '
+                         '{total:>9.2f}\n'.format(**dict(
+                             row, p50=row['p50'] * 1000,
+                             p95=row['p95'] * 1000, p99=row['p99'] * 1000)))
+        output.write('{:<60} {:>7} {:>6} {:>10} {:>8} {:>8} {:>8} '
+                     '{:>9.2f}\n'.format(
+                         'Total', sum(row['count'] for row in rows),
+                         sum(row['errors'] for row in rows),
+                         sum(row['bytes'] for row in rows), '', '', '',
+                         sum(row['total'] for row in rows)))
+
+
+def percentile(sorted_values, pct):
+    """
+    Return the nearest-rank percentile of an already sorted list
+    """
+
+    if not sorted_values:
+        return 0.0
+    rank = int(math.ceil(pct / 100.0 * len(sorted_values))) - 1
+    return sorted_values[min(max(rank, 0), len(sorted_values) - 1)]
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def configure_profiling(profile_api):
+    """
+    Apply the --profile-api argument. When it is set, API calls are recorded
+    and the report is written when the script exits.
+
+    profile_api: True to enable profiling
+    :return: The ApiCallRegistry, or None if profiling is off
+    """
+
+    global _registry
+
+    if profile_api:
+        with _registry_lock:
+            if _registry is None:
+                _registry = ApiCallRegistry()
+                atexit.register(_registry.report)
+    return _registry
+
+
+def instrument_engine(engine, registry=None):
+    """
+    Wrap the transport methods of a DelphixEngine session's HTTP session so
+    each call is recorded. Does nothing if profiling is off or the session
+    is already instrumented.
+
+    engine: A Delphix engine session object
+    registry: ApiCallRegistry to record into. Default: the shared registry
+    :return: engine
+    """
+
+    registry = registry or _registry
+    if registry is None or getattr(engine, '_dx_api_registry', None):
+        return engine
+
+    http_session = engine._http_session
+    for method in TRANSPORT_METHODS:
+        transport = getattr(http_session, method, None)
+        if transport is not None:
+            setattr(http_session, method, _record_calls(
+                registry, method.upper(), transport))
+    engine._dx_api_registry = registry
+    return engine
+
+
+def _record_calls(registry, method, transport):
+    """
+    Return transport wrapped to record each call in registry. transport
+    returns the HTTP status, headers and raw body of the response, and
+    raises an exception with status and data attributes (HttpError) for an
+    HTTP error.
+    """
+
+    def recorded_transport(url, *args, **kwargs):
+        start = time()
+        try:
+            status, headers, data = transport(url, *args, **kwargs)
+        except Exception as e:
+            status = getattr(e, 'status', None) or type(e).__name__
+            registry.record(method, url, status,
+                            len(getattr(e, 'data', None) or ''),
+                            time() - start)
+            raise
+
+        latency = time() - start
+        if _is_error_result(data):
+            registry.record(method, url, 'RequestError', len(data), latency)
+        else:
+            registry.record(method, url, status, len(data or ''), latency)
+        return status, headers, data
+
+    return recorded_transport
+
+
+def _is_error_result(data):
+    """
+    Return True if the response body is an ErrorResult, which delphixpy
+    raises as a RequestError
+    """
+
+    #Only bodies that mention ErrorResult are parsed.
+    if not data or 'ErrorResult' not in data:
+        return False
+    try:
+        return json.loads(data).get('type') == 'ErrorResult'
+    except (ValueError, AttributeError):
+        return False
@@ -0,0 +1,383 @@
+"""
+Per-engine cache of Delphix objects, indexed by name, reference and container.
+
+The lookup functions in GetReferences serve from this cache so a workflow
+downloads each object class once per engine instead of once per lookup.
+With an on-disk store (see DxInventoryCache) the indexes are also reused by
+later runs.
+"""
+
+import threading
+from bisect import bisect_left
+from time import time
+
+from DxLogging import print_debug
+
+VERSION = 'v.0.1.000'
+
+#Number of seconds an index is served before it is downloaded again
+DEFAULT_TTL = 300
+
+#Number of seconds a lookup miss is answered from the index before it is
+#downloaded again to look for newly created objects
+DEFAULT_MISS_REFRESH = 10
+
+
+class ObjectIndex(object):
+    """
+    Index of every object of one class on one engine
+    """
+
+    def __init__(self, objects, fetched=None):
+        self.fetched = fetched or time()
+        self.objects = objects
+        self.by_name = {}
+        self.by_reference = {}
+        self.by_container = {}
+
+        for obj in objects:
+            obj_name = getattr(obj, 'name', None)
+            obj_reference = getattr(obj, 'reference', None)
+            obj_container = getattr(obj, 'container', None)
+
+            #Keep the first match, as the linear searches this replaces did.
+            if obj_name is not None:
+                self.by_name.setdefault(obj_name, obj)
+            if obj_reference is not None:
+                self.by_reference[obj_reference] = obj
+            if obj_container is not None:
+                self.by_container.setdefault(obj_container, []).append(obj)
+
+
+    def expired(self, ttl):
+        """
+        Return True if the index is older than ttl seconds
+
+        ttl: Age in seconds. None means the index never expires.
+        """
+        return ttl is not None and time() - self.fetched > ttl
+
+
+class SnapshotIndex(ObjectIndex):
+    """
+    Index of the snapshots of one database, sorted by name and by the
+    timestamp of their latest change point so searches take O(log n).
+    """
+
+    def __init__(self, snapshots):
+        super(SnapshotIndex, self).__init__(snapshots)
+        self.time_snaps = sorted(
+            snapshots, key=lambda snap: str(snap.latest_change_point.timestamp))
+        self.timestamps = [str(snap.latest_change_point.timestamp)
+                           for snap in self.time_snaps]
+        self.name_snaps = sorted(snapshots, key=lambda snap: str(snap.name))
+        self.names = [str(snap.name) for snap in self.name_snaps]
+
+
+    @staticmethod
+    def _prefix_matches(keys, values, prefix, limit):
+        matches = []
+        pos = bisect_left(keys, prefix)
+        while pos < len(keys) and keys[pos].startswith(prefix) and \
+                len(matches) < limit:
+            matches.append(values[pos])
+            pos += 1
+        return matches
+
+
+    def find_by_name(self, prefix, limit=2):
+        """
+        Return up to limit snapshots whose name starts with prefix
+
+        prefix: Full or partial snapshot name. I.E. @2017-01-01T10
+        limit: Maximum number of matches to return
+        """
+        return self._prefix_matches(self.names, self.name_snaps, prefix,
+                                    limit)
+
+
+    def find_by_time(self, prefix, limit=2):
+        """
+        Return up to limit snapshots whose timestamp starts with prefix
+
+        prefix: Full or partial timestamp. I.E. 2017-01-01T10:00
+        limit: Maximum number of matches to return
+        """
+        return self._prefix_matches(self.timestamps, self.time_snaps, prefix,
+                                    limit)
+
+
+    def latest(self):
+        """
+        Return the most recent snapshot, or None if there are none
+        """
+        return self.time_snaps[-1] if self.time_snaps else None
+
+
+    def latest_before(self, timestamp):
+        """
+        Return the most recent snapshot taken before timestamp, or None
+
+        timestamp: Timestamp in the engine's format. I.E.
+                   2017-01-01T10:00:00.000Z
+        """
+        pos = bisect_left(self.timestamps, timestamp)
+        return self.time_snaps[pos - 1] if pos > 0 else None
+
+
+class DxCache(object):
+    """
+    Thread-safe cache of ObjectIndex objects keyed by engine and class
+    """
+
+    def __init__(self, ttl=DEFAULT_TTL, store=None,
+                 miss_refresh=DEFAULT_MISS_REFRESH):
+        """
+        ttl: Number of seconds an index is served before it is downloaded
+             again
+        miss_refresh: Minimum age in seconds of an index before a lookup
+                      miss downloads it again
+        store: Optional on-disk store shared with other runs. See
+               DxInventoryCache.InventoryCache
+        """
+        self.ttl = ttl
+        self.store = store
+        self.miss_refresh = miss_refresh
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+
+    @staticmethod
+    def _cache_key(engine, f_class):
+        return engine.address, f_class.__name__
+
+
+    def get_index(self, engine, f_class, refresh=False):
+        """
+        Return the ObjectIndex for f_class on engine, downloading it if it
+        is missing, expired or refresh is True.
+
+        engine: A Delphix engine session object
+        f_class: The objects class. I.E. database or timeflow.
+        refresh: Download the objects even if the index is current
+        """
+        return self._get_index(engine, f_class, refresh)[0]
+
+
+    def _get_index(self, engine, f_class, refresh=False):
+        """
+        Return a tuple of the ObjectIndex and True if it was downloaded by
+        this call.
+        """
+
+        cache_key = self._cache_key(engine, f_class)
+
+        with self._lock:
+            obj_index = self._indexes.get(cache_key)
+
+        if obj_index is None or refresh or obj_index.expired(self.ttl):
+            stored = None
+            if self.store is not None and not refresh:
+                stored = self.store.load(engine.address, f_class.__name__,
+                                         self.ttl)
+
+            if stored is not None:
+                obj_index = ObjectIndex(*stored)
+                fetched = False
+            else:
+                print_debug('Fetching {} objects from {}'.format(
+                    f_class.__name__, engine.address))
+                obj_index = ObjectIndex(f_class.get_all(engine))
+                fetched = True
+                if self.store is not None:
+                    self.store.save(engine.address, f_class.__name__,
+                                    obj_index.objects, obj_index.fetched)
+
+            with self._lock:
+                self._indexes[cache_key] = obj_index
+            return obj_index, fetched
+
+        return obj_index, False
+
+
+    def get_snapshot_index(self, engine, f_class, database_ref,
+                           refresh=False):
+        """
+        Return the SnapshotIndex of a database, downloading its snapshots if
+        the index is missing, expired or refresh is True.
+
+        engine: A Delphix engine session object
+        f_class: The snapshot class
+        database_ref: Reference of the database
+        refresh: Download the snapshots even if the index is current
+        """
+
+        cache_key = self._cache_key(engine, f_class) + (database_ref,)
+
+        with self._lock:
+            snap_index = self._indexes.get(cache_key)
+
+        if snap_index is None or refresh or snap_index.expired(self.ttl):
+            print_debug('Fetching snapshots of {} from {}'.format(
+                database_ref, engine.address))
+            snap_index = SnapshotIndex(f_class.get_all(
+                engine, database=database_ref))
+
+            with self._lock:
+                self._indexes[cache_key] = snap_index
+        return snap_index
+
+
+    def lookup(self, engine, f_class, attr, value):
+        """
+        Return the object whose attr matches value. An index older than
+        miss_refresh seconds that does not contain value is downloaded again
+        once, so objects created since the index was built are still found
+        while repeated misses do not download it every time.
+
+        engine: A Delphix engine session object
+        f_class: The objects class. I.E. database or timeflow.
+        attr: Index to search: name, reference or container
+        value: Value to match
+        :return: The matching object, or None if no match is found.
+        """
+
+        obj_index, fetched = self._get_index(engine, f_class)
+        match = self._match(obj_index, attr, value)
+
+        if match is None and self._refetch_on_miss(obj_index, fetched):
+            match = self._match(self.get_index(engine, f_class, True), attr,
+                                value)
+        return match
+
+
+    def lookup_many(self, engine, f_class, attr, values):
+        """
+        Return a dictionary of value to matching object for every value
+        found. The index is downloaded at most twice, no matter how many
+        values are searched.
+
+        engine: A Delphix engine session object
+        f_class: The objects class. I.E. database or timeflow.
+        attr: Index to search: name, reference or container
+        values: Values to match
+        """
+
+        obj_index, fetched = self._get_index(engine, f_class)
+        matches = {}
+
+        for value in values:
+            match = self._match(obj_index, attr, value)
+
+            if match is None and self._refetch_on_miss(obj_index, fetched):
+                obj_index, fetched = self._get_index(engine, f_class, True)
+                match = self._match(obj_index, attr, value)
+            if match is not None:
+                matches[value] = match
+        return matches
+
+
+    def _refetch_on_miss(self, obj_index, fetched):
+        """
+        Return True if a lookup miss should download the index again: it was
+        not fetched by this call and is older than miss_refresh seconds.
+        """
+        return not fetched and obj_index.expired(self.miss_refresh)
+
+
+    @staticmethod
+    def _match(obj_index, attr, value):
+        if attr == 'container':
+            matches = obj_index.by_container.get(value)
+            return matches[0] if matches else None
+        return getattr(obj_index, 'by_' + attr).get(value)
+
+
+    def invalidate(self, engine, f_class=None):
+        """
+        Drop cached indexes for an engine
+
+        engine: A Delphix engine session object
+        f_class: Class to drop. Default: every class cached for the engine
+        """
+
+        with self._lock:
+            for cache_key in self._indexes.keys():
+                if cache_key[0] == engine.address and (
+                        f_class is None or cache_key[1] == f_class.__name__):
+                    del self._indexes[cache_key]
+
+        if self.store is not None:
+            self.store.invalidate(engine.address, f_class and f_class.__name__)
+
+
+_object_cache = DxCache()
+
+
+def get_index(engine, f_class, refresh=False):
+    """
+    Return the shared ObjectIndex for f_class on engine. See DxCache.get_index
+    """
+    return _object_cache.get_index(engine, f_class, refresh)
+
+
+def get_snapshot_index(engine, f_class, database_ref, refresh=False):
+    """
+    Return the shared SnapshotIndex of a database. See
+    DxCache.get_snapshot_index
+    """
+    return _object_cache.get_snapshot_index(engine, f_class, database_ref,
+                                            refresh)
+
+
+def cache_lookup(engine, f_class, attr, value):
+    """
+    Search the shared cache. See DxCache.lookup
+    """
+    return _object_cache.lookup(engine, f_class, attr, value)
+
+
+def cache_lookup_many(engine, f_class, attr, values):
+    """
+    Search the shared cache for several values. See DxCache.lookup_many
+    """
+    return _object_cache.lookup_many(engine, f_class, attr, values)
+
+
+def invalidate_cache(engine, f_class=None):
+    """
+    Drop entries from the shared cache after objects were created or deleted
+
+    engine: A Delphix engine session object
+    f_class: Class to drop. Default: every class cached for the engine
+    """
+    _object_cache.invalidate(engine, f_class)
+
+
+def set_cache_ttl(ttl):
+    """
+    Set the number of seconds cached indexes are served before they are
+    downloaded again.
+
+    ttl: Age in seconds. None disables expiry, 0 disables caching.
+    """
+    _object_cache.ttl = ttl
+
+
+def set_cache_miss_refresh(miss_refresh):
+    """
+    Set the minimum age in seconds of a cached index before a lookup miss
+    downloads it again.
+
+    miss_refresh: Age in seconds. 0 downloads again on every miss.
+    """
+    _object_cache.miss_refresh = miss_refresh
+
+
+def set_inventory_store(store):
+    """
+    Share downloaded inventory with other runs through an on-disk store
+
+    store: A DxInventoryCache.InventoryCache, or None to stop using one
+    """
+    _object_cache.store = store
@@ -0,0 +1,141 @@
+"""
+Optional on-disk cache of engine inventories shared between script runs.
+
+Objects are stored per engine and class in a SQLite database together with
+the time they were fetched. DxCache reads a class from here before
+downloading it from the engine, and writes back every class it downloads.
+"""
+
+import json
+import sqlite3
+from time import time
+
+from delphixpy.v1_8_0.web import vo
+
+from DxCache import set_cache_ttl
+from DxCache import set_inventory_store
+from DxLogging import print_debug
+
+VERSION = 'v.0.1.000'
+
+#Default location of the inventory database
+DEFAULT_CACHE_FILE = 'dx_inventory.db'
+
+
+class InventoryCache(object):
+    """
+    SQLite store of the objects of each class on each engine
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, load_object=None):
+        """
+        path: Path of the SQLite database. It is created if needed.
+        load_object: Callable turning a stored dictionary back into an
+                     object. Default: the delphixpy value object for its type
+        """
+        self.path = path
+        self.load_object = load_object or _load_object
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('CREATE TABLE IF NOT EXISTS inventory ('
+                             'engine TEXT, class TEXT, fetched REAL, '
+                             'objects TEXT, PRIMARY KEY (engine, class))')
+        finally:
+            conn.close()
+
+
+    def _connect(self):
+        #A connection per call, so the store can be used from any thread.
+        return sqlite3.connect(self.path, timeout=30)
+
+
+    def load(self, engine_address, class_name, ttl):
+        """
+        Return a tuple of the stored objects and the time they were fetched,
+        or None if the class is not stored or is older than ttl seconds.
+
+        engine_address: Address of the engine
+        class_name: Name of the objects class. I.E. database
+        ttl: Age in seconds. None means stored objects never expire.
+        """
+
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT fetched, objects FROM inventory WHERE '
+                               'engine = ? AND class = ?',
+                               (engine_address, class_name)).fetchone()
+        finally:
+            conn.close()
+
+        if row is None or (ttl is not None and time() - row[0] > ttl):
+            return None
+
+        print_debug('Loading {} objects of {} from {}'.format(
+            class_name, engine_address, self.path))
+        return [self.load_object(obj_dct) for obj_dct in
+                json.loads(row[1])], row[0]
+
+
+    def save(self, engine_address, class_name, objects, fetched=None):
+        """
+        Store the objects of one class
+
+        engine_address: Address of the engine
+        class_name: Name of the objects class. I.E. database
+        objects: List of objects. Each must provide to_dict()
+        fetched: Time the objects were fetched. Default: now
+        """
+
+        obj_data = json.dumps([obj.to_dict() for obj in objects])
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO inventory VALUES '
+                             '(?, ?, ?, ?)', (engine_address, class_name,
+                                              fetched or time(), obj_data))
+        finally:
+            conn.close()
+
+
+    def invalidate(self, engine_address, class_name=None):
+        """
+        Drop stored objects of an engine
+
+        engine_address: Address of the engine
+        class_name: Class to drop. Default: every class of the engine
+        """
+
+        conn = self._connect()
+        try:
+            with conn:
+                if class_name is None:
+                    conn.execute('DELETE FROM inventory WHERE engine = ?',
+                                 (engine_address,))
+                else:
+                    conn.execute('DELETE FROM inventory WHERE engine = ? AND '
+                                 'class = ?', (engine_address, class_name))
+        finally:
+            conn.close()
+
+
+def configure_cache(cache_ttl, path=DEFAULT_CACHE_FILE):
+    """
+    Apply the --cache-ttl argument. When it is given, inventory is kept on
+    disk and reused by later runs for up to cache_ttl seconds.
+
+    cache_ttl: Age in seconds, or None to keep the in-memory cache only
+    path: Path of the SQLite database
+    """
+
+    if cache_ttl is not None:
+        set_cache_ttl(int(cache_ttl))
+        set_inventory_store(InventoryCache(path))
+
+
+def _load_object(obj_dct):
+    """
+    Build the delphixpy value object named by the dictionary's type
+    """
+    return getattr(vo, obj_dct['type']).from_dict(obj_dct)
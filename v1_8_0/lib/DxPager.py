@@ -0,0 +1,136 @@
+"""
+Iterate over a paged delphixpy collection one page at a time.
+
+get_all() with a large page_size downloads the whole collection before the
+first object can be used. iter_pages() requests one page per step instead,
+so a listing starts producing output at once and holds at most two pages
+in memory.
+    E.g.:
+    for log_data in iter_pages(oracle.log.get_all, engine, page_size=1000,
+                               prefetch=True, database=db_ref, missing=True):
+        print log_data.sequence
+"""
+
+import threading
+from Queue import Full
+from Queue import Queue
+
+from DxLogging import print_debug
+
+VERSION = 'v.0.1.000'
+
+#Number of objects requested per page when the caller does not set one
+DEFAULT_PAGE_SIZE = 500
+
+
+def fetch_pages(get_all, engine, page_size, **kwargs):
+    """
+    Generator that yields each page of a collection as a list
+
+    get_all: The get_all function of a delphixpy web module, I.E. job.get_all
+    engine: A Delphix engine session object
+    page_size: Number of objects per page
+    kwargs: Filters passed to get_all, I.E. job_state='FAILED'
+    """
+
+    page_offset = 0
+    while True:
+        page = get_all(engine, page_size=page_size, page_offset=page_offset,
+                       **kwargs)
+        print_debug('Fetched page {} with {} objects'.format(page_offset,
+                                                           len(page)))
+        if page:
+            yield page
+        if len(page) < page_size:
+            return
+        page_offset += 1
+
+
+def _prefetch_pages(pages, stopped):
+    """
+    Generator that yields the pages of pages while a background thread
+    downloads the next one
+
+    pages: Generator returned by fetch_pages
+    stopped: threading.Event set when the consumer stops early
+    """
+
+    #Holds one page, so the fetcher is never more than one page ahead.
+    page_queue = Queue(maxsize=1)
+
+    def fetch():
+        try:
+            for page in pages:
+                if not _put(page_queue, (page, None), stopped):
+                    return
+            _put(page_queue, (None, None), stopped)
+        except Exception as e:
+            _put(page_queue, (None, e), stopped)
+
+    fetcher = threading.Thread(target=fetch)
+    fetcher.daemon = True
+    fetcher.start()
+
+    while True:
+        page, error = page_queue.get()
+        if error is not None:
+            raise error
+        if page is None:
+            return
+        yield page
+
+
+def _put(page_queue, item, stopped):
+    """
+    Put item on page_queue unless the consumer stopped. Returns False if it
+    did.
+    """
+
+    while not stopped.is_set():
+        try:
+            page_queue.put(item, timeout=0.5)
+            return True
+        except Full:
+            pass
+    return False
+
+
+def iter_pages(get_all, engine, page_size=DEFAULT_PAGE_SIZE, prefetch=False,
+               **kwargs):
+    """
+    Generator that yields every object of a paged collection, requesting
+    each page when the previous one has been consumed.
+
+    Objects that move to the next page because the collection changed while
+    it was listed (I.E. new jobs pushing older ones down) are only yielded
+    once.
+
+    get_all: The get_all function of a delphixpy web module, I.E. job.get_all
+    engine: A Delphix engine session object
+    page_size: Number of objects per page. Default: DEFAULT_PAGE_SIZE
+    prefetch: Download the next page on a background thread while the
+              current one is consumed. Default: False
+    kwargs: Filters passed to get_all, I.E. missing=True
+    """
+
+    page_size = int(page_size)
+    pages = fetch_pages(get_all, engine, page_size, **kwargs)
+    stopped = threading.Event()
+    if prefetch:
+        pages = _prefetch_pages(pages, stopped)
+
+    previous_refs = set()
+    try:
+        for page in pages:
+            page_refs = set()
+            for obj in page:
+                obj_reference = getattr(obj, 'reference', None)
+                if obj_reference is not None:
+                    if obj_reference in previous_refs:
+                        continue
+                    page_refs.add(obj_reference)
+                yield obj
+            previous_refs = page_refs
+    finally:
+        #Lets the prefetch thread exit when the caller stops early.
+        stopped.set()
@@ -4,6 +4,8 @@ List, create, destroy and refresh Delphix timeflows
 # TODO:
 #    implement debug flag
 
+import csv
+import json
 import re
 import sys
 
@@ -22,8 +24,10 @@ from delphixpy.v1_8_0.web.vo import TimeflowPointTimestamp
 from delphixpy.v1_8_0.web.vo import TimeflowPointSemantic
 
 from DlpxException import DlpxException
-from GetReferences import get_obj_reference
-from GetReferences import convert_timestamp
+from DxCache import get_index
+from DxCache import get_snapshot_index
+from DxCache import invalidate_cache
+from GetReferences import convert_timestamps
 from GetReferences import find_obj_by_name
 from DxLogging import print_exception
 
@@ -53,37 +57,68 @@ class DxTimeflow(object):
             db_name))
 
 
-    def list_timeflows(self):
+    def get_timeflows(self):
         """
-        Retrieve and print all timeflows for a given engine
+        Generator joining every timeflow to its database. Timeflows and
+        databases are each fetched once and the databases are indexed by
+        reference, so the listing takes time proportional to the number of
+        timeflows.
+
+        :return: Tuples of database name, timeflow name and timestamp of the
+        timeflow's parent point
         """
 
-        all_timeflows = timeflow.get_all(self.engine)
+        try:
+            all_timeflows = timeflow.get_all(self.engine)
+            db_index = get_index(self.engine, database)
+        except RequestError as e:
+            dlpx_err = e.message
+            raise DlpxException(dlpx_err.action)
+        except (JobError, HttpError) as e:
+            raise DlpxException(e)
 
-        print 'DB Name, Timeflow Name, Timestamp'
         for tfbm_lst in all_timeflows:
+            db_obj = db_index.by_reference.get(tfbm_lst.container)
+            db_name = db_obj.name if db_obj is not None else None
+            parent_point = getattr(tfbm_lst, 'parent_point', None)
+            tf_timestamp = getattr(parent_point, 'timestamp', None)
+            yield db_name, tfbm_lst.name, tf_timestamp
 
-            try:
-                db_name = get_obj_reference(self.engine, database,
-                                            tfbm_lst.container)
 
-                print '{}, {}, {}\n'.format(str(db_name),
-                                            str(tfbm_lst.name),
-                                            str(tfbm_lst.parent_point.timestamp))
+    def list_timeflows(self, output_format='text', output=None):
+        """
+        Retrieve and print all timeflows for a given engine. Rows are
+        written as they are produced.
 
-            except AttributeError:
-                print '{}, {}\n'.format(str(tfbm_lst.name), str(db_name))
+        output_format (optional): text, csv or json. json writes one object
+                                  per line. Default: text
+        output (optional): File object to write to. Default: sys.stdout
+        """
 
-            except TypeError as e:
-                raise DlpxException('Listing Timeflows encountered an error'
-                                    ':\n{}'.format((e)))
+        output = output or sys.stdout
+        header = ['DB Name', 'Timeflow Name', 'Timestamp']
 
-            except RequestError as e:
-                dlpx_err = e.message
-                raise DlpxException(dlpx_err.action)
+        if output_format == 'csv':
+            writer = csv.writer(output)
+            writer.writerow(header)
+        elif output_format == 'json':
+            keys = ['db_name', 'timeflow_name', 'timestamp']
+        elif output_format == 'text':
+            output.write('{}\n'.format(', '.join(header)))
+        else:
+            raise DlpxException('{} is not a valid output format. Valid '
+                                'formats are text, csv and json.'.format(
+                                    output_format))
 
-            except (JobError, HttpError) as e:
-                raise DlpxException(e)
+        for tf_row in self.get_timeflows():
+            if output_format == 'csv':
+                writer.writerow([str(tf_field) for tf_field in tf_row])
+            elif output_format == 'json':
+                output.write('{}\n'.format(json.dumps(dict(zip(keys,
+                                                                tf_row)))))
+            else:
+                output.write('{}\n'.format(', '.join(
+                    [str(tf_field) for tf_field in tf_row])))
 
 
     def create_bookmark(self, bookmark_name, db_name, timestamp=None,
@@ -142,6 +177,15 @@ class DxTimeflow(object):
 
         all_bookmarks = bookmark.bookmark.get_all(self.engine)
 
+        #The engine timezone is only fetched once for the whole listing.
+        try:
+            converted_timestamps = convert_timestamps(
+                self.engine, [tfbm_lst.timestamp[:-5] if tfbm_lst.timestamp
+                              else None for tfbm_lst in all_bookmarks])
+        except RequestError as e:
+            dlpx_err = e.message
+            raise DlpxException(dlpx_err.action)
+
         if parsable is False:
             print('\nBookmark name\tReference\tTimestamp\t'
                   'Location\tTimeflow\n')
@@ -149,15 +193,9 @@ class DxTimeflow(object):
         elif parsable is True:
             print 'Bookmark name,Reference,Timestamp,Location,Timeflow'
 
-        for tfbm_lst in all_bookmarks:
+        for tfbm_lst, converted_timestamp in zip(all_bookmarks,
+                                                 converted_timestamps):
             try:
-                if tfbm_lst.timestamp is None:
-                    converted_timestamp = None
-
-                else:
-                    converted_timestamp = \
-                        convert_timestamp(self.engine, tfbm_lst.timestamp[:-5])
-
                 if parsable is False:
                     print '{} {} {} {} {}'.format(tfbm_lst.name,
                         tfbm_lst.reference, str(converted_timestamp),
@@ -170,10 +208,6 @@ class DxTimeflow(object):
             except TypeError:
                 print 'No timestamp found for {}'.format(tfbm_lst.name)
 
-            except RequestError as e:
-                dlpx_err = e.message
-                raise DlpxException(dlpx_err.action)
-
 
     def find_snapshot(self, database_ref, timestamp, snap_name=None,
                       snap_time=None):
@@ -185,19 +219,19 @@ class DxTimeflow(object):
         snap_time: time of the snapshot. Default: None
         """
 
-        snapshots = snapshot.get_all(self.engine, database=database_ref)
-
         matches = []
-        for snapshot_obj in snapshots:
-            if (str(snapshot_obj.name).startswith(timestamp) and
-               snap_name is not None):
-
-                matches.append(snapshot_obj)
-
-            elif (str(snapshot_obj.latest_change_point.timestamp).startswith(timestamp)
-                  and snap_time is not None):
-
-                matches.append(snapshot_obj)
+        for refresh in [False, True]:
+            snap_index = get_snapshot_index(self.engine, snapshot,
+                                            database_ref, refresh)
+            if snap_name is not None:
+                matches = snap_index.find_by_name(timestamp)
+            elif snap_time is not None:
+                matches = snap_index.find_by_time(timestamp)
+
+            #Only download the snapshots again if nothing matched, in case
+            # the snapshot was taken after the index was built.
+            if matches:
+                break
 
         if len(matches) == 1:
             return matches[0]
@@ -212,6 +246,31 @@ class DxTimeflow(object):
                                 'specified.\n'.format(self.engine.address))
 
 
+    def find_latest_snapshot(self, database_ref, before=None):
+        """
+        Method to find the most recent snapshot of a database
+
+        database_ref: database reference for the snapshot lookup
+        before: Only consider snapshots taken before this timestamp.
+                Default: None
+        """
+
+        snap_index = get_snapshot_index(self.engine, snapshot, database_ref)
+        if before is None:
+            return snap_index.latest()
+        return snap_index.latest_before(before)
+
+
+    def invalidate_snapshots(self):
+        """
+        Drop the cached snapshot indexes of the engine. Call this after
+        submitting a job that takes a snapshot, such as a sync, refresh or
+        rewind, so the next lookup finds the new snapshot.
+        """
+
+        invalidate_cache(self.engine, snapshot)
+
+
     def set_timeflow_point(self, container_obj, timestamp_type,
                            timestamp='LATEST', timeflow_name=None):
         """
@@ -302,6 +361,7 @@ class DxTimeflow(object):
             with job_context.async(self.engine):
                 db_ret_val = database.refresh(self.engine, child_db_ref,
                                                    tf_params)
+            self.invalidate_snapshots()
             return db_ret_val
 
         except RequestError as e:
@@ -0,0 +1,273 @@
+"""
+Bounded worker pool shared by the scripts' run_async decorator.
+
+Work is queued per engine and handed to a fixed number of worker threads in
+round-robin order, so one engine with many tasks cannot starve the others.
+Exceptions raised by a task are re-raised by Task.join().
+"""
+
+import sys
+import threading
+import traceback
+from collections import deque
+from functools import wraps
+
+from DxLogging import print_debug
+from DxLogging import print_exception
+
+VERSION = 'v.0.1.000'
+
+#Number of worker threads used when --parallel is not given
+DEFAULT_WORKERS = 10
+
+
+class TaskCancelled(Exception):
+    """
+    Raised by Task.join() for a task that was cancelled before it started
+    """
+
+
+class Task(object):
+    """
+    Handle for work submitted to a WorkerPool. It can be joined like the
+    threading.Thread objects run_async used to return.
+    """
+
+    def __init__(self, key, func, args, kwargs):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exc_info = None
+        self.cancelled = False
+        self._done = threading.Event()
+
+
+    def run(self):
+        """
+        Execute the task and record its result or exception
+        """
+        try:
+            self.result = self.func(*self.args, **self.kwargs)
+        except BaseException:
+            self.exc_info = sys.exc_info()
+            print_debug('{} failed:\n{}'.format(self.key,
+                                                traceback.format_exc()))
+        finally:
+            self._done.set()
+
+
+    def cancel(self):
+        """
+        Mark the task as cancelled. Only takes effect before it has started.
+        """
+        self.cancelled = True
+        self.exc_info = (TaskCancelled, TaskCancelled(
+            '{} was cancelled'.format(self.key)), None)
+        self._done.set()
+
+
+    def done(self):
+        """
+        Return True once the task has finished or was cancelled
+        """
+        return self._done.is_set()
+
+
+    def is_alive(self):
+        """
+        Return True while the task is queued or running
+        """
+        return not self.done()
+
+    isAlive = is_alive
+
+
+    def join(self, timeout=None):
+        """
+        Wait for the task and return its result. An exception raised by the
+        task is re-raised here.
+
+        timeout: Maximum number of seconds to wait. Default: wait until done
+        """
+
+        #Wait in short slices so the main thread still receives Ctrl+C.
+        waited = 0.0
+        while not self._done.wait(0.5):
+            waited += 0.5
+            if timeout is not None and waited >= timeout:
+                return None
+
+        if self.exc_info is not None:
+            raise self.exc_info[1]
+        return self.result
+
+
+class WorkerPool(object):
+    """
+    Runs submitted tasks on at most max_workers threads, taking tasks from
+    each key's queue in turn.
+    """
+
+    def __init__(self, max_workers=DEFAULT_WORKERS):
+        self.max_workers = max_workers
+        self._queues = {}
+        self._key_order = deque()
+        self._workers = []
+        self._pending = 0
+        self._idle = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+
+
+    def submit(self, key, func, *args, **kwargs):
+        """
+        Queue func(*args, **kwargs) and return its Task
+
+        key: Fairness key, normally the engine hostname
+        func: Callable to run
+        """
+
+        task = Task(key, func, args, kwargs)
+
+        #A task submitted from a worker runs inline. Queuing it could leave
+        # every worker waiting on tasks that can never start.
+        if getattr(self._local, 'is_worker', False):
+            task.run()
+            return task
+
+        with self._cond:
+            if key not in self._queues:
+                self._queues[key] = deque()
+                self._key_order.append(key)
+            self._queues[key].append(task)
+            self._pending += 1
+
+            if self._pending > self._idle and \
+                    len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._worker)
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+            self._cond.notify()
+        return task
+
+
+    def cancel_pending(self):
+        """
+        Cancel every task that has not started yet
+        """
+
+        with self._cond:
+            for key in self._key_order:
+                for task in self._queues[key]:
+                    task.cancel()
+            self._queues.clear()
+            self._key_order.clear()
+            self._pending = 0
+
+
+    def _next_task(self):
+        """
+        Pop the next task, rotating through the keys. Caller holds _cond.
+        """
+
+        key = self._key_order.popleft()
+        key_queue = self._queues[key]
+        task = key_queue.popleft()
+        self._pending -= 1
+
+        if key_queue:
+            self._key_order.append(key)
+        else:
+            del self._queues[key]
+        return task
+
+
+    def _worker(self):
+        self._local.is_worker = True
+
+        while True:
+            with self._cond:
+                while not self._key_order:
+                    self._idle += 1
+                    self._cond.wait()
+                    self._idle -= 1
+                task = self._next_task()
+
+            if not task.cancelled:
+                task.run()
+
+
+_worker_pool = WorkerPool()
+
+
+def set_max_workers(max_workers):
+    """
+    Set the number of worker threads of the shared pool, normally from the
+    --parallel argument.
+
+    max_workers: Number of workers. None keeps the current setting.
+    """
+
+    if max_workers is not None:
+        _worker_pool.max_workers = max(int(max_workers), 1)
+
+
+def submit(key, func, *args, **kwargs):
+    """
+    Queue func on the shared pool and return its Task. See WorkerPool.submit
+    """
+    return _worker_pool.submit(key, func, *args, **kwargs)
+
+
+def run_async(func):
+    """
+    Function decorator that runs func on the shared worker pool and returns
+    its Task. Tasks are grouped by the engine passed as the first argument.
+        E.g.:
+        @run_async
+        def main_workflow(engine):
+            do_something
+        wait_all([main_workflow(engine) for engine in engines])
+    """
+
+    @wraps(func)
+    def async_func(*args, **kwargs):
+        key = func.__name__
+        if args and isinstance(args[0], dict):
+            key = args[0].get('hostname', key)
+        return _worker_pool.submit(key, func, *args, **kwargs)
+
+    return async_func
+
+
+def wait_all(tasks):
+    """
+    Wait for every task. Pending tasks are cancelled on Ctrl+C. If tasks
+    failed, each failure is reported and the first one is re-raised.
+
+    tasks: List of Task objects
+    :return: List of results in the order of tasks
+    """
+
+    results = []
+    errors = []
+
+    try:
+        for task in tasks:
+            try:
+                results.append(task.join())
+            except Exception as e:
+                results.append(None)
+                errors.append(e)
+                print_exception('{} failed: {}'.format(task.key, e))
+
+    except KeyboardInterrupt:
+        _worker_pool.cancel_pending()
+        raise
+
+    if errors:
+        raise errors[0]
+    return results
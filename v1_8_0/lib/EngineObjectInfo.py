@@ -1,3 +1,27 @@
+"""
+Lookups of information about objects on a Delphix engine
+"""
+
+from delphixpy.v1_8_0.exceptions import HttpError
+from delphixpy.v1_8_0.exceptions import RequestError
+from delphixpy.v1_8_0.web import database
+from delphixpy.v1_8_0.web import snapshot
+from delphixpy.v1_8_0.web import source
+from delphixpy.v1_8_0.web import timeflow
+from delphixpy.v1_8_0.web.capacity import consumer
+
+from DlpxException import DlpxException
+from DxCache import get_index
+from DxCache import get_snapshot_index
+from DxLogging import print_exception
+
+VERSION = 'v.0.0.002'
+
+#Fields of the rows returned by get_database_usage, in output order
+DATABASE_USAGE_KEYS = ['name', 'provision_container', 'active_space_gb',
+                       'snapshot_space_gb', 'enabled', 'status']
+
+
 def find_source_obj(dlpx_obj, datasource_ref):
     """
     Find the source object for a Jet Stream datasource.
@@ -50,8 +74,42 @@ def find_latest_dsource_snap(dlpx_obj, obj_ref):
     :type: str
     """
 
-    latest = None
-    for snap in snapshot.get_all(dlpx_obj.server_session, database=obj_ref):
-        if latest < snap.latest_change_point.timestamp:
-            latest = snap.latest_change_point.timestamp
-    return latest
+    latest = get_snapshot_index(dlpx_obj.server_session, snapshot,
+                                obj_ref).latest()
+    if latest is not None:
+        return latest.latest_change_point.timestamp
+
+
+def get_database_usage(engine):
+    """
+    Generator that yields the capacity and state of every database. The
+    capacity consumers are joined to their sources through the source index,
+    so the listing takes one pass over each collection. Both are downloaded
+    on every call, as a cached index would report the state and space of an
+    earlier run.
+
+    engine: A Delphix engine session object
+    :return: Dictionaries with the fields in DATABASE_USAGE_KEYS. enabled
+             and status are None when the source could not be found, I.E.
+             for an unlinked object.
+    """
+
+    source_index = get_index(engine, source, refresh=True)
+
+    for db_stats in get_index(engine, consumer, refresh=True).objects:
+        src_objs = source_index.by_container.get(db_stats.container)
+        src_obj = src_objs[0] if src_objs else \
+            source_index.by_name.get(db_stats.name)
+
+        provision_container = db_stats.parent
+        if src_obj is not None and src_obj.virtual is False:
+            provision_container = 'dSource'
+
+        yield {'name': str(db_stats.name),
+               'provision_container': str(provision_container),
+               'active_space_gb':
+                   db_stats.breakdown.active_space / 1024 / 1024 / 1024,
+               'snapshot_space_gb':
+                   db_stats.breakdown.sync_space / 1024 / 1024 / 1024,
+               'enabled': src_obj.runtime.enabled if src_obj else None,
+               'status': src_obj.runtime.status if src_obj else None}
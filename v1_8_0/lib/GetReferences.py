@@ -3,6 +3,7 @@ Module that provides lookups of references and names of Delphix objects.
 """
 
 import re
+import threading
 from datetime import datetime
 from dateutil import tz
 
@@ -17,10 +18,35 @@ from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web import sourceconfig
 
 from DlpxException import DlpxException
+from DxCache import cache_lookup
+from DxCache import cache_lookup_many
+from DxCache import get_index
 from DxLogging import print_debug
 from DxLogging import print_exception
 
-VERSION = 'v.0.2.0019'
+VERSION = 'v.0.2.0020'
+
+#Timezone of each engine, fetched once and kept for the life of the process
+_engine_tz = {}
+_engine_tz_lock = threading.Lock()
+
+
+def get_engine_tz(engine):
+    """
+    Return the engine's timezone. It is fetched from the engine on the first
+    call and served from memory afterwards.
+    engine: A Delphix engine session object.
+    """
+
+    with _engine_tz_lock:
+        engine_tz = _engine_tz.get(engine.address)
+
+    if engine_tz is None:
+        engine_tz = tz.gettz(time.time.get(engine).system_time_zone)
+        with _engine_tz_lock:
+            _engine_tz[engine.address] = engine_tz
+    return engine_tz
+
 
 def convert_timestamp(engine, timestamp):
     """
@@ -29,14 +55,32 @@ def convert_timestamp(engine, timestamp):
     timestamp: the timstamp in Zulu/UTC to be converted
     """
 
-    default_tz = tz.gettz('UTC')
-    engine_tz = time.time.get(engine)
+    return _convert_timestamp(timestamp, get_engine_tz(engine))
+
+
+def convert_timestamps(engine, timestamps):
+    """
+    Convert a sequence of timestamps from Zulu/UTC to the Engine's timezone
+    engine: A Delphix engine session object.
+    timestamps: Iterable of timestamps in Zulu/UTC to be converted
+    :return: List of converted timestamps. None for timestamps that could
+    not be converted.
+    """
+
+    engine_tz = get_engine_tz(engine)
+    return [_convert_timestamp(timestamp, engine_tz)
+            for timestamp in timestamps]
+
+
+def _convert_timestamp(timestamp, engine_tz):
+    """
+    Convert one timestamp from Zulu/UTC to engine_tz
+    """
 
     try:
-        convert_tz = tz.gettz(engine_tz.system_time_zone)
         utc = datetime.strptime(timestamp, '%Y-%m-%dT%H:%M:%S')
-        utc = utc.replace(tzinfo=default_tz)
-        converted_tz = utc.astimezone(convert_tz)
+        utc = utc.replace(tzinfo=tz.tzutc())
+        converted_tz = utc.astimezone(engine_tz)
         engine_local_tz = '{} {} {}'.format(str(converted_tz.date()),
                                             str(converted_tz.time()),
                                             str(converted_tz.tzname()))
@@ -54,10 +98,8 @@ def find_all_objects(engine, f_class):
     :return: List of objects
     """
 
-    return_lst = []
-
     try:
-        return f_class.get_all(engine)
+        return list(get_index(engine, f_class).objects)
 
     except (JobError, HttpError) as e:
         raise DlpxException('{} Error encountered in {}: {}\n'.format(
@@ -71,10 +113,33 @@ def find_obj_specs(engine, obj_lst):
     obj_lst: List of names for replication
     :return: List of references for the given object names
     """
-    rep_lst = []
-    for obj in obj_lst:
-        rep_lst.append(find_obj_by_name(engine, database, obj).reference)
-    return rep_lst
+    obj_refs = resolve_names(engine, database, obj_lst)
+    return [obj_refs[obj] for obj in obj_lst]
+
+
+def resolve_names(engine, f_class, names):
+    """
+    Function to find the references of several objects of one class with a
+    single fetch of that class
+    engine: A Delphix engine session object
+    f_class: The objects class. I.E. database or group.
+    names: List of object names
+    :return: Dictionary of object name to reference
+    """
+
+    try:
+        matches = cache_lookup_many(engine, f_class, 'name', names)
+    except AttributeError as e:
+        raise DlpxException('Could not find reference for object class'
+                            '{}.\n'.format(e))
+
+    #Report every missing name at once instead of failing on the first one.
+    missing = [name for name in names if name not in matches]
+    if missing:
+        raise DlpxException('{} were not found on engine {}.\n'.format(
+            ', '.join(missing), engine.address))
+
+    return dict((name, obj.reference) for name, obj in matches.items())
 
 
 def get_running_job(engine, target_ref):
@@ -116,23 +181,22 @@ def find_obj_by_name(engine, f_class, obj_name, active_branch=False):
     return_list = []
 
     try:
-        all_objs = f_class.get_all(engine)
+        obj = cache_lookup(engine, f_class, 'name', obj_name)
     except AttributeError as e:
         raise DlpxException('Could not find reference for object class'
                             '{}.\n'.format(e))
-    for obj in all_objs:
-        if obj.name == obj_name:
 
-            if active_branch is False:
-                return(obj)
+    if obj is not None:
+        if active_branch is False:
+            return(obj)
 
-            #This code is for JS objects only.
-            elif active_branch is True:
-                return_list.append(obj.reference)
-                return_list.append(obj.active_branch)
-                return(return_list)
+        #This code is for JS objects only.
+        elif active_branch is True:
+            return_list.append(obj.reference)
+            return_list.append(obj.active_branch)
+            return(return_list)
 
-            return obj
+        return obj
 
     #If the object isn't found, raise an exception.
     raise DlpxException('{} was not found on engine {}.\n'.format(
@@ -150,22 +214,23 @@ def find_source_by_dbname(engine, f_class, obj_name, active_branch=False):
                    the reference.
     """
 
-    return_list = []
-
     try:
-        all_objs = f_class.get_all(engine)
+        obj = cache_lookup(engine, f_class, 'name', obj_name)
     except AttributeError as e:
         raise DlpxException('Could not find reference for object class'
                             '{}.\n'.format(e))
-    for obj in all_objs:
-        
-        if obj.name == obj_name:
-            print_debug('object: {}\n\n'.format(obj))
-            print_debug(obj.name)
-            print_debug(obj.reference)
-            source_obj = source.get_all(engine,database=obj.reference)
-            print_debug('source: {}\n\n'.format(source_obj))
-            return source_obj[0]
+
+    if obj is not None:
+        print_debug('object: {}\n\n'.format(obj))
+        print_debug(obj.name)
+        print_debug(obj.reference)
+        source_obj = cache_lookup(engine, source, 'container', obj.reference)
+        print_debug('source: {}\n\n'.format(source_obj))
+
+        if source_obj is None:
+            raise DlpxException('Could not find the source for {} on engine '
+                                '{}.\n'.format(obj_name, engine.address))
+        return source_obj
 
     #If the object isn't found, raise an exception.
     raise DlpxException('{} was not found on engine {}.\n'.format(
@@ -184,25 +249,26 @@ def get_obj_reference(engine, obj_type, obj_name, search_str=None,
 
     ret_lst = []
 
-    results = obj_type.get_all(engine)
+    if container is False:
+        result = cache_lookup(engine, obj_type, 'name', obj_name)
 
-    for result in results:
-        if container is False:
-            if result.name == obj_name:
-                ret_lst.append(result.reference)
+        if result is not None:
+            ret_lst.append(result.reference)
 
-                if search_str:
-                    if re.search(search_str, result.reference, re.IGNORECASE):
-                        ret_lst.append(True)
-                    else:
-                        ret_lst.append(False)
+            if search_str:
+                if re.search(search_str, result.reference, re.IGNORECASE):
+                    ret_lst.append(True)
+                else:
+                    ret_lst.append(False)
 
-                return ret_lst
-        else:
-            if result.container == obj_name:
-                ret_lst.append(result.reference)
+            return ret_lst
+    else:
+        result = cache_lookup(engine, obj_type, 'container', obj_name)
 
-                return ret_lst
+        if result is not None:
+            ret_lst.append(result.reference)
+
+            return ret_lst
 
     raise DlpxException('Reference not found for {}'.format(obj_name))
 
@@ -216,6 +282,13 @@ def find_obj_name(engine, f_class, obj_reference):
     obj_reference: The object reference to retrieve the name
     """
     try:
+        #Serve the name from the cached index, and only fall back to a
+        # single get() for objects that are not in it.
+        if hasattr(f_class, 'get_all'):
+            obj = get_index(engine, f_class).by_reference.get(obj_reference)
+            if obj is not None:
+                return obj.name
+
         obj_name = f_class.get(engine, obj_reference)
         return obj_name.name
 
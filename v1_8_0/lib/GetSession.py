@@ -8,8 +8,10 @@
    object
 """
 
+import hashlib
 import json
 import ssl
+import threading
 from time import sleep
 
 from delphixpy.v1_8_0.delphix_engine import DelphixEngine
@@ -21,27 +23,86 @@ from delphixpy.v1_8_0.web import job
 from delphixpy.v1_8_0.web import system
 
 from lib.DlpxException import DlpxException
+from lib.DxApiProfiler import instrument_engine
 from lib.DxLogging import print_debug
 from lib.DxLogging import print_info
+from lib.JobTracker import JobTracker
 
 
-VERSION = 'v.0.2.09'
+VERSION = 'v.0.2.10'
+
+#Error the engine returns for a session that is no longer logged in, i.e.
+# after the engine restarted.
+NOT_LOGGED_IN = 'exception.webservices.login.notLoggedIn'
 
 
 class GetSession(object):
     """
     Class to get the configuration and returns an Delphix authentication
     object
+
+    Sessions are pooled per engine, user and thread. A DelphixEngine keeps its
+    HTTP connection, job context stack and last_job on the object and is
+    not thread-safe, so it must only be used by the thread that created it.
+    A worker thread reuses its session for every task it runs against the
+    same engine. server_session and jobs are tracked per thread, so workers
+    started by run_job() against different engines do not overwrite each
+    other.
     """
 
     def __init__(self):
-        self.server_session = None
         self.dlpx_engines = {}
-        self.jobs = {}
+        self._session_pool = {}
+        self._pool_lock = threading.Lock()
+        self._local = threading.local()
 
 
     def __getitem__(self, key):
-        return self.data[key]
+        return self.dlpx_engines[key]
+
+
+    @property
+    def server_session(self):
+        """
+        The DelphixEngine session used by the calling thread
+        """
+        return getattr(self._local, 'server_session', None)
+
+
+    @server_session.setter
+    def server_session(self, engine_session):
+        self._local.server_session = engine_session
+
+
+    @property
+    def jobs(self):
+        """
+        Dictionary of running jobs submitted by the calling thread
+        """
+        try:
+            return self._local.jobs
+        except AttributeError:
+            self._local.jobs = {}
+            return self._local.jobs
+
+
+    @jobs.setter
+    def jobs(self, jobs_dct):
+        self._local.jobs = jobs_dct
+
+
+    @property
+    def job_tracker(self):
+        """
+        JobTracker of the jobs the calling thread submitted on its
+        server_session
+        """
+        job_tracker = getattr(self._local, 'job_tracker', None)
+        if job_tracker is None or \
+                job_tracker.engine is not self.server_session:
+            job_tracker = JobTracker(self.server_session)
+            self._local.job_tracker = job_tracker
+        return job_tracker
 
 
     def get_config(self, config_file_path='./dxtools.conf'):
@@ -89,6 +150,13 @@ class GetSession(object):
         f_engine_username: Username to authenticate
         f_engine_password: User's password
         f_engine_namespace: Namespace to use for this session. Default: DOMAIN
+
+        A session is created once per engine, user and thread, and reused by
+        every later call with the same arguments from the same thread. A
+        call with a different password logs in again. Do not hand the
+        returned session to another thread; call serversess() from that
+        thread instead.
+        :return: delphixpy.v1_8_0.delphix_engine.DelphixEngine
         """
 
 #        if use_https:
@@ -96,20 +164,110 @@ class GetSession(object):
 #                ssl._create_default_https_context = \
 #                    ssl._create_unverified_context
 
+        #Only the calling thread uses its key, so logins to the same engine
+        # from different threads run in parallel. The password is not part of
+        # the key; a digest of it is kept with the session and compared.
+        pool_key = (f_engine_address, f_engine_username, f_engine_namespace,
+                    threading.current_thread().ident)
+        password_digest = hashlib.sha256(f_engine_password or '').hexdigest()
+
+        with self._pool_lock:
+            engine_session, session_digest = self._session_pool.get(
+                pool_key, (None, None))
+
+        if engine_session is None or session_digest != password_digest:
+            try:
+                if f_engine_password:
+                    engine_session = DelphixEngine(f_engine_address,
+                                                   f_engine_username,
+                                                   f_engine_password,
+                                                   f_engine_namespace)
+                elif f_engine_password is None:
+                    engine_session = DelphixEngine(f_engine_address,
+                                                   f_engine_username,
+                                                   None,
+                                                   f_engine_namespace)
+
+            except (HttpError, RequestError, JobError) as e:
+                raise DlpxException('ERROR: An error occurred while '
+                                    'authenticating to {}:\n {}\n'.format(
+                                    f_engine_address, e))
+
+            #Records the session's API calls when --profile-api is set.
+            instrument_engine(engine_session)
+
+            with self._pool_lock:
+                self._session_pool[pool_key] = (engine_session,
+                                                password_digest)
+            print_debug('Created session for {}'.format(f_engine_address))
+
+        #A worker thread can run workflows for several engines in turn, so
+        # its job table is only kept while it stays on the same session.
+        if self.server_session is not engine_session:
+            self.jobs = {}
+        self.server_session = engine_session
+        #Kept so server_wait() can log in again after a restart.
+        self._local.session_args = (f_engine_address, f_engine_username,
+                                    f_engine_password, f_engine_namespace)
+        return engine_session
+
+
+    def engine_session(self, engine_name):
+        """
+        Return the calling thread's pooled session for an engine in
+        dxtools.conf, creating it on first use. The session also becomes the calling thread's
+        server_session.
+
+        engine_name: hostname of the engine as listed in dxtools.conf
+        """
+
         try:
-            if f_engine_password:
-                self.server_session = DelphixEngine(f_engine_address,
-                                                    f_engine_username,
-                                                    f_engine_password,
-                                                    f_engine_namespace)
-            elif f_engine_password is None:
-                self.server_session = DelphixEngine(f_engine_address,
-                                                    f_engine_username,
-                                                    None, f_engine_namespace)
+            engine = self.dlpx_engines[engine_name]
+        except KeyError:
+            raise DlpxException('ERROR: Delphix Engine {} cannot be found in '
+                                'the configuration.\n'.format(engine_name))
+
+        return self.serversess(engine['ip_address'], engine['username'],
+                               engine['password'])
+
+
+    def drop_session(self, f_engine_address):
+        """
+        Remove every pooled session for an engine address, i.e. after the
+        engine was restarted and the sessions are no longer valid.
+
+        f_engine_address: The Virtualization Engine's address (IP/DNS Name)
+        """
+
+        with self._pool_lock:
+            for pool_key in self._session_pool.keys():
+                if pool_key[0] == f_engine_address:
+                    del self._session_pool[pool_key]
+
+
+    def handle_session_error(self, error):
+        """
+        Drop the pooled sessions of the calling thread's engine if error
+        shows that its session is no longer logged in. The next serversess()
+        call for the engine logs in again.
+
+        error: HttpError or RequestError raised by a call on server_session
+        :return: True if the sessions were dropped
+        """
+
+        if isinstance(error, HttpError):
+            expired = error.status == 403 and NOT_LOGGED_IN in str(error.data)
+        elif isinstance(error, RequestError):
+            expired = getattr(getattr(error.error, 'error', None), 'id',
+                              None) == NOT_LOGGED_IN
+        else:
+            expired = False
 
-        except (HttpError, RequestError, JobError) as e:
-            raise DlpxException('ERROR: An error occurred while authenticating'
-                                ' to {}:\n {}\n'.format(f_engine_address, e))
+        if expired:
+            print_debug('Session for {} is no longer logged in'.format(
+                self.server_session.address))
+            self.drop_session(self.server_session.address)
+        return expired
 
 
     def job_mode(self, single_thread=True):
@@ -163,6 +321,11 @@ class GetSession(object):
             try:
                 system.get(self.server_session)
                 break
+            except (HttpError, RequestError) as e:
+                #A restart ends the engine's sessions, so log in again.
+                if self.handle_session_error(e):
+                    self.serversess(*self._local.session_args)
+                    continue
             except:    
                 pass
             print_info("Waiting for Delphix Engine to be ready")
@@ -0,0 +1,197 @@
+"""
+Track every job a workflow submits, keyed by job reference.
+
+Job dictionaries keyed by engine hostname keep only the last job submitted
+on an engine, so a workflow that starts several jobs waits on just one of
+them. JobTracker records each job under its own reference together with
+its target and submit time. Jobs are read through a JobWatcher, so a job is
+only fetched again after the notification channel reports a change.
+    E.g.:
+    job_tracker = JobTracker(engine, on_complete=report_job)
+    for env_obj in env_objs:
+        job_tracker.submit(env_obj.name, environment.refresh,
+                           env_obj.reference)
+    job_tracker.wait(10)
+"""
+
+from datetime import datetime
+from time import time
+
+from DxLogging import print_debug
+from JobWatcher import JOB_END_STATES
+from JobWatcher import JobWatcher
+
+VERSION = 'v.0.1.000'
+
+#Format of the start_time and update_time of a Job object
+JOB_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+class TrackedJob(object):
+    """
+    One job submitted by a workflow
+    """
+
+    def __init__(self, reference, target=None, on_complete=None):
+        """
+        reference: Reference of the job
+        target: Name of the object the job acts on
+        on_complete: Optional callable receiving this TrackedJob when the
+                     job ends
+        """
+        self.reference = reference
+        self.target = target
+        self.on_complete = on_complete
+        self.submitted = time()
+        self.finished = None
+        self.job_state = 'RUNNING'
+        self.job_obj = None
+
+
+    @property
+    def duration(self):
+        """
+        Seconds the job ran. The engine's start and update times are used
+        once the job has ended, otherwise the time since it was submitted.
+        """
+        if self.job_obj is not None:
+            try:
+                return (_parse_job_time(self.job_obj.update_time) -
+                        _parse_job_time(self.job_obj.start_time)
+                        ).total_seconds()
+            except (AttributeError, TypeError, ValueError):
+                pass
+        return (self.finished or time()) - self.submitted
+
+
+class JobTracker(object):
+    """
+    Tracks the jobs submitted on one engine session
+    """
+
+    def __init__(self, engine, on_complete=None, job_watcher=None):
+        """
+        engine: A Delphix engine session object
+        on_complete: Optional callable receiving each TrackedJob when it
+                     ends
+        job_watcher: JobWatcher the jobs are read through.
+                     Default: a new JobWatcher of engine
+        """
+        self.engine = engine
+        self.on_complete = on_complete
+        self.job_watcher = job_watcher or JobWatcher(engine)
+        self.jobs = {}
+        self.finished = []
+
+
+    def add(self, job_ref, target=None, on_complete=None):
+        """
+        Track a job. Returns its TrackedJob, or None if job_ref is None,
+        I.E. the call did not start a job.
+
+        job_ref: Reference of the job
+        target: Name of the object the job acts on
+        on_complete: Optional callable receiving the TrackedJob when the
+                     job ends, called before the tracker's on_complete
+        """
+        if job_ref is None:
+            return None
+        if job_ref not in self.jobs:
+            self.jobs[job_ref] = TrackedJob(job_ref, target, on_complete)
+        return self.jobs[job_ref]
+
+
+    def submit(self, target, func, *args, **kwargs):
+        """
+        Call func(engine, *args, **kwargs) and track the job it starts under
+        target. Returns the result of func.
+
+        last_job keeps the previous job when a call starts none, so it is
+        cleared before the call.
+        """
+        self.engine.last_job = None
+        result = func(self.engine, *args, **kwargs)
+        self.add(self.engine.last_job, target)
+        return result
+
+
+    @property
+    def running(self):
+        """
+        List of the TrackedJobs that have not ended
+        """
+        return [tracked for tracked in self.jobs.values() if
+                tracked.finished is None]
+
+
+    def failed(self):
+        """
+        Return the TrackedJobs that ended in a state other than COMPLETED
+        """
+        return [tracked for tracked in self.finished if
+                tracked.job_state != 'COMPLETED']
+
+
+    def poll(self):
+        """
+        Update every running job. Only new jobs and jobs the notification
+        channel reported a change for are fetched.
+        :return: List of the TrackedJobs that ended, in the order found
+        """
+
+        ended = []
+        for tracked in self.running:
+            job_obj = self.job_watcher.get(tracked.reference)
+            tracked.job_state = job_obj.job_state
+            if job_obj.job_state not in JOB_END_STATES:
+                continue
+
+            self.job_watcher.forget(tracked.reference)
+            tracked.job_obj = job_obj
+            tracked.finished = time()
+            self.finished.append(tracked)
+            ended.append(tracked)
+            print_debug('{}: Job {} for {} {}'.format(
+                self.engine.address, tracked.reference, tracked.target,
+                tracked.job_state))
+
+            for callback in [tracked.on_complete, self.on_complete]:
+                if callback is not None:
+                    callback(tracked)
+        return ended
+
+
+    def wait_for_change(self, timeout):
+        """
+        Block until a tracked job changes state or timeout seconds pass.
+        See JobWatcher.wait_for_change().
+        """
+        return self.job_watcher.wait_for_change(timeout)
+
+
+    def wait(self, poll_interval, timeout=None):
+        """
+        Poll until every tracked job has ended or timeout seconds pass.
+
+        poll_interval: Maximum seconds to wait for a change between polls
+        timeout: Maximum number of seconds to wait. Default: no limit
+        :return: List of the TrackedJobs still running
+        """
+
+        deadline = timeout and time() + float(timeout)
+        while True:
+            self.poll()
+            running = self.running
+            if not running or (deadline and time() >= deadline):
+                return running
+            wait_time = float(poll_interval)
+            if deadline:
+                wait_time = min(wait_time, deadline - time())
+            self.wait_for_change(wait_time)
+
+
+def _parse_job_time(job_time):
+    """
+    Return the datetime of a Job object's start_time or update_time
+    """
+    return datetime.strptime(str(job_time), JOB_TIME_FORMAT)
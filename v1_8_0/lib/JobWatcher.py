@@ -0,0 +1,192 @@
+"""
+Wait on Delphix jobs through the engine's notification channel instead of
+calling job.get() for every job on every poll cycle.
+
+Jobs and notifications are read with the delphixpy modules of the engine's
+API version, so scripts still on an older version, I.E. v1_6_0, can use it.
+"""
+
+from importlib import import_module
+from time import sleep
+from time import time
+from uuid import uuid4
+
+from DxLogging import print_debug
+
+VERSION = 'v.0.1.000'
+
+JOB_END_STATES = ['CANCELED', 'COMPLETED', 'FAILED']
+
+
+class JobWatcher(object):
+    """
+    Tracks the jobs of one engine session. Job objects are fetched once when
+    first requested and again only after the notification channel reports a
+    state change for them. Each watcher reads its own channel, so two
+    watchers on one session do not consume each other's notifications.
+    The channel is opened when the watcher is created, so create it before
+    submitting the jobs it watches.
+    """
+
+    def __init__(self, engine, fetch_notifications=None, fetch_job=None,
+                 resync_interval=60):
+        """
+        engine: A Delphix engine session object
+        fetch_notifications: Callable(engine, timeout, channel) returning a
+                             list of notifications.
+                             Default: notification.get_all of the engine's
+                             API version
+        fetch_job: Callable(engine, job_ref) returning a Job object.
+                   Default: job.get of the engine's API version
+        resync_interval: Seconds after which every watched job is fetched
+                         again even if no notification was received for it.
+        """
+        self.engine = engine
+        self.fetch_notifications = fetch_notifications or \
+            _get_notifications
+        self.fetch_job = fetch_job or _api_module(engine, 'web.job').get
+        api_exceptions = _api_module(engine, 'exceptions')
+        self.api_errors = (api_exceptions.HttpError,
+                           api_exceptions.RequestError)
+        self.resync_interval = resync_interval
+        self.job_objs = {}
+        self.stale = set()
+        self.last_sync = time()
+        self.channel = 'JobWatcher-{}'.format(uuid4().hex)
+        self.channel_ok = True
+        self._open_channel()
+
+
+    def _open_channel(self):
+        """
+        Create the notification channel without waiting, so the engine
+        queues the changes of jobs that end before the first
+        wait_for_change()
+        """
+
+        try:
+            self.fetch_notifications(self.engine, 0, self.channel)
+        except self.api_errors as e:
+            print_debug('{}: Notification channel unavailable, polling '
+                        'jobs instead: {}'.format(self.engine.address, e))
+            self.channel_ok = False
+
+
+    def get(self, job_ref):
+        """
+        Return the Job object for job_ref, fetching it only if it is new or
+        changed since it was last fetched.
+
+        job_ref: Reference of the job
+        """
+
+        if job_ref not in self.job_objs or job_ref in self.stale:
+            self.job_objs[job_ref] = self.fetch_job(self.engine, job_ref)
+            self.stale.discard(job_ref)
+        return self.job_objs[job_ref]
+
+
+    def forget(self, job_ref):
+        """
+        Stop tracking a job, i.e. once it has finished.
+
+        job_ref: Reference of the job
+        """
+        self.job_objs.pop(job_ref, None)
+        self.stale.discard(job_ref)
+
+
+    def wait_for_change(self, timeout):
+        """
+        Block until a watched job changes state or timeout seconds pass.
+        If the notification channel is unavailable this falls back to
+        sleeping for timeout seconds.
+
+        timeout: Maximum number of seconds to wait
+        :return: List of job references that changed
+        """
+
+        changed = []
+        deadline = time() + float(timeout)
+
+        while not changed and time() < deadline:
+            if not self.channel_ok:
+                sleep(max(deadline - time(), 0))
+                changed = self.resync()
+                break
+
+            try:
+                notifications = self.fetch_notifications(
+                    self.engine, max(deadline - time(), 0), self.channel)
+            except self.api_errors as e:
+                print_debug('{}: Notification channel unavailable, polling '
+                            'jobs instead: {}'.format(self.engine.address, e))
+                self.channel_ok = False
+                continue
+
+            for notify_obj in notifications:
+                changed.extend(self._apply(notify_obj))
+
+        if time() - self.last_sync > self.resync_interval:
+            changed.extend(self.resync())
+        return changed
+
+
+    def resync(self):
+        """
+        Mark every watched job as changed so the next get() fetches it.
+        :return: List of watched job references
+        """
+        self.last_sync = time()
+        self.stale.update(self.job_objs.keys())
+        return list(self.job_objs.keys())
+
+
+    def _apply(self, notify_obj):
+        """
+        Apply one notification and return the watched jobs it changed
+        """
+
+        notify_type = getattr(notify_obj, 'type', None)
+
+        #The engine dropped notifications, so any job may have changed.
+        if notify_type == 'NotificationDrop':
+            return self.resync()
+
+        if notify_type == 'JobStateNotification':
+            job_ref = notify_obj.job
+        elif notify_type == 'ObjectNotification' and \
+                getattr(notify_obj, 'object_type', None) == 'Job':
+            job_ref = notify_obj.object
+        else:
+            return []
+
+        if job_ref in self.job_objs:
+            self.stale.add(job_ref)
+            return [job_ref]
+        return []
+
+
+def _api_module(engine, name):
+    """
+    Return a delphixpy module of the API version the engine session uses
+
+    engine: A Delphix engine session object. Objects without an API_VERSION
+            use 1.8.0.
+    name: Module path below the version package. I.E. web.job
+    """
+    version = getattr(engine, 'API_VERSION', '1.8.0')
+    return import_module('delphixpy.v{}.{}'.format(version.replace('.', '_'),
+                                                  name))
+
+
+def _get_notifications(engine, timeout, channel):
+    """
+    Long-poll one of the engine's notification channels
+
+    engine: A Delphix engine session object
+    timeout: Number of seconds the engine holds the request open
+    channel: Client-chosen ID of the channel
+    """
+    return _api_module(engine, 'web.notification').get_all(
+        engine, channel=channel, timeout=str(int(timeout * 1000)))
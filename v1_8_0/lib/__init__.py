@@ -3,3 +3,10 @@ import DxLogging
 import DxTimeflow
 import GetReferences
 import GetSession
+import DxCache
+import JobWatcher
+import JobTracker
+import DxWorkerPool
+import DxInventoryCache
+import DxApiProfiler
+import DxPager
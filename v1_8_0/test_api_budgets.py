@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+
+"""
+API call budgets of the script entry points, measured against the offline
+fake engine at several inventory sizes
+"""
+
+import json
+import sys
+import unittest
+from StringIO import StringIO
+
+from delphixpy.v1_8_0.web import authorization
+from delphixpy.v1_8_0.web import database
+from delphixpy.v1_8_0.web import job
+from delphixpy.v1_8_0.web import source
+from delphixpy.v1_8_0.web import timeflow
+from delphixpy.v1_8_0.web.jetstream import bookmark
+
+import dx_authorization
+import dx_operations
+import dx_operations_vdb
+import dx_refresh_db
+import js_bookmark
+from api_budget import ApiBudgetTestCase
+from lib.DxTimeflow import DxTimeflow
+
+VERSION = '0.0.0.1'
+
+
+class ApiBudgetTests(ApiBudgetTestCase):
+    """
+    Listings must not grow with N. Per-object workflows may make a fixed
+    number of calls per object. Each workflow must also produce its full
+    output, so one that fails part way cannot pass on a low call count.
+    """
+
+    def count_objects(self, f_class):
+        """
+        Return a setup callable counting the objects of f_class on the
+        engine, the number of rows a listing is expected to write
+        """
+        return lambda dlpx_obj: len(f_class.get_all(dlpx_obj.server_session))
+
+    def read_json_rows(self, output):
+        return [json.loads(row) for row in output.getvalue().splitlines()]
+
+    def test_list_databases(self):
+        def list_databases(dlpx_obj, num_databases):
+            output = StringIO()
+            dx_operations.list_databases(dlpx_obj, 'json', output)
+            self.assertEqual(num_databases,
+                             len(self.read_json_rows(output)))
+
+        self.assertWithinBudget(list_databases, lambda num_vdbs: 2,
+                                setup=self.count_objects(database))
+
+    def test_list_databases_shows_current_state(self):
+        def disable_vdb(dlpx_obj):
+            #The first listing fills the cache before the VDB is disabled.
+            dx_operations.list_databases(dlpx_obj, 'json', StringIO())
+            src_obj = [src_obj for src_obj in
+                       source.get_all(dlpx_obj.server_session) if
+                       src_obj.virtual][0]
+            with dlpx_obj.job_mode(False):
+                source.disable(dlpx_obj.server_session, src_obj.reference)
+            return src_obj.name
+
+        def list_databases(dlpx_obj, vdb_name):
+            output = StringIO()
+            dx_operations.list_databases(dlpx_obj, 'json', output)
+            rows = dict((row['name'], row) for row in
+                        self.read_json_rows(output))
+            self.assertEqual('DISABLED', rows[vdb_name]['enabled'])
+
+        self.assertWithinBudget(list_databases, lambda num_vdbs: 2,
+                                setup=disable_vdb)
+
+    def test_list_databases_vdb(self):
+        def list_databases(dlpx_obj, num_databases):
+            dx_operations_vdb.dx_session_obj = dlpx_obj
+            output = StringIO()
+            dx_operations_vdb.list_databases('json', output)
+            self.assertEqual(num_databases,
+                             len(self.read_json_rows(output)))
+
+        self.assertWithinBudget(list_databases, lambda num_vdbs: 2,
+                                setup=self.count_objects(database))
+
+    def test_list_bookmarks(self):
+        def list_bookmarks(dlpx_obj, num_bookmarks):
+            output = StringIO()
+            js_bookmark.list_bookmarks(dlpx_obj, output_format='json',
+                                       output=output)
+            rows = self.read_json_rows(output)
+            self.assertEqual(num_bookmarks, len(rows))
+            self.assertTrue(all(row['template_name'] for row in rows))
+
+        self.assertWithinBudget(list_bookmarks, lambda num_vdbs: 2,
+                                setup=self.count_objects(bookmark))
+
+    def test_list_bookmarks_by_tag(self):
+        def count_tagged(dlpx_obj):
+            return len([bookmark_obj for bookmark_obj in
+                        bookmark.get_all(dlpx_obj.server_session) if
+                        'tag3' in bookmark_obj.tags])
+
+        def list_bookmarks(dlpx_obj, num_bookmarks):
+            output = StringIO()
+            js_bookmark.list_bookmarks(dlpx_obj, tag='tag3',
+                                       output_format='json', output=output)
+            self.assertEqual(num_bookmarks, len(self.read_json_rows(output)))
+
+        self.assertWithinBudget(list_bookmarks, lambda num_vdbs: 2,
+                                setup=count_tagged)
+
+    def test_list_timeflows(self):
+        def list_timeflows(dlpx_obj, num_timeflows):
+            output = StringIO()
+            DxTimeflow(dlpx_obj.server_session).list_timeflows('json',
+                                                               output)
+            rows = self.read_json_rows(output)
+            self.assertEqual(num_timeflows, len(rows))
+            self.assertTrue(all(row['db_name'] for row in rows))
+
+        #Every timeflow is joined to its database from one listing of each
+        # class, however many timeflows there are.
+        counters = self.assertWithinBudget(list_timeflows,
+                                           lambda num_vdbs: 2,
+                                           setup=self.count_objects(timeflow))
+        for counter in counters.values():
+            self.assertEqual({'GET database': 1, 'GET timeflow': 1},
+                             counter.counts)
+
+    def test_list_authorization(self):
+        def list_authorization(dlpx_obj, num_authorizations):
+            saved_stdout = sys.stdout
+            sys.stdout = output = StringIO()
+            try:
+                dx_authorization.list_authorization(dlpx_obj)
+            finally:
+                sys.stdout = saved_stdout
+            self.assertEqual(num_authorizations,
+                             output.getvalue().count('AUTHORIZATION-'))
+
+        self.assertWithinBudget(list_authorization, lambda num_vdbs: 5,
+                                setup=self.count_objects(authorization))
+
+    def test_refresh_database(self):
+        def find_vdbs(dlpx_obj):
+            engine = dlpx_obj.server_session
+            db_objs = dict((db_obj.reference, db_obj) for db_obj in
+                           database.get_all(engine))
+            return [(src_obj, db_objs[src_obj.container]) for src_obj in
+                    source.get_all(engine) if src_obj.virtual]
+
+        def refresh_vdbs(dlpx_obj, vdbs):
+            dx_refresh_db.arguments = {'--timestamp_type': 'SNAPSHOT',
+                                       '--timestamp': 'LATEST'}
+            jobs = {}
+            #Leaving the job context waits for every job and raises
+            # JobError if one of them failed.
+            with dlpx_obj.job_mode(False):
+                for src_obj, db_obj in vdbs:
+                    dx_refresh_db.refresh_database(
+                        dlpx_obj.dlpx_engines['fake_engine'],
+                        dlpx_obj.server_session, jobs, src_obj, db_obj)
+            self.assertEqual(len(vdbs), len(set(jobs.values()) - set([None])))
+
+        #One lookup of the source database and one refresh per VDB, and up
+        # to two polls of each job when the context waits for it
+        self.assertWithinBudget(refresh_vdbs,
+                                lambda num_vdbs: 4 * num_vdbs + 5,
+                                setup=find_vdbs)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
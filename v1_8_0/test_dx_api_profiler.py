@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the API call profiler
+"""
+
+import json
+import unittest
+from StringIO import StringIO
+
+from delphixpy.v1_8_0.exceptions import HttpError
+from delphixpy.v1_8_0.exceptions import RequestError
+from delphixpy.v1_8_0.web import database
+
+from fake_engine import FakeEngineServer
+from lib.DxApiProfiler import ApiCallRegistry
+from lib.DxApiProfiler import instrument_engine
+from lib.DxApiProfiler import percentile
+from lib.GetSession import GetSession
+
+VERSION = '0.0.0.1'
+
+
+class FakeHttpError(Exception):
+    status = 404
+    data = '{"type": "ErrorResult"}'
+
+
+class FakeHttpSession(object):
+    """
+    Stands in for the HTTP session of a DelphixEngine
+    """
+
+    def get(self, url):
+        if url.endswith('MISSING-1'):
+            raise FakeHttpError(url)
+        return 200, {}, '{"type": "OKResult", "result": []}'
+
+    def post(self, url, data=None):
+        return 200, {}, json.dumps({'type': 'OKResult', 'result': None,
+                                    'job': 'JOB-1'})
+
+
+class FakeEngine(object):
+    """
+    Stands in for a DelphixEngine
+    """
+
+    address = 'fake_engine'
+
+    def __init__(self):
+        self._http_session = FakeHttpSession()
+
+    def get(self, url):
+        return json.loads(self._http_session.get(url)[2])
+
+    def post(self, url, data=None):
+        return json.loads(self._http_session.post(url, data)[2])
+
+
+class ApiProfilerTests(unittest.TestCase):
+    """
+    Calls are grouped by URL template and summarized with percentiles.
+    """
+
+    def setUp(self):
+        self.registry = ApiCallRegistry()
+        self.engine = instrument_engine(FakeEngine(), self.registry)
+
+    def test_calls_grouped_by_template(self):
+        for job_num in range(3):
+            self.engine.get('/resources/json/delphix/job/JOB-{}'.format(
+                job_num))
+        self.engine.post('/resources/json/delphix/database/'
+                         'ORACLE_DB_CONTAINER-2/refresh')
+        with self.assertRaises(FakeHttpError):
+            self.engine.get('/resources/json/delphix/database/MISSING-1')
+
+        rows = dict((row['endpoint'], row) for row in
+                    self.registry.summary())
+        self.assertEqual(3, rows['GET /resources/json/delphix/job/{ref}']
+                         ['count'])
+        self.assertIn('POST /resources/json/delphix/database/{ref}/refresh',
+                      rows)
+        self.assertEqual(1, rows['GET /resources/json/delphix/database/{ref}']
+                         ['errors'])
+        self.assertEqual(3 * len('{"type": "OKResult", "result": []}'),
+                         rows['GET /resources/json/delphix/job/{ref}']
+                         ['bytes'])
+
+    def test_instrument_once(self):
+        instrument_engine(self.engine, self.registry)
+        self.engine.get('/resources/json/delphix/database')
+        self.assertEqual(1, self.registry.summary()[0]['count'])
+
+    def test_percentile_and_report(self):
+        values = range(1, 101)
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(0.0, percentile([], 50))
+
+        self.engine.get('/resources/json/delphix/database?pageSize=10')
+        output = StringIO()
+        self.registry.report(output)
+        self.assertIn('GET /resources/json/delphix/database ',
+                      output.getvalue())
+
+
+class FakeEngineProfilerTests(unittest.TestCase):
+    """
+    The status and size of each response are those the engine sent.
+    """
+
+    def setUp(self):
+        server = FakeEngineServer(port=0, groups=1, dsources=1, vdbs=0,
+                                  snapshots=0, bookmarks=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.registry = ApiCallRegistry()
+        self.engine = instrument_engine(GetSession().serversess(
+            server.address, 'delphix_admin', 'delphix'), self.registry)
+
+    def calls(self, endpoint):
+        return self.registry.calls['GET /resources/json/delphix/' + endpoint]
+
+    def test_response_bytes_and_statuses(self):
+        body = json.dumps(self.engine.get(
+            '/resources/json/delphix/database'))
+        with self.assertRaises(HttpError) as raised:
+            database.get(self.engine, 'ORACLE_DB_CONTAINER-999')
+
+        [(status, num_bytes, _)] = self.calls('database')
+        self.assertEqual(200, status)
+        self.assertEqual(len(body), num_bytes)
+        [(status, num_bytes, _)] = self.calls('database/{ref}')
+        self.assertEqual(404, status)
+        self.assertEqual(len(raised.exception.data), num_bytes)
+
+    def test_error_result_is_recorded_as_request_error(self):
+        self.engine._http_session._client.get = \
+            lambda url, headers: (200, {}, json.dumps(
+                {'type': 'ErrorResult', 'status': 'ERROR',
+                 'error': {'type': 'APIError', 'details': 'Busy',
+                           'id': 'exception.busy'}}))
+        with self.assertRaises(RequestError):
+            database.get_all(self.engine)
+
+        [(status, _, _)] = self.calls('database')
+        self.assertEqual('RequestError', status)
+        self.assertEqual(1, sum(row['errors'] for row in
+                                self.registry.summary()))
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the per-engine object cache
+"""
+
+import unittest
+
+from fake_objects import FakeClass
+from fake_objects import FakeEngine
+from fake_objects import FakeObject
+from fake_objects import FakeSnapshot
+from lib.DxCache import DxCache
+from lib.DxCache import SnapshotIndex
+
+VERSION = '0.0.0.1'
+
+
+class DxCacheTests(unittest.TestCase):
+    """
+    Lookups by name, reference and container, TTL expiry and invalidation.
+    """
+
+    def setUp(self):
+        self.engine = FakeEngine('engine1')
+        self.db_class = FakeClass('database', [
+            FakeObject('vdb1', 'ORACLE_DB_CONTAINER-1'),
+            FakeObject('vdb2', 'ORACLE_DB_CONTAINER-2')])
+        self.src_class = FakeClass('source', [
+            FakeObject('vdb1', 'ORACLE_VIRTUAL_SOURCE-1',
+                       'ORACLE_DB_CONTAINER-1')])
+        self.cache = DxCache()
+
+    def test_lookups_share_one_fetch(self):
+        for db_name in ['vdb1', 'vdb2', 'vdb1']:
+            self.assertEqual(db_name, self.cache.lookup(
+                self.engine, self.db_class, 'name', db_name).name)
+        self.assertEqual('vdb2', self.cache.lookup(
+            self.engine, self.db_class, 'reference',
+            'ORACLE_DB_CONTAINER-2').name)
+        self.assertEqual(1, self.db_class.calls)
+
+    def test_lookup_by_container(self):
+        src_obj = self.cache.lookup(self.engine, self.src_class, 'container',
+                                    'ORACLE_DB_CONTAINER-1')
+        self.assertEqual('ORACLE_VIRTUAL_SOURCE-1', src_obj.reference)
+
+    def age_index(self, f_class, seconds):
+        self.cache.get_index(self.engine, f_class).fetched -= seconds
+
+    def test_miss_refetches_once(self):
+        self.cache.get_index(self.engine, self.db_class)
+        self.age_index(self.db_class, 60)
+        self.db_class.objects.append(FakeObject('vdb3',
+                                                'ORACLE_DB_CONTAINER-3'))
+        self.assertEqual('vdb3', self.cache.lookup(
+            self.engine, self.db_class, 'name', 'vdb3').name)
+        self.assertIsNone(self.cache.lookup(self.engine, self.db_class,
+                                            'name', 'missing'))
+        self.assertEqual(2, self.db_class.calls)
+
+    def test_misses_are_throttled(self):
+        for num in range(5):
+            self.assertIsNone(self.cache.lookup(self.engine, self.db_class,
+                                                'name', 'missing'))
+        self.assertEqual(1, self.db_class.calls)
+
+        #Once the index is older than miss_refresh a miss downloads it again.
+        self.age_index(self.db_class, self.cache.miss_refresh + 1)
+        self.assertIsNone(self.cache.lookup(self.engine, self.db_class,
+                                            'name', 'missing'))
+        self.assertEqual(2, self.db_class.calls)
+
+    def test_lookup_many_fetches_once(self):
+        matches = self.cache.lookup_many(self.engine, self.db_class, 'name',
+                                         ['vdb1', 'missing1', 'vdb2',
+                                          'missing2'])
+        self.assertEqual(['vdb1', 'vdb2'], sorted(matches.keys()))
+        self.assertEqual(1, self.db_class.calls)
+
+        self.cache.lookup_many(self.engine, self.db_class, 'name',
+                               ['missing1', 'missing2'])
+        self.assertEqual(1, self.db_class.calls)
+
+        self.age_index(self.db_class, 60)
+        self.cache.lookup_many(self.engine, self.db_class, 'name',
+                               ['missing1', 'missing2'])
+        self.assertEqual(2, self.db_class.calls)
+
+    def test_invalidate_and_ttl(self):
+        self.cache.get_index(self.engine, self.db_class)
+        self.cache.invalidate(self.engine, self.db_class)
+        self.cache.get_index(self.engine, self.db_class)
+        self.assertEqual(2, self.db_class.calls)
+
+        self.cache.ttl = -1
+        self.cache.get_index(self.engine, self.db_class)
+        self.assertEqual(3, self.db_class.calls)
+
+    def test_engines_are_cached_separately(self):
+        self.cache.get_index(self.engine, self.db_class)
+        self.cache.get_index(FakeEngine('engine2'), self.db_class)
+        self.assertEqual(2, self.db_class.calls)
+
+
+class SnapshotIndexTests(unittest.TestCase):
+    """
+    Prefix, latest and latest-before searches of a database's snapshots.
+    """
+
+    def setUp(self):
+        self.snap_index = SnapshotIndex([
+            FakeSnapshot('2017-01-02T10:00:00.000Z'),
+            FakeSnapshot('2017-01-01T10:00:00.000Z'),
+            FakeSnapshot('2017-01-02T22:00:00.000Z'),
+            FakeSnapshot('2017-01-01T22:00:00.000Z')])
+
+    def test_find_by_name_and_time(self):
+        self.assertEqual('@2017-01-02T10:00:00.000',
+                         self.snap_index.find_by_name('@2017-01-02T10')[0].name)
+        self.assertEqual(2, len(self.snap_index.find_by_time('2017-01-01')))
+        self.assertEqual([], self.snap_index.find_by_time('2017-01-03'))
+
+    def test_latest(self):
+        latest = self.snap_index.latest()
+        self.assertEqual('2017-01-02T22:00:00.000Z',
+                         latest.latest_change_point.timestamp)
+        latest = self.snap_index.latest_before('2017-01-02T10:00:00.000Z')
+        self.assertEqual('2017-01-01T22:00:00.000Z',
+                         latest.latest_change_point.timestamp)
+        self.assertIsNone(self.snap_index.latest_before('2017-01-01'))
+        self.assertIsNone(SnapshotIndex([]).latest())
+
+    def test_snapshot_index_is_cached(self):
+        snap_class = FakeClass('snapshot', [
+            FakeSnapshot('2017-01-01T10:00:00.000Z')])
+        cache = DxCache()
+        engine = FakeEngine('engine1')
+        for _ in range(3):
+            cache.get_snapshot_index(engine, snap_class, 'ORACLE_DB_CONTAINER-1')
+        self.assertEqual(1, snap_class.calls)
+        cache.invalidate(engine, snap_class)
+        cache.get_snapshot_index(engine, snap_class, 'ORACLE_DB_CONTAINER-1')
+        self.assertEqual(2, snap_class.calls)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the dependency ordering of dx_delete_vdb
+"""
+
+import unittest
+
+from dx_delete_vdb import plan_deletion
+from dx_delete_vdb import update_jobs_dictionary
+
+VERSION = '0.0.0.1'
+
+
+class FakeDatabase(object):
+    def __init__(self, name, provision_container=None):
+        self.name = name
+        self.reference = 'DB-' + name
+        self.provision_container = provision_container and \
+            'DB-' + provision_container
+
+
+class FakeJob(object):
+    def __init__(self, job_state):
+        self.job_state = job_state
+
+
+class FakeJobWatcher(object):
+    """
+    Returns job states from a dictionary and records the jobs forgotten
+    """
+
+    def __init__(self, job_states):
+        self.job_states = job_states
+        self.forgotten = []
+
+    def get(self, job_ref):
+        return FakeJob(self.job_states[job_ref])
+
+    def forget(self, job_ref):
+        self.forgotten.append(job_ref)
+
+
+class PlanDeletionTests(unittest.TestCase):
+    """
+    VDBs are deleted before the databases they were provisioned from.
+    """
+
+    def setUp(self):
+        #dsource -> vdb1 -> child1, child2 and dsource -> vdb2
+        self.all_dbs = [FakeDatabase('dsource'),
+                        FakeDatabase('vdb1', 'dsource'),
+                        FakeDatabase('vdb2', 'dsource'),
+                        FakeDatabase('child1', 'vdb1'),
+                        FakeDatabase('child2', 'vdb1')]
+
+    def names(self, levels):
+        return [[db_obj.name for db_obj in level] for level in levels]
+
+    def test_leaves_first(self):
+        levels, blocked = plan_deletion(self.all_dbs, self.all_dbs)
+        self.assertEqual([['child1', 'child2', 'vdb2'], ['vdb1'],
+                          ['dsource']], self.names(levels))
+        self.assertEqual({}, blocked)
+
+    def test_kept_child_blocks_its_ancestors(self):
+        #child2 is not being deleted, so vdb1 and dsource cannot be.
+        databases = [db_obj for db_obj in self.all_dbs if
+                     db_obj.name != 'child2']
+        levels, blocked = plan_deletion(databases, self.all_dbs)
+        self.assertEqual([['child1', 'vdb2']], self.names(levels))
+        self.assertEqual(['dsource', 'vdb1'], sorted(
+            db_obj.name for db_obj in blocked))
+
+    def test_only_selected_databases_are_planned(self):
+        databases = [db_obj for db_obj in self.all_dbs if
+                     db_obj.name in ['vdb2', 'child1']]
+        levels, blocked = plan_deletion(databases, self.all_dbs)
+        self.assertEqual([['child1', 'vdb2']], self.names(levels))
+        self.assertEqual({}, blocked)
+
+
+class UpdateJobsDictionaryTests(unittest.TestCase):
+    """
+    Ended jobs are read through the watcher and handed back in finished.
+    """
+
+    def test_ended_jobs_are_finished_and_forgotten(self):
+        vdb1 = FakeDatabase('vdb1')
+        vdb2 = FakeDatabase('vdb2')
+        jobs = {vdb1: 'JOB-1', vdb2: 'JOB-2'}
+        job_watcher = FakeJobWatcher({'JOB-1': 'COMPLETED',
+                                      'JOB-2': 'RUNNING'})
+        finished = {}
+        running = update_jobs_dictionary({'hostname': 'engine1'},
+                                         job_watcher, jobs, finished)
+        self.assertEqual(1, running)
+        self.assertEqual({vdb2: 'JOB-2'}, jobs)
+        self.assertEqual({vdb1: 'COMPLETED'}, finished)
+        self.assertEqual(['JOB-1'], job_watcher.forgotten)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
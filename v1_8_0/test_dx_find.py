@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+
+"""
+Fleet-wide search of dx_find against several fake engines
+"""
+
+import unittest
+from time import time
+
+import dx_find
+from fake_engine import FakeEngineServer
+from lib.DxCache import invalidate_cache
+from lib.GetSession import GetSession
+
+VERSION = '0.0.0.1'
+
+
+class FleetSearchTests(unittest.TestCase):
+    """
+    Engines are searched concurrently and a slow engine only costs its own
+    timeout.
+    """
+
+    def start_engine(self, hostname, latency=0):
+        server = FakeEngineServer(port=0, latency=latency, groups=2,
+                                  dsources=2, vdbs=20, snapshots=1,
+                                  bookmarks=20)
+        server.start()
+        self.addCleanup(server.stop)
+        self.dlpx_obj.dlpx_engines[hostname] = {
+            'hostname': hostname, 'ip_address': server.address,
+            'username': 'delphix_admin', 'password': 'delphix'}
+        invalidate_cache(self.dlpx_obj.engine_session(hostname))
+        return server
+
+    def setUp(self):
+        self.dlpx_obj = GetSession()
+        self.matches = []
+        dx_find.dx_session_obj = self.dlpx_obj
+        dx_find.arguments = {'--name': 'VDB1*'}
+
+    def write_match(self, hostname, obj_type, obj):
+        self.matches.append((hostname, obj_type, obj.name))
+
+    def test_matches_from_every_engine(self):
+        for num in range(4):
+            self.start_engine('engine{}'.format(num), latency=200)
+
+        start = time()
+        num_matches, failed = dx_find.run_search(
+            self.dlpx_obj.dlpx_engines.values(), ['database', 'user'], 10,
+            self.write_match)
+
+        #Each engine logs in and queries its types in turn, about five 200ms
+        # calls. The four engines run concurrently, so the search takes
+        # about as long as one engine instead of four.
+        self.assertLess(time() - start, 2 * 5 * 0.2)
+        self.assertEqual([], failed)
+        self.assertEqual(4 * 11, num_matches)
+        self.assertEqual(set(['engine0', 'engine1', 'engine2', 'engine3']),
+                         set(hostname for hostname, _, _ in self.matches))
+        self.assertIn(('engine0', 'database', 'vdb19'), self.matches)
+
+    def test_slow_engine_times_out(self):
+        self.start_engine('fast')
+        self.start_engine('slow', latency=3000)
+
+        start = time()
+        num_matches, failed = dx_find.run_search(
+            self.dlpx_obj.dlpx_engines.values(), ['database'], 1,
+            self.write_match)
+
+        self.assertLess(time() - start, 2.5)
+        self.assertEqual(['slow'], failed)
+        self.assertEqual(11, num_matches)
+        self.assertEqual(set(['fast']),
+                         set(hostname for hostname, _, _ in self.matches))
+
+    def test_unexpected_error_is_reported(self):
+        self.start_engine('broken')
+
+        def find_matches(engine, f_class, name_pattern):
+            raise ValueError('No JSON object could be decoded')
+        self.addCleanup(setattr, dx_find, 'find_matches',
+                        dx_find.find_matches)
+        dx_find.find_matches = find_matches
+
+        start = time()
+        num_matches, failed = dx_find.run_search(
+            self.dlpx_obj.dlpx_engines.values(), ['database'], 10,
+            self.write_match)
+
+        #The error is reported at once instead of waiting for the timeout.
+        self.assertLess(time() - start, 2)
+        self.assertEqual(['broken'], failed)
+        self.assertEqual(0, num_matches)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
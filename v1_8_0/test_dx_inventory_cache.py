@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the on-disk inventory cache shared between runs
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fake_objects import FakeClass
+from fake_objects import FakeEngine
+from fake_objects import FakeObject
+from lib.DxCache import DxCache
+from lib.DxInventoryCache import InventoryCache
+
+VERSION = '0.0.0.1'
+
+
+class InventoryCacheTests(unittest.TestCase):
+    """
+    A second run with a new in-memory cache is served from disk.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'dx_inventory.db')
+        self.engine = FakeEngine('engine1')
+        self.db_class = FakeClass('database', [
+            FakeObject('vdb1', 'ORACLE_DB_CONTAINER-1')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def new_run(self, ttl=300, miss_refresh=10):
+        return DxCache(ttl, InventoryCache(self.path, FakeObject.from_dict),
+                       miss_refresh)
+
+    def test_warm_run_skips_get_all(self):
+        self.new_run().get_index(self.engine, self.db_class)
+        db_obj = self.new_run().lookup(self.engine, self.db_class, 'name',
+                                       'vdb1')
+        self.assertEqual('ORACLE_DB_CONTAINER-1', db_obj.reference)
+        self.assertEqual(1, self.db_class.calls)
+
+    def test_miss_refreshes_disk(self):
+        self.new_run().get_index(self.engine, self.db_class)
+        self.db_class.objects.append(FakeObject('vdb2',
+                                                'ORACLE_DB_CONTAINER-2'))
+        #The stored index is younger than miss_refresh, so the miss is not
+        # downloaded again.
+        self.assertIsNone(self.new_run().lookup(self.engine, self.db_class,
+                                                'name', 'vdb2'))
+        self.assertEqual(1, self.db_class.calls)
+
+        self.assertIsNotNone(self.new_run(miss_refresh=0).lookup(
+            self.engine, self.db_class, 'name', 'vdb2'))
+        self.assertIsNotNone(self.new_run().lookup(self.engine, self.db_class,
+                                                   'name', 'vdb2'))
+        self.assertEqual(2, self.db_class.calls)
+
+    def test_ttl_and_invalidate(self):
+        self.new_run().get_index(self.engine, self.db_class)
+        self.new_run(-1).get_index(self.engine, self.db_class)
+        self.assertEqual(2, self.db_class.calls)
+
+        self.new_run().invalidate(self.engine, self.db_class)
+        self.new_run().get_index(self.engine, self.db_class)
+        self.assertEqual(3, self.db_class.calls)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the job listing of dx_jobs, run against a fake engine
+"""
+
+import sys
+import unittest
+from StringIO import StringIO
+
+import dx_jobs
+from fake_engine import FakeEngineServer
+from lib.GetSession import GetSession
+
+VERSION = '0.0.0.1'
+
+
+class ListJobsTests(unittest.TestCase):
+    """
+    Only --max_jobs jobs are listed, and no more pages are requested than
+    are needed to list them.
+    """
+
+    def setUp(self):
+        server = FakeEngineServer(port=0, job_duration=3600, groups=1,
+                                  dsources=1, vdbs=0, snapshots=0,
+                                  bookmarks=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.state = server.state
+        for num in range(60):
+            self.state.start_job('DB_SYNC', 'ORACLE_DB_CONTAINER-1',
+                                 'snapsync{}'.format(num % 2))
+        dx_jobs.dx_session_obj = GetSession()
+        dx_jobs.dx_session_obj.serversess(server.address, 'delphix_admin',
+                                          'delphix')
+
+    def list_jobs(self, **arguments):
+        dx_jobs.arguments = dict({'--state': None, '--title': None,
+                                  '--max_jobs': '25'}, **arguments)
+        saved = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            dx_jobs.list_jobs()
+            return sys.stdout.getvalue().count('Action=')
+        finally:
+            sys.stdout = saved
+
+    def page_sizes(self):
+        return [query.get('pageSize') for query in
+                self.state.list_queries.get('job', [])]
+
+    def test_default_lists_one_page(self):
+        self.assertEqual(25, self.list_jobs())
+        self.assertEqual(['25'], self.page_sizes())
+
+    def test_title_filter_lists_max_jobs_matches(self):
+        self.assertEqual(10, self.list_jobs(**{'--title': 'snapsync1',
+                                               '--max_jobs': '10'}))
+
+    def test_zero_lists_every_job(self):
+        self.assertEqual(60, self.list_jobs(**{'--max_jobs': '0'}))
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
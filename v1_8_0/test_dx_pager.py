@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the paged collection iterator
+"""
+
+import threading
+import time
+import unittest
+
+from lib.DxPager import iter_pages
+
+VERSION = '0.0.0.1'
+
+
+class FakeObject(object):
+    def __init__(self, reference):
+        self.reference = reference
+
+
+class FakeCollection(object):
+    """
+    Stands in for a paged get_all() and records the pages requested
+    """
+
+    def __init__(self, num_objects, delay=0):
+        self.objects = [FakeObject('LOG-{}'.format(num)) for num in
+                        range(num_objects)]
+        self.delay = delay
+        self.offsets = []
+        self.kwargs = None
+
+    def get_all(self, engine, page_size=None, page_offset=None, **kwargs):
+        time.sleep(self.delay)
+        self.offsets.append(page_offset)
+        self.kwargs = kwargs
+        return self.objects[page_offset * page_size:
+                            (page_offset + 1) * page_size]
+
+
+class PagerTests(unittest.TestCase):
+    """
+    Pages are requested on demand, optionally one page ahead.
+    """
+
+    def test_pages_fetched_on_demand(self):
+        collection = FakeCollection(25)
+        objs = iter_pages(collection.get_all, None, page_size=10,
+                          missing=True)
+
+        self.assertEqual('LOG-0', next(objs).reference)
+        self.assertEqual([0], collection.offsets)
+        self.assertEqual({'missing': True}, collection.kwargs)
+        self.assertEqual(24, len(list(objs)))
+        self.assertEqual([0, 1, 2], collection.offsets)
+
+    def test_full_last_page_ends_with_empty_page(self):
+        collection = FakeCollection(20)
+        self.assertEqual(20, len(list(iter_pages(collection.get_all, None,
+                                                 page_size=10))))
+        self.assertEqual([0, 1, 2], collection.offsets)
+
+    def test_shifted_objects_yielded_once(self):
+        collection = FakeCollection(20)
+
+        def get_all(engine, page_size=None, page_offset=None):
+            page = collection.get_all(engine, page_size, page_offset)
+            #A new object arrives after the first page, pushing the
+            # collection down by one.
+            collection.objects.insert(0, FakeObject('LOG-new'))
+            return page
+
+        refs = [obj.reference for obj in iter_pages(get_all, None,
+                                                    page_size=10)]
+        self.assertEqual(len(refs), len(set(refs)))
+        self.assertEqual(20, len(refs))
+
+    def test_prefetch_overlaps_fetch_and_processing(self):
+        collection = FakeCollection(50, delay=0.05)
+
+        start = time.time()
+        for obj in iter_pages(collection.get_all, None, page_size=10,
+                              prefetch=True):
+            if obj.reference.endswith('9'):
+                time.sleep(0.05)
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual([0, 1, 2, 3, 4, 5], collection.offsets)
+
+    def test_prefetch_stops_when_consumer_stops(self):
+        collection = FakeCollection(1000)
+        num_threads = threading.active_count()
+
+        objs = iter_pages(collection.get_all, None, page_size=10,
+                          prefetch=True)
+        next(objs)
+        objs.close()
+        time.sleep(1)
+        self.assertLessEqual(len(collection.offsets), 3)
+        self.assertEqual(num_threads, threading.active_count())
+
+    def test_prefetch_reraises_errors(self):
+        def get_all(engine, page_size=None, page_offset=None):
+            raise ValueError('engine unreachable')
+
+        with self.assertRaises(ValueError):
+            list(iter_pages(get_all, None, prefetch=True))
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the --pipeline workflow of dx_refresh_db, run against a fake
+engine
+"""
+
+import unittest
+
+from delphixpy.v1_8_0.exceptions import HttpError
+from delphixpy.v1_8_0.web import source
+
+import dx_refresh_db
+from fake_engine import FakeEngineServer
+from lib.DlpxException import DlpxException
+from lib.DxCache import get_index
+from lib.DxCache import invalidate_cache
+
+VERSION = '0.0.0.1'
+
+
+class PipelineWorkflowTests(unittest.TestCase):
+    """
+    Each dSource in the pipeline is snapshot and its VDBs refreshed, even
+    when another dSource in the pipeline fails.
+    """
+
+    def setUp(self):
+        server = FakeEngineServer(port=0, job_duration=0.1, groups=1,
+                                  dsources=2, vdbs=4, snapshots=1,
+                                  bookmarks=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.state = server.state
+        self.engine = {'hostname': 'engine1', 'ip_address': server.address,
+                       'username': 'delphix_admin', 'password': 'delphix'}
+        self.session = dx_refresh_db.serversess(server.address,
+                                                'delphix_admin', 'delphix')
+        self.addCleanup(invalidate_cache, self.session)
+
+        saved = dx_refresh_db.snapshot_dsource
+        self.addCleanup(setattr, dx_refresh_db, 'snapshot_dsource', saved)
+        dx_refresh_db.single_thread = False
+        dx_refresh_db.arguments = {'--pipeline': 'dsource0,dsource1',
+                                   '--parallel': None, '--poll': '1'}
+
+    def find(self, collection, name):
+        return [obj for obj in self.state.collections[collection].values()
+                if obj['name'] == name][0]
+
+    def job_targets(self, action_type):
+        return sorted(job_obj['target'] for job_obj in
+                      self.state.collections.get('job', {}).values()
+                      if job_obj['actionType'] == action_type)
+
+    def run_pipeline(self):
+        with self.assertRaises(DlpxException) as raised:
+            dx_refresh_db.pipeline_workflow(self.engine).join()
+        return str(raised.exception)
+
+    def test_failed_snapshot_does_not_stop_the_others(self):
+        saved = dx_refresh_db.snapshot_dsource
+
+        def snapshot_dsource(engine, server, source_obj, dsource_obj):
+            if dsource_obj.name == 'dsource0':
+                raise HttpError('dsource0 is busy', 409)
+            return saved(engine, server, source_obj, dsource_obj)
+
+        dx_refresh_db.snapshot_dsource = snapshot_dsource
+        self.assertIn('1 jobs did not complete: dsource0',
+                      self.run_pipeline())
+
+        dsource1 = self.find('database', 'dsource1')
+        vdb_refs = sorted(db_obj['reference'] for db_obj in
+                          self.state.collections['database'].values()
+                          if db_obj['provisionContainer'] ==
+                          dsource1['reference'])
+        self.assertTrue(vdb_refs)
+        self.assertEqual([dsource1['reference']],
+                         self.job_targets('DATABASE_SYNC'))
+        self.assertEqual(vdb_refs, self.job_targets('DATABASE_REFRESH'))
+
+    def test_source_state_is_read_from_the_engine(self):
+        #The cached sources still show dsource1 as enabled.
+        get_index(self.session, source)
+        self.find('source', 'dsource1')['runtime']['enabled'] = 'DISABLED'
+        dx_refresh_db.arguments['--pipeline'] = 'dsource1'
+
+        self.assertIn('dsource1', self.run_pipeline())
+        self.assertEqual([], self.job_targets('DATABASE_SYNC'))
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for DxTimeflow.list_timeflows
+"""
+
+import itertools
+import json
+import unittest
+from StringIO import StringIO
+
+import lib.DxTimeflow
+from fake_objects import FakeClass
+from fake_objects import FakeEngine
+from fake_objects import FakeObject
+from fake_objects import FakePoint
+from fake_objects import FakeSnapshot
+from lib.DxTimeflow import DxTimeflow
+
+VERSION = '0.0.0.1'
+
+#Each listing uses a new engine address so it is not served from the cache
+engine_ids = itertools.count()
+
+
+def build_inventory(num_dbs, tf_per_db):
+    db_objs = []
+    tf_objs = []
+    for db_num in range(num_dbs):
+        db_ref = 'ORACLE_DB_CONTAINER-{}'.format(db_num)
+        db_objs.append(FakeObject('db{}'.format(db_num), db_ref))
+        for tf_num in range(tf_per_db):
+            tf_objs.append(FakeObject(
+                'tf{}-{}'.format(db_num, tf_num),
+                'ORACLE_TIMEFLOW-{}-{}'.format(db_num, tf_num), db_ref,
+                parent_point=FakePoint('2017-01-01T00:00:00.000Z')))
+    return FakeClass('database', db_objs), FakeClass('timeflow', tf_objs)
+
+
+class DxTimeflowTests(unittest.TestCase):
+    """
+    Timeflows are joined to databases with one fetch of each class.
+    """
+
+    def setUp(self):
+        self.saved = lib.DxTimeflow.database, lib.DxTimeflow.timeflow
+
+    def tearDown(self):
+        lib.DxTimeflow.database, lib.DxTimeflow.timeflow = self.saved
+
+    def list_timeflows(self, num_dbs, tf_per_db, output_format='text'):
+        db_class, tf_class = build_inventory(num_dbs, tf_per_db)
+        lib.DxTimeflow.database, lib.DxTimeflow.timeflow = db_class, tf_class
+        output = StringIO()
+        engine = FakeEngine('engine{}'.format(next(engine_ids)))
+        DxTimeflow(engine).list_timeflows(output_format, output)
+        self.assertEqual(1, db_class.calls)
+        self.assertEqual(1, tf_class.calls)
+        return output.getvalue().splitlines()
+
+    def test_text_output(self):
+        rows = self.list_timeflows(2, 2)
+        self.assertEqual('DB Name, Timeflow Name, Timestamp', rows[0])
+        self.assertEqual('db1, tf1-0, 2017-01-01T00:00:00.000Z', rows[3])
+
+    def test_csv_and_json_output(self):
+        self.assertEqual('db0,tf0-1,2017-01-01T00:00:00.000Z',
+                         self.list_timeflows(1, 2, 'csv')[2])
+        tf_row = json.loads(self.list_timeflows(1, 2, 'json')[0])
+        self.assertEqual('db0', tf_row['db_name'])
+        self.assertEqual('tf0-0', tf_row['timeflow_name'])
+
+    def test_large_listing_fetches_each_class_once(self):
+        rows = self.list_timeflows(2000, 3)
+        self.assertEqual(1 + 2000 * 3, len(rows))
+        self.assertEqual('db1999, tf1999-2, 2017-01-01T00:00:00.000Z',
+                         rows[-1])
+
+
+class FindLatestSnapshotTests(unittest.TestCase):
+    """
+    The latest snapshot is served from the cached index until the
+    snapshots are invalidated.
+    """
+
+    def setUp(self):
+        self.saved = lib.DxTimeflow.snapshot
+        self.db_ref = 'ORACLE_DB_CONTAINER-1'
+        self.snap_class = FakeClass('snapshot', [
+            FakeSnapshot('2017-01-01T10:00:00.000Z', self.db_ref),
+            FakeSnapshot('2017-01-02T10:00:00.000Z', 'ORACLE_DB_CONTAINER-2')])
+        lib.DxTimeflow.snapshot = self.snap_class
+        self.dx_timeflow = DxTimeflow(FakeEngine('engine{}'.format(
+            next(engine_ids))))
+
+    def tearDown(self):
+        lib.DxTimeflow.snapshot = self.saved
+
+    def latest_timestamp(self, before=None):
+        return self.dx_timeflow.find_latest_snapshot(
+            self.db_ref, before).latest_change_point.timestamp
+
+    def test_new_snapshot_is_found_after_invalidation(self):
+        self.assertEqual('2017-01-01T10:00:00.000Z', self.latest_timestamp())
+        self.snap_class.objects.append(
+            FakeSnapshot('2017-01-03T10:00:00.000Z', self.db_ref))
+        self.assertEqual('2017-01-01T10:00:00.000Z', self.latest_timestamp())
+        self.assertEqual(1, self.snap_class.calls)
+
+        self.dx_timeflow.invalidate_snapshots()
+        self.assertEqual('2017-01-03T10:00:00.000Z', self.latest_timestamp())
+        self.assertEqual('2017-01-01T10:00:00.000Z', self.latest_timestamp(
+            '2017-01-02T00:00:00.000Z'))
+        self.assertEqual(2, self.snap_class.calls)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the bounded worker pool behind run_async
+"""
+
+import threading
+import time
+import unittest
+
+from lib.DxWorkerPool import WorkerPool
+
+VERSION = '0.0.0.1'
+
+
+class WorkerPoolTests(unittest.TestCase):
+    """
+    Concurrency limit, per-key fairness and exception propagation.
+    """
+
+    def setUp(self):
+        self.pool = WorkerPool(max_workers=3)
+        self.lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+        self.order = []
+
+    def work(self, key, value):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            self.order.append(key)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return value
+
+    def test_concurrency_is_bounded(self):
+        tasks = [self.pool.submit('engine{}'.format(i), self.work,
+                                  'engine{}'.format(i), i) for i in range(12)]
+        self.assertEqual(range(12), [task.join() for task in tasks])
+        self.assertEqual(3, self.peak)
+
+    def test_keys_are_served_in_turn(self):
+        blocker = threading.Event()
+        self.pool.max_workers = 1
+        self.pool.submit('blocker', blocker.wait)
+        tasks = [self.pool.submit('busy', self.work, 'busy', i)
+                 for i in range(3)]
+        tasks.append(self.pool.submit('quiet', self.work, 'quiet', 3))
+        blocker.set()
+        for task in tasks:
+            task.join()
+        self.assertEqual(['busy', 'quiet', 'busy', 'busy'], self.order)
+
+    def test_exceptions_are_reraised(self):
+        def fail():
+            raise ValueError('engine unreachable')
+
+        task = self.pool.submit('engine1', fail)
+        self.assertRaises(ValueError, task.join)
+
+    def test_nested_submit_runs_inline(self):
+        self.pool.max_workers = 1
+
+        def outer():
+            return self.pool.submit('inner', self.work, 'inner', 1).join()
+
+        self.assertEqual(1, self.pool.submit('outer', outer).join())
+
+    def test_cancel_pending(self):
+        started = threading.Event()
+        blocker = threading.Event()
+
+        def block():
+            started.set()
+            blocker.wait()
+
+        self.pool.max_workers = 1
+        first = self.pool.submit('engine1', block)
+        started.wait()
+        queued = self.pool.submit('engine2', self.work, 'engine2', 2)
+        self.pool.cancel_pending()
+        blocker.set()
+        first.join()
+        self.assertTrue(queued.cancelled)
+        self.assertEqual([], self.order)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
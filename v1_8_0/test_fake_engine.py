@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the offline fake engine, driven over HTTP
+"""
+
+import cookielib
+import json
+import unittest
+import urllib2
+
+from fake_engine import API_PREFIX
+from fake_engine import FakeEngineServer
+
+VERSION = '0.0.0.1'
+
+
+class FakeEngineTests(unittest.TestCase):
+    """
+    Login, filtered listings, actions and the job lifecycle.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super(FakeEngineTests, cls).setUpClass()
+        cls.server = FakeEngineServer(port=0, job_duration=0.2, groups=2,
+                                      dsources=5, vdbs=50, snapshots=2,
+                                      bookmarks=20)
+        cls.server.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+
+    def setUp(self):
+        self.opener = urllib2.build_opener(
+            urllib2.HTTPCookieProcessor(cookielib.CookieJar()))
+        self.call('session', {'type': 'APISession'})
+        self.call('login', {'type': 'LoginRequest',
+                            'username': 'delphix_admin',
+                            'password': 'delphix'})
+
+    def call(self, path, body=None):
+        url = 'http://{}{}{}'.format(self.server.address, API_PREFIX, path)
+        data = json.dumps(body) if body is not None else None
+        request = urllib2.Request(url, data,
+                                  {'Content-Type': 'application/json'})
+        return json.loads(self.opener.open(request).read())
+
+    def test_requires_login(self):
+        opener = urllib2.build_opener()
+        with self.assertRaises(urllib2.HTTPError) as err:
+            opener.open('http://{}{}database'.format(self.server.address,
+                                                     API_PREFIX))
+        self.assertEqual(403, err.exception.code)
+
+    def test_inventory_and_filters(self):
+        self.assertEqual(55, len(self.call('database')['result']))
+        db_ref = self.call('database')['result'][0]['reference']
+        snaps = self.call('snapshot?database={}'.format(db_ref))['result']
+        self.assertEqual(2, len(snaps))
+        self.assertEqual(10, len(self.call(
+            'database?pageSize=10&pageOffset=1')['result']))
+
+    def test_job_lifecycle(self):
+        db_obj = self.call('database')['result'][0]
+        result = self.call('database/{}/sync'.format(db_obj['reference']), {})
+        job_ref = result['job']
+        self.assertEqual('RUNNING',
+                         self.call('job/' + job_ref)['result']['jobState'])
+
+        notifications = self.call('notification?timeout=5000')['result']
+        self.assertEqual(job_ref, notifications[0]['object'])
+        self.assertEqual('COMPLETED',
+                         self.call('job/' + job_ref)['result']['jobState'])
+        self.assertEqual(3, len(self.call('snapshot?database={}'.format(
+            db_obj['reference']))['result']))
+
+    def test_job_action_state(self):
+        db_ref = self.call('database')['result'][1]['reference']
+        job_ref = self.call('database/{}/sync'.format(db_ref), {})['job']
+        self.assertEqual('EXECUTING', self.call('job/' + job_ref)['result'][
+            'parentActionState'])
+        self.call('job/{}/cancel'.format(job_ref), {})
+        self.assertEqual('CANCELED', self.call('job/' + job_ref)['result'][
+            'parentActionState'])
+
+    def test_provision(self):
+        group_ref = self.call('group')['result'][0]['reference']
+        parent_ref = self.call('database')['result'][0]['reference']
+        result = self.call('database/provision', {
+            'type': 'OracleProvisionParameters',
+            'container': {'type': 'OracleDatabaseContainer',
+                          'name': 'vdb_new', 'group': group_ref},
+            'timeflowPointParameters': {'type': 'TimeflowPointSemantic',
+                                        'container': parent_ref,
+                                        'location': 'LATEST_SNAPSHOT'}})
+        db_obj = self.call('database/' + result['result'])['result']
+        self.assertEqual('vdb_new', db_obj['name'])
+        self.assertEqual(parent_ref, db_obj['provisionContainer'])
+        self.assertEqual('DB_PROVISION', self.call('job/' + result['job'])[
+            'result']['actionType'])
+        self.assertEqual('CurrentConsumerCapacityData', self.call(
+            'capacity/consumer/' + result['result'])['result']['type'])
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for incremental archive log gap detection, and the parallel
+dSource queries against a fake engine
+"""
+
+import csv
+import os
+import shutil
+import tempfile
+import unittest
+
+import find_missing_archivelogs
+from fake_engine import FakeEngineServer
+from find_missing_archivelogs import ArchiveLogState
+from lib.GetSession import GetSession
+
+VERSION = '0.0.0.1'
+
+
+class ArchiveLogStateTests(unittest.TestCase):
+    """
+    Each run reports the gaps opened and closed since the one before.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp_dir, 'archivelogs.state')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_new_and_closed_gaps_across_runs(self):
+        log_state = ArchiveLogState(self.path)
+        new_gaps, closed_gaps = log_state.update(
+            'engine1/ORACLE_DB_CONTAINER-1', set([(1, 10, 100, 109),
+                                                  (2, 7, 70, 79)]))
+        self.assertEqual(2, len(new_gaps))
+        self.assertEqual(set(), closed_gaps)
+        log_state.save()
+
+        #A later run loads the state written by the first one.
+        log_state = ArchiveLogState(self.path)
+        new_gaps, closed_gaps = log_state.update(
+            'engine1/ORACLE_DB_CONTAINER-1', set([(1, 10, 100, 109),
+                                                  (1, 12, 120, 129)]))
+        self.assertEqual(set([(1, 12, 120, 129)]), new_gaps)
+        self.assertEqual(set([(2, 7, 70, 79)]), closed_gaps)
+        self.assertEqual({'1': 12, '2': 7}, log_state.high_water(
+            'engine1/ORACLE_DB_CONTAINER-1'))
+
+    def test_from_scn(self):
+        log_state = ArchiveLogState(self.path)
+        dsource_key = 'engine1/ORACLE_DB_CONTAINER-1'
+        self.assertIsNone(log_state.from_scn(dsource_key))
+
+        #The lowest open gap is requested again to find out if it closed.
+        log_state.update(dsource_key, set([(1, 10, 100, 109),
+                                           (1, 12, 120, 129)]))
+        self.assertEqual(100, log_state.from_scn(dsource_key))
+
+        #With every gap closed only logs past the highest SCN are requested.
+        log_state.update(dsource_key, set())
+        self.assertEqual(129, log_state.from_scn(dsource_key))
+
+    def test_dsources_are_kept_apart(self):
+        log_state = ArchiveLogState(self.path)
+        log_state.update('engine1/ORACLE_DB_CONTAINER-1',
+                         set([(1, 10, 100, 109)]))
+        new_gaps, _ = log_state.update('engine2/ORACLE_DB_CONTAINER-1',
+                                       set([(1, 10, 100, 109)]))
+        self.assertEqual(1, len(new_gaps))
+
+
+class ParallelDsourceTests(unittest.TestCase):
+    """
+    dSources are queried in parallel, each worker with its own session, and
+    their logs are streamed into one output file.
+    """
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp_dir)
+        self.server = FakeEngineServer(port=0, latency=20, groups=2,
+                                       dsources=12, vdbs=4, snapshots=1,
+                                       bookmarks=0)
+        self.server.start()
+        self.addCleanup(self.server.stop)
+        self.engine = {'hostname': 'engine1',
+                       'ip_address': self.server.address,
+                       'username': 'delphix_admin', 'password': 'delphix'}
+
+        find_missing_archivelogs.dx_session_obj = GetSession()
+        find_missing_archivelogs.arguments = {'--outdir': self.tmp_dir,
+                                              '--format': 'csv',
+                                              '--dsource_parallel': '4'}
+
+    def read_rows(self):
+        with open(os.path.join(self.tmp_dir, 'engine1.csv')) as output:
+            return list(csv.reader(output))
+
+    def test_every_dsource_is_written(self):
+        find_missing_archivelogs.log_state = None
+        find_missing_archivelogs.find_missing_archivelogs(self.engine)
+
+        rows = self.read_rows()
+        self.assertEqual(find_missing_archivelogs.ArchiveLogWriter.header,
+                         rows[0])
+        #Two missing logs per dSource, none for the VDBs
+        self.assertEqual(24, len(rows[1:]))
+        self.assertEqual(12, len(set(row[0] for row in rows[1:])))
+        #The main thread and each of the four workers log in once.
+        self.assertEqual(5, self.server.state.request_counts['POST login'])
+
+    def test_incremental_run(self):
+        find_missing_archivelogs.log_state = ArchiveLogState(
+            os.path.join(self.tmp_dir, 'archivelogs.state'))
+        find_missing_archivelogs.find_missing_archivelogs(self.engine)
+
+        rows = self.read_rows()
+        self.assertEqual(24, len(rows[1:]))
+        self.assertEqual(set(['NEW']), set(row[-1] for row in rows[1:]))
+
+    def log_queries_from_scn(self):
+        """
+        Return the set of fromScn values sent since the last call
+        """
+        queries = self.server.state.list_queries.pop('timeflow/oracle/log')
+        return set(query.get('fromScn') for query in queries)
+
+    def test_incremental_run_requests_new_logs_only(self):
+        find_missing_archivelogs.log_state = ArchiveLogState(
+            os.path.join(self.tmp_dir, 'archivelogs.state'))
+        find_missing_archivelogs.find_missing_archivelogs(self.engine)
+        self.assertEqual(set([None]), self.log_queries_from_scn())
+
+        #Close the gap at sequence 10 of every dSource.
+        ora_logs = self.server.state.collections['timeflow/oracle/log']
+        for log_ref, log_obj in ora_logs.items():
+            if log_obj['sequence'] == 10:
+                del ora_logs[log_ref]
+
+        #Every dSource still had the gap from SCN 1000 open.
+        find_missing_archivelogs.find_missing_archivelogs(self.engine)
+        self.assertEqual(set(['1000']), self.log_queries_from_scn())
+        rows = self.read_rows()
+        self.assertEqual(12, len(rows[1:]))
+        self.assertEqual(set(['10']), set(row[2] for row in rows[1:]))
+        self.assertEqual(set(['CLOSED']), set(row[-1] for row in rows[1:]))
+
+        #The gap at sequence 12 is now the lowest open one.
+        find_missing_archivelogs.find_missing_archivelogs(self.engine)
+        self.assertEqual(set(['1200']), self.log_queries_from_scn())
+        self.assertEqual(0, len(self.read_rows()[1:]))
+
+
+class RunJobTests(unittest.TestCase):
+    """
+    Every engine is searched by exactly one workflow, so no two workflows
+    write the same output file.
+    """
+
+    def setUp(self):
+        server = FakeEngineServer(port=0, groups=1, dsources=1, vdbs=0,
+                                  snapshots=0, bookmarks=0)
+        server.start()
+        self.addCleanup(server.stop)
+
+        saved = find_missing_archivelogs.find_missing_archivelogs
+        self.addCleanup(setattr, find_missing_archivelogs,
+                        'find_missing_archivelogs', saved)
+        self.searched = []
+        find_missing_archivelogs.find_missing_archivelogs = \
+            lambda engine: self.searched.append(engine['hostname'])
+        find_missing_archivelogs.single_thread = False
+        find_missing_archivelogs.dx_session_obj = GetSession()
+        find_missing_archivelogs.dx_session_obj.dlpx_engines = dict(
+            (hostname, {'hostname': hostname, 'ip_address': server.address,
+                        'username': 'delphix_admin', 'password': 'delphix',
+                        'default': 'false'})
+            for hostname in ['engine1', 'engine2'])
+
+    def run_job(self, **arguments):
+        find_missing_archivelogs.arguments = dict(
+            {'--all': False, '--engine': None, '--poll': '1'}, **arguments)
+        find_missing_archivelogs.run_job()
+        return sorted(self.searched)
+
+    def test_all_engines_once(self):
+        self.assertEqual(['engine1', 'engine2'], self.run_job(**{'--all':
+                                                                 True}))
+
+    def test_one_engine(self):
+        self.assertEqual(['engine2'], self.run_job(**{'--engine':
+                                                      'engine2'}))
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
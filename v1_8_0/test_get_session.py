@@ -0,0 +1,56 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for the session pool of GetSession, run against a fake engine
+"""
+
+import unittest
+
+from fake_engine import FakeEngineServer
+from lib.GetSession import GetSession
+
+VERSION = '0.0.0.1'
+
+
+class SessionPoolTests(unittest.TestCase):
+    """
+    Sessions are reused per engine, user and thread, and logged in again
+    when the credentials change or the engine ends the session.
+    """
+
+    def setUp(self):
+        server = FakeEngineServer(port=0, groups=1, dsources=1, vdbs=0,
+                                  snapshots=0, bookmarks=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.server = server
+        self.dx_session_obj = GetSession()
+
+    def serversess(self, password='delphix'):
+        return self.dx_session_obj.serversess(self.server.address,
+                                              'delphix_admin', password)
+
+    def test_session_is_reused(self):
+        self.assertIs(self.serversess(), self.serversess())
+        for pool_key in self.dx_session_obj._session_pool:
+            self.assertNotIn('delphix', pool_key)
+
+    def test_new_password_logs_in_again(self):
+        engine_session = self.serversess()
+        self.assertIsNot(engine_session, self.serversess('new_password'))
+        self.assertEqual(1, len(self.dx_session_obj._session_pool))
+
+    def test_server_wait_logs_in_after_restart(self):
+        engine_session = self.serversess()
+        self.dx_session_obj.server_wait()
+        #A restart ends every session on the engine.
+        self.server.state.sessions.clear()
+
+        self.dx_session_obj.server_wait()
+        self.assertIsNot(engine_session, self.dx_session_obj.server_session)
+        self.assertIs(self.dx_session_obj.server_session, self.serversess())
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for JobTracker against a local fake notification channel
+"""
+
+import unittest
+from collections import deque
+
+from lib.JobTracker import JobTracker
+from lib.JobWatcher import JobWatcher
+
+VERSION = '0.0.0.1'
+
+
+class FakeEngine(object):
+    address = 'fake_engine'
+    last_job = None
+
+
+class FakeJob(object):
+    def __init__(self, reference, job_state, start_time=None,
+                 update_time=None):
+        self.reference = reference
+        self.job_state = job_state
+        self.start_time = start_time
+        self.update_time = update_time
+
+
+class FakeNotification(object):
+    def __init__(self, job_ref):
+        self.type = 'JobStateNotification'
+        self.job = job_ref
+
+
+class FakeJobs(object):
+    """
+    Serves job state notifications and job.get() from a table of job
+    states, counting the jobs fetched
+    """
+
+    def __init__(self):
+        self.job_states = {}
+        self.pending = deque()
+        self.job_calls = 0
+
+    def set_state(self, job_ref, job_state):
+        self.job_states[job_ref] = job_state
+        self.pending.append(FakeNotification(job_ref))
+
+    def get_notifications(self, engine, timeout, channel):
+        notifications = list(self.pending)
+        self.pending.clear()
+        return notifications
+
+    def get_job(self, engine, job_ref):
+        self.job_calls += 1
+        return FakeJob(job_ref, self.job_states[job_ref],
+                       '2017-01-01T10:00:00.000Z', '2017-01-01T10:01:30.000Z')
+
+    def start_job(self, engine, job_ref):
+        """
+        Stand-in for an API call that starts job_ref, or no job if job_ref
+        is None
+        """
+        if job_ref is not None:
+            engine.last_job = job_ref
+            self.job_states[job_ref] = 'RUNNING'
+
+
+class JobTrackerTests(unittest.TestCase):
+    """
+    Every submitted job is tracked, and only fetched again after the
+    notification channel reports a change.
+    """
+
+    def setUp(self):
+        self.engine = FakeEngine()
+        self.fake_jobs = FakeJobs()
+        self.completed = []
+        self.tracker = JobTracker(self.engine, self.completed.append,
+                                  JobWatcher(self.engine,
+                                             self.fake_jobs.get_notifications,
+                                             self.fake_jobs.get_job))
+        for num in range(3):
+            self.tracker.submit('env{}'.format(num), self.fake_jobs.start_job,
+                                'JOB-{}'.format(num))
+
+    def test_every_job_on_an_engine_is_tracked(self):
+        self.assertEqual(3, len(self.tracker.running))
+        self.assertEqual(None, self.tracker.add(None, 'no job'))
+
+    def test_call_without_a_job_is_not_tracked(self):
+        #last_job still holds JOB-2 from the last submit.
+        self.tracker.submit('env3', self.fake_jobs.start_job, None)
+        self.assertEqual(['env0', 'env1', 'env2'], sorted(
+            tracked.target for tracked in self.tracker.running))
+
+    def test_unchanged_jobs_are_not_fetched(self):
+        self.assertEqual([], self.tracker.poll())
+        self.assertEqual(3, self.fake_jobs.job_calls)
+        self.assertEqual([], self.tracker.poll())
+        self.assertEqual(3, self.fake_jobs.job_calls)
+
+        self.fake_jobs.set_state('JOB-1', 'COMPLETED')
+        self.fake_jobs.set_state('JOB-2', 'FAILED')
+        self.tracker.wait_for_change(1)
+        ended = self.tracker.poll()
+        self.assertEqual(5, self.fake_jobs.job_calls)
+        self.assertEqual(['env1', 'env2'], sorted(
+            tracked.target for tracked in ended))
+        self.assertEqual(['env2'], [tracked.target for tracked in
+                                    self.tracker.failed()])
+        self.assertEqual(1, len(self.tracker.running))
+
+    def test_callbacks_and_durations(self):
+        job_callbacks = []
+        self.fake_jobs.start_job(self.engine, 'JOB-3')
+        self.tracker.add('JOB-3', 'env3', job_callbacks.append)
+
+        for job_ref in list(self.fake_jobs.job_states):
+            self.fake_jobs.set_state(job_ref, 'COMPLETED')
+        self.assertEqual([], self.tracker.wait(1))
+
+        self.assertEqual(['env3'], [tracked.target for tracked in
+                                    job_callbacks])
+        self.assertEqual(4, len(self.completed))
+        #The engine's start and update times give the duration.
+        self.assertEqual(90, self.completed[0].duration)
+
+    def test_wait_times_out(self):
+        running = self.tracker.wait(0.01, timeout=0.05)
+        self.assertEqual(3, len(running))
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+
+"""
+Unit tests for JobWatcher against a local fake notification channel
+"""
+
+import unittest
+from collections import deque
+from time import sleep
+from time import time
+
+from delphixpy.v1_6_0 import delphix_engine as delphix_engine_v1_6_0
+from delphixpy.v1_6_0 import exceptions as exceptions_v1_6_0
+from delphixpy.v1_6_0 import job_context as job_context_v1_6_0
+from delphixpy.v1_6_0.web import database as database_v1_6_0
+from delphixpy.v1_8_0 import job_context
+from delphixpy.v1_8_0.web import database
+
+from fake_engine import FakeEngineServer
+from lib.GetSession import GetSession
+from lib.JobWatcher import JobWatcher
+
+VERSION = '0.0.0.1'
+
+
+class FakeEngine(object):
+    address = 'fake_engine'
+
+
+class FakeJob(object):
+    def __init__(self, reference, job_state):
+        self.reference = reference
+        self.job_state = job_state
+
+
+class FakeNotification(object):
+    def __init__(self, notify_type, **kwargs):
+        self.type = notify_type
+        self.__dict__.update(kwargs)
+
+
+class FakeNotificationChannel(object):
+    """
+    Serves queued notifications the way the engine's long-poll does, and
+    keeps the job states returned by job.get()
+    """
+
+    def __init__(self):
+        self.pending = deque()
+        self.job_states = {}
+        self.notify_calls = 0
+        self.job_calls = 0
+        self.channels = set()
+
+    def set_state(self, job_ref, job_state):
+        self.job_states[job_ref] = job_state
+        self.pending.append(FakeNotification('JobStateNotification',
+                                             job=job_ref,
+                                             new_state=job_state))
+
+    def get_notifications(self, engine, timeout, channel):
+        self.notify_calls += 1
+        self.channels.add(channel)
+        notifications = list(self.pending)
+        self.pending.clear()
+        return notifications
+
+    def get_job(self, engine, job_ref):
+        self.job_calls += 1
+        return FakeJob(job_ref, self.job_states[job_ref])
+
+
+class JobWatcherTests(unittest.TestCase):
+    """
+    Jobs are only fetched again after the channel reports a change.
+    """
+
+    def setUp(self):
+        self.channel = FakeNotificationChannel()
+        self.watcher = JobWatcher(FakeEngine(),
+                                  self.channel.get_notifications,
+                                  self.channel.get_job)
+        for job_ref in ['JOB-1', 'JOB-2']:
+            self.channel.job_states[job_ref] = 'RUNNING'
+            self.watcher.get(job_ref)
+
+    def test_unchanged_jobs_are_not_fetched(self):
+        self.channel.set_state('JOB-1', 'COMPLETED')
+        self.assertEqual(['JOB-1'], self.watcher.wait_for_change(1))
+        self.assertEqual('COMPLETED', self.watcher.get('JOB-1').job_state)
+        self.assertEqual('RUNNING', self.watcher.get('JOB-2').job_state)
+        self.assertEqual(3, self.channel.job_calls)
+
+    def test_wait_returns_on_first_change(self):
+        self.channel.set_state('JOB-2', 'FAILED')
+        self.watcher.wait_for_change(30)
+        #One call opened the channel, one read the change.
+        self.assertEqual(2, self.channel.notify_calls)
+
+    def test_each_watcher_reads_its_own_channel(self):
+        other = JobWatcher(FakeEngine(), self.channel.get_notifications,
+                           self.channel.get_job)
+        self.assertNotEqual(self.watcher.channel, other.channel)
+        self.channel.channels.clear()
+        self.watcher.wait_for_change(0.01)
+        self.assertEqual(set([self.watcher.channel]), self.channel.channels)
+
+    def test_unwatched_jobs_are_ignored(self):
+        self.channel.job_states['JOB-3'] = 'RUNNING'
+        self.channel.set_state('JOB-3', 'COMPLETED')
+        self.assertEqual([], self.watcher.wait_for_change(0.1))
+
+    def test_drop_notification_resyncs(self):
+        self.channel.pending.append(FakeNotification('NotificationDrop'))
+        self.assertEqual(set(['JOB-1', 'JOB-2']),
+                         set(self.watcher.wait_for_change(1)))
+        self.watcher.get('JOB-1')
+        self.watcher.get('JOB-2')
+        self.assertEqual(4, self.channel.job_calls)
+
+
+class FakeEngineChannelTests(unittest.TestCase):
+    """
+    A job that ends before the first wait is still reported by the channel.
+    """
+
+    def setUp(self):
+        server = FakeEngineServer(port=0, job_duration=0.1, groups=1,
+                                  dsources=1, vdbs=0, snapshots=0,
+                                  bookmarks=0)
+        server.start()
+        self.addCleanup(server.stop)
+        self.server = server
+        self.engine = GetSession().serversess(server.address,
+                                              'delphix_admin', 'delphix')
+
+    def test_job_ending_before_first_wait(self):
+        job_watcher = JobWatcher(self.engine)
+        self.engine.job_contexts.append((job_context.JobMode.ASYNC, []))
+        db_ref = database.get_all(self.engine)[0].reference
+        database.sync(self.engine, db_ref)
+        job_ref = self.engine.last_job
+        self.assertEqual('RUNNING', job_watcher.get(job_ref).job_state)
+
+        sleep(0.5)
+        start = time()
+        self.assertEqual([job_ref], job_watcher.wait_for_change(5))
+        self.assertLess(time() - start, 1)
+        self.assertEqual('COMPLETED', job_watcher.get(job_ref).job_state)
+
+
+    def test_v1_6_0_session(self):
+        engine = delphix_engine_v1_6_0.DelphixEngine(
+            self.server.address, 'delphix_admin', 'delphix', 'DOMAIN')
+        job_watcher = JobWatcher(engine)
+        self.assertEqual((exceptions_v1_6_0.HttpError,
+                          exceptions_v1_6_0.RequestError),
+                         job_watcher.api_errors)
+        engine.job_contexts.append((job_context_v1_6_0.JobMode.ASYNC, []))
+        db_ref = database_v1_6_0.get_all(engine)[0].reference
+        database_v1_6_0.sync(engine, db_ref)
+        job_ref = engine.last_job
+        self.assertEqual('RUNNING', job_watcher.get(job_ref).job_state)
+
+        self.assertEqual([job_ref], job_watcher.wait_for_change(5))
+        self.assertEqual('COMPLETED', job_watcher.get(job_ref).job_state)
+
+
+# Run the test case
+if __name__ == '__main__':
+    unittest.main(module=__name__, buffer=True)